@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Zotero Upload Benchmark
+Drives ResearchFileManager.add_to_zotero and the workflow scripts'
+upload_to_zotero against the local Zotero stand-in and reports throughput
+(items/sec) and p50/p99 latency from queuing to finished upload.
+"""
+
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from zotero_standin import ZoteroStandIn
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_MODULES = ['research_workflow_automation', 'enhanced_research_workflow',
+                  'intelligent_research_workflow']
+
+# Course context the enhanced and intelligent scripts attach to each file
+BENCHMARK_COURSE = {
+    'course_name': 'EDSP 554',
+    'course_title': 'Autism: Evidence Based Intervention',
+    'collection_key': 'BENCH001',
+    'collection_name': 'EDSP 554',
+    'confidence': 'high',
+    'score': 20,
+    'matched_keywords': ['autism', 'intervention']
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def create_sample_files(directory: Path, count: int, size: int) -> List[Path]:
+    """Write count files of random content to upload."""
+    files = []
+    for number in range(count):
+        file_path = directory / f"benchmark_{number:05d}.pdf"
+        file_path.write_bytes(os.urandom(size))
+        files.append(file_path)
+    return files
+
+
+def bench_manager(base_config: Dict, api_base: str, files: List[Path], work_dir: Path) -> Dict:
+    """Upload through ResearchFileManager.add_to_zotero (spool + batching)."""
+    from research_file_manager import ResearchFileManager
+
+    config = dict(base_config)
+    config['research_base_dir'] = str(work_dir / 'library')
+    config['source_directories'] = []
+    config['catalog'] = {**config.get('catalog', {}), 'db_path': str(work_dir / 'catalog.db')}
+    config['zotero'] = {**config.get('zotero', {}), 'library_id': '1', 'api_key': 'benchmark',
+                        'library_type': 'user', 'api_base': api_base, 'drain_timeout': 600}
+    config_path = work_dir / 'manager_config.json'
+    config_path.write_text(json.dumps(config, indent=2))
+
+    manager = ResearchFileManager(str(config_path))
+    started = time.perf_counter()
+    with manager.zotero_batch():
+        for file_path in files:
+            manager.add_to_zotero(file_path, {'title': file_path.stem, 'author': 'Benchmark'})
+    manager.finish_zotero_uploads()
+    elapsed = time.perf_counter() - started
+
+    latencies = list(manager.zotero_batcher.latencies)
+    manager.catalog.close()
+    return {'target': 'add_to_zotero', 'elapsed': elapsed, 'latencies': latencies}
+
+
+def bench_script(module_name: str, api_base: str, files: List[Path], work_dir: Path) -> Dict:
+    """Upload through one workflow script's upload_to_zotero (spool + pooled transport)."""
+    module = importlib.import_module(module_name)
+    import zotero_spool
+
+    config = {'zotero': {'enabled': True, 'library_id': '1', 'api_key': 'benchmark',
+                         'library_type': 'user', 'api_base': api_base, 'drain_timeout': 600,
+                         'spool_dir': str(work_dir / f"spool_{module_name}")}}
+    zotero_spool.upload_latencies.clear()
+
+    if module_name == 'research_workflow_automation':
+        # This script reads its config itself
+        module.load_config = lambda: config
+
+    # The scripts print a line per file; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for file_path in files:
+            if module_name == 'research_workflow_automation':
+                module.upload_to_zotero(str(file_path), {'filename': file_path.name,
+                                                         'extension': 'pdf'})
+            else:
+                module.upload_to_zotero(str(file_path), config, BENCHMARK_COURSE)
+        zotero_spool.wait_for_uploads(config)
+        elapsed = time.perf_counter() - started
+
+    return {'target': f"{module_name}.upload_to_zotero", 'elapsed': elapsed,
+            'latencies': list(zotero_spool.upload_latencies)}
+
+
+def print_report(result: Dict, item_count: int, stats: Dict):
+    """Print one benchmark result line."""
+    latencies = result['latencies']
+    print(f"{result['target']:<55} {len(latencies):>5}/{item_count} items  "
+          f"{len(latencies) / result['elapsed']:>8.1f} items/s  "
+          f"p50 {percentile(latencies, 0.50) * 1000:>8.1f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:>8.1f} ms  "
+          f"requests {stats['requests']}, 429s {stats['rate_limited']}, "
+          f"failures {stats['failed']}")
+
+
+def main():
+    """Run the benchmark."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark Zotero uploads against a local stand-in')
+    parser.add_argument('--items', type=int, default=100, help='Number of files to upload per target')
+    parser.add_argument('--size', type=int, default=64 * 1024, help='Size of each file in bytes')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency in seconds')
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help='Answer every Nth request with 429 (0 = never)')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After sent with 429s')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests failing with 500')
+    parser.add_argument('--target', choices=['all', 'manager', 'scripts'], default='all',
+                        help='Which upload paths to benchmark')
+    parser.add_argument('--config', default=str(Path(__file__).with_name('config.json')),
+                        help='Base configuration for the research file manager')
+    parser.add_argument('--scripts-dir', default='~/Documents/Research',
+                        help='Directory containing the workflow scripts')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    sys.path.insert(0, str(Path(args.scripts_dir).expanduser()))
+
+    with open(args.config, 'r') as f:
+        base_config = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix='zotero_benchmark_') as temp_dir:
+        work_dir = Path(temp_dir)
+        files = create_sample_files(work_dir, args.items, args.size)
+        print(f"Uploading {args.items} files of {args.size} bytes, latency {args.latency * 1000:.0f} ms"
+              f"{f', 429 every {args.rate_limit_every} requests' if args.rate_limit_every else ''}"
+              f"{f', failure rate {args.failure_rate:.1%}' if args.failure_rate else ''}")
+
+        targets = []
+        if args.target in ('all', 'manager'):
+            targets.append(('manager', None))
+        if args.target in ('all', 'scripts'):
+            targets.extend(('script', name) for name in SCRIPT_MODULES)
+
+        for kind, module_name in targets:
+            # A fresh stand-in per target keeps the request counts separate
+            standin = ZoteroStandIn(latency=args.latency, jitter=args.jitter,
+                                    rate_limit_every=args.rate_limit_every,
+                                    retry_after=args.retry_after,
+                                    failure_rate=args.failure_rate, seed=0)
+            api_base = standin.start()
+            try:
+                if kind == 'manager':
+                    result = bench_manager(base_config, api_base, files, work_dir)
+                else:
+                    result = bench_script(module_name, api_base, files, work_dir)
+            finally:
+                standin.stop()
+            print_report(result, args.items, standin.stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Calibre Library - read-only view of Calibre's metadata.db
+
+Loads title, author and ISBN indexes from the library database once, so
+the file manager can tell whether a book is already in Calibre without
+starting calibredb. The database is opened read-only and never written;
+calibredb stays the only writer.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_title(title: str) -> str:
+    """Lowercase a title and reduce it to words, e.g. "The  Book: 2nd Ed." -> "the book 2nd ed"."""
+    return ' '.join(re.findall(r'\w+', str(title).casefold()))
+
+
+def author_key(author: str) -> frozenset:
+    """Words of an author name, so "Smith, John" and "John Smith" match."""
+    return frozenset(re.findall(r'\w+', str(author).casefold()))
+
+
+def split_authors(authors: str) -> List[str]:
+    """Split an author field such as "A & B" or "A; B and C" into names."""
+    return [name.strip() for name in re.split(r'\s*(?:&|;|\band\b)\s*', str(authors)) if name.strip()]
+
+
+def normalize_isbn(isbn: str) -> Optional[str]:
+    """Reduce an ISBN to its 13-digit form, or None if it is not one."""
+    digits = re.sub(r'[^0-9Xx]', '', str(isbn)).upper()
+    if len(digits) == 10:
+        # ISBN-10 -> ISBN-13: prefix 978 and recompute the check digit
+        core = '978' + digits[:9]
+        total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(core))
+        return core + str((10 - total % 10) % 10)
+    if len(digits) == 13 and digits.isdigit():
+        return digits
+    return None
+
+
+class CalibreLibrary:
+    """In-memory title, author and ISBN indexes over a Calibre metadata.db."""
+
+    BOOKS_QUERY = """
+        SELECT books.id, books.title, books.path, books.isbn,
+               GROUP_CONCAT(authors.name, ' & ')
+        FROM books
+        LEFT JOIN books_authors_link ON books_authors_link.book = books.id
+        LEFT JOIN authors ON authors.id = books_authors_link.author
+        GROUP BY books.id
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path).expanduser()
+        self.books: Dict[int, Dict] = {}
+        self.by_title: Dict[str, List[int]] = {}
+        self.by_isbn: Dict[str, int] = {}
+        self._loaded_stamp = None
+        self._lock = threading.Lock()
+        self.load()
+
+    def _stamp(self):
+        # Calibre writes through a WAL in newer versions, so watch both files
+        stamp = []
+        for suffix in ('', '-wal'):
+            try:
+                stat = os.stat(f"{self.db_path}{suffix}")
+                stamp.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def load(self):
+        """Read all books from metadata.db and rebuild the indexes."""
+        stamp = self._stamp()
+        # mode=ro never creates, locks for writing or modifies the library
+        conn = sqlite3.connect(f"{self.db_path.as_uri()}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(self.BOOKS_QUERY).fetchall()
+            identifiers = conn.execute(
+                "SELECT book, val FROM identifiers WHERE type = 'isbn'"
+            ).fetchall()
+        finally:
+            conn.close()
+
+        books, by_title, by_isbn = {}, {}, {}
+        for book_id, title, path, isbn, authors in rows:
+            books[book_id] = {
+                'id': book_id,
+                'title': title,
+                'authors': authors or '',
+                'path': str(self.db_path.parent / path) if path else None,
+                'isbn': normalize_isbn(isbn) if isbn else None
+            }
+            by_title.setdefault(normalize_title(title), []).append(book_id)
+            if books[book_id]['isbn']:
+                by_isbn[books[book_id]['isbn']] = book_id
+        for book_id, value in identifiers:
+            isbn = normalize_isbn(value)
+            if isbn and book_id in books:
+                books[book_id]['isbn'] = isbn
+                by_isbn[isbn] = book_id
+
+        with self._lock:
+            self.books, self.by_title, self.by_isbn = books, by_title, by_isbn
+            self._loaded_stamp = stamp
+        logger.info(f"Loaded {len(books)} books from Calibre library {self.db_path}")
+
+    def refresh(self):
+        """Reload the indexes if calibredb has changed the database since the last load."""
+        if self._stamp() != self._loaded_stamp:
+            self.load()
+
+    def find_by_isbn(self, isbn: str) -> Optional[Dict]:
+        """Return the book with this ISBN (10 or 13 digits), if any."""
+        self.refresh()
+        key = normalize_isbn(isbn)
+        book_id = self.by_isbn.get(key) if key else None
+        return self.books.get(book_id) if book_id else None
+
+    def find_by_title(self, title: str, author: Optional[str] = None) -> List[Dict]:
+        """Return books with this title, narrowed to those sharing an author if one is given."""
+        self.refresh()
+        books = [self.books[book_id] for book_id in self.by_title.get(normalize_title(title), [])]
+        wanted = {author_key(name) for name in split_authors(author)} if author else set()
+        wanted.discard(frozenset())
+        if not wanted:
+            return books
+        return [book for book in books
+                if wanted & {author_key(name) for name in split_authors(book['authors'])}]
+
+    def find_book(self, metadata: Dict) -> Optional[Dict]:
+        """Find the Calibre book matching extracted metadata: by ISBN, else title and author."""
+        if metadata.get('isbn'):
+            book = self.find_by_isbn(metadata['isbn'])
+            if book:
+                return book
+
+        title = metadata.get('title')
+        if not title or title == 'Unknown Title':
+            return None
+        author = metadata.get('author')
+        if author == 'Unknown Author':
+            author = None
+        matches = self.find_by_title(title, author)
+        return matches[0] if matches else None
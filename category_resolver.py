@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Category Resolver - maps files to research categories
+
+The extension table is built once from config['categories']. Extensions
+listed under several categories (pdf is a paper, a book, a report or a
+presentation) are decided from metadata that extraction already produced:
+page count, first-page text, title, subject and the creating application.
+Nothing is read from the file itself.
+"""
+
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Clues in the extracted text fields, per category. Each matching clue adds
+# a point; the candidate with most points wins, and ties go to the category
+# listed first in the config.
+TEXT_SIGNALS = {
+    'papers': [
+        r'\babstract\b', r'\bkeywords?\s*:', r'\bdoi\s*:?\s*10\.\d{4,}', r'\bjournal\b',
+        r'\bvol(?:ume)?\.?\s*\d+', r'\bissn\b', r'\bproceedings\b', r'\barxiv\b',
+        r'\bet al\.', r'\breferences\b', r'\bpeer[- ]reviewed\b', r'\bpreprint\b'
+    ],
+    'books': [
+        r'\bisbn(?:-1[03])?\b', r'\bchapter\s+\d+', r'\b(?:first|second|third|\d+(?:st|nd|rd|th))\s+edition\b',
+        r'\ball rights reserved\b', r'\bpublishers?\b', r'\btable of contents\b', r'\bforeword\b',
+        r'\buniversity press\b'
+    ],
+    'reports': [
+        r'\breport\b', r'\bwhite\s*paper\b', r'\bworking paper\b', r'\bpolicy brief\b',
+        r'\bexecutive summary\b', r'\bprepared (?:for|by)\b', r'\bevaluation\b',
+        r'\bdepartment of\b', r'\bministry\b', r'\bguidelines?\b', r'\bfindings\b'
+    ],
+    'presentations': [
+        r'\bslides?\b', r'\bpresentation\b', r'\bwebinar\b', r'\bworkshop\b', r'\blecture\b'
+    ]
+}
+
+# Clues in the creating application (PDF Creator/Producer)
+PRODUCER_SIGNALS = {
+    'presentations': [r'powerpoint', r'keynote', r'impress', r'beamer', r'google slides'],
+    'books': [r'indesign', r'calibre', r'quarkxpress', r'framemaker'],
+    'papers': [r'\blatex\b', r'pdftex', r'xetex', r'luatex', r'arbortext', r'elsevier', r'springer']
+}
+
+# Metadata fields searched for text clues, and for application clues
+TEXT_FIELDS = ('title', 'subject', 'keywords', 'first_page_text', 'text_content')
+PRODUCER_FIELDS = ('creator', 'producer')
+
+# Page counts typical of each category: (minimum, maximum, points)
+PAGE_SIGNALS = {
+    'books': (150, None, 2),
+    'papers': (4, 40, 1),
+    'reports': (10, 120, 1)
+}
+
+
+def _compile(signals: Dict[str, List[str]]) -> Dict[str, List]:
+    return {category: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+            for category, patterns in signals.items()}
+
+
+class CategoryResolver:
+    """Extension -> category table compiled from the config, with metadata-based tie-breaking."""
+
+    def __init__(self, categories: Dict[str, List[str]], default: str = 'unsorted'):
+        self.default = default
+        self.candidates: Dict[str, Tuple[str, ...]] = {}
+        for category, extensions in categories.items():
+            for extension in extensions or []:
+                extension = extension.lower().lstrip('.')
+                if category not in self.candidates.get(extension, ()):
+                    self.candidates[extension] = self.candidates.get(extension, ()) + (category,)
+        self.text_signals = _compile(TEXT_SIGNALS)
+        self.producer_signals = _compile(PRODUCER_SIGNALS)
+
+    def is_ambiguous(self, extension: str) -> bool:
+        """Whether files with this extension can belong to more than one category."""
+        return len(self.candidates.get(extension.lower().lstrip('.'), ())) > 1
+
+    def scores(self, candidates: Tuple[str, ...], metadata: Dict) -> Dict[str, int]:
+        """Points per candidate category from already extracted metadata."""
+        text = _joined(metadata, TEXT_FIELDS)
+        producer = _joined(metadata, PRODUCER_FIELDS)
+        pages = metadata.get('page_count')
+
+        points = {}
+        for category in candidates:
+            score = 0
+            if text:
+                score += sum(1 for pattern in self.text_signals.get(category, ())
+                             if pattern.search(text))
+            if producer:
+                score += 3 * sum(1 for pattern in self.producer_signals.get(category, ())
+                                 if pattern.search(producer))
+            if isinstance(pages, int) and category in PAGE_SIGNALS:
+                minimum, maximum, page_points = PAGE_SIGNALS[category]
+                if pages >= minimum and (maximum is None or pages <= maximum):
+                    score += page_points
+            points[category] = score
+        return points
+
+    def resolve(self, extension: str, metadata: Optional[Dict] = None) -> str:
+        """Category for a file with this extension and (optionally) its extracted metadata."""
+        candidates = self.candidates.get(extension.lower().lstrip('.'))
+        if not candidates:
+            return self.default
+        if len(candidates) == 1 or not metadata:
+            return candidates[0]
+
+        points = self.scores(candidates, metadata)
+        best = max(candidates, key=lambda category: points[category])
+        return best if points[best] else candidates[0]
+
+    def resolve_batch(self, records: Iterable[Dict]) -> List[str]:
+        """Categories for many metadata records at once, in order.
+
+        Each record needs an 'extension' (as extract_metadata stores it) or a
+        'filename'. Records with unambiguous extensions are looked up without
+        scoring.
+        """
+        categories = []
+        for record in records:
+            extension = record.get('extension') or os.path.splitext(record.get('filename', ''))[1]
+            candidates = self.candidates.get(extension.lower().lstrip('.'))
+            if not candidates:
+                categories.append(self.default)
+            elif len(candidates) == 1:
+                categories.append(candidates[0])
+            else:
+                categories.append(self.resolve(extension, record))
+        return categories
+
+
+def _joined(metadata: Dict, fields: Tuple[str, ...]) -> str:
+    """The text of several metadata fields as one string; lists are joined."""
+    parts = []
+    for field in fields:
+        value = metadata.get(field)
+        if isinstance(value, (list, tuple)):
+            parts.extend(str(item) for item in value)
+        elif value:
+            parts.append(str(value))
+    return '\n'.join(parts)
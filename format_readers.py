@@ -0,0 +1 @@
+~/Documents/Research/format_readers.py
\ No newline at end of file
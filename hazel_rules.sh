@@ -84,6 +84,27 @@ extract_docx_metadata() {
     fi
 }
 
+# Extract EPUB metadata from the OPF package document, in ebook-meta's
+# "Key : value" layout, without starting Calibre
+extract_epub_metadata() {
+    local file_path="$1"
+    local metadata_file="$2"
+    
+    PYTHONPATH="$RESEARCH_BASE_DIR" python3 - "$file_path" > "$metadata_file" 2>/dev/null <<'PYTHON'
+import sys
+from format_readers import read_epub_metadata
+labels = {'title': 'Title', 'author': 'Author(s)', 'publisher': 'Publisher', 'language': 'Languages',
+          'tags': 'Tags', 'series': 'Series', 'year': 'Published', 'isbn': 'Identifiers'}
+metadata = read_epub_metadata(sys.argv[1])
+if not metadata:
+    sys.exit(1)
+for key, label in labels.items():
+    if key in metadata:
+        value = f"isbn:{metadata[key]}" if key == 'isbn' else metadata[key]
+        print(f"{label:<20}: {value}")
+PYTHON
+}
+
 # Generate standardized filename
 generate_filename() {
     local file_path="$1"
@@ -138,17 +159,20 @@ process_file() {
                 extract_docx_metadata "$destination_path"
                 ;;
             epub|mobi|azw3)
-                # Extract e-book metadata using Calibre's ebook-meta tool
-                if [ -f "/Applications/calibre.app/Contents/MacOS/ebook-meta" ]; then
-                    local metadata_file="${destination_path%.*}.metadata.txt"
+                # EPUB metadata is read straight from the package document;
+                # other e-books go through Calibre's ebook-meta tool
+                local metadata_file="${destination_path%.*}.metadata.txt"
+                if [ "${filename##*.}" = "epub" ] && extract_epub_metadata "$destination_path" "$metadata_file"; then
+                    log_message "Extracted e-book metadata: $metadata_file"
+                elif [ -f "/Applications/calibre.app/Contents/MacOS/ebook-meta" ]; then
                     "/Applications/calibre.app/Contents/MacOS/ebook-meta" "$destination_path" > "$metadata_file" 2>/dev/null
                     log_message "Extracted e-book metadata: $metadata_file"
-                    
-                    # Add to Calibre library if configured
-                    if [ -f "/Applications/calibre.app/Contents/MacOS/calibredb" ]; then
-                        "/Applications/calibre.app/Contents/MacOS/calibredb" add --library-path "$HOME/Calibre Library" "$destination_path" >/dev/null 2>&1
-                        log_message "Added e-book to Calibre library"
-                    fi
+                fi
+                
+                # Add to Calibre library if configured
+                if [ -f "/Applications/calibre.app/Contents/MacOS/calibredb" ]; then
+                    "/Applications/calibre.app/Contents/MacOS/calibredb" add --library-path "$HOME/Calibre Library" "$destination_path" >/dev/null 2>&1
+                    log_message "Added e-book to Calibre library"
                 fi
                 ;;
             rtf|rtfd|doc|docx)
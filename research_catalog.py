@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+"""
+Research Catalog - SQLite index of the research library
+
+Keeps a single database under the research base directory so the file
+manager can answer questions about the library (such as "have we seen
+this content before?") without opening every file.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Read files in 1 MB chunks so hashing never loads a whole file into memory
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: Path, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """Compute the SHA-256 of a file by streaming it from disk."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def metadata_year(metadata: Dict) -> Optional[int]:
+    """Find the publication year in extracted metadata, falling back to creation dates."""
+    for key in ('year', 'published', 'creation_date', 'created', 'capture_date'):
+        value = metadata.get(key)
+        if not value:
+            continue
+        if isinstance(value, datetime):
+            return value.year
+        # Handles "2023", "2023-05-01", "D:20230501120000Z" and the like
+        match = re.search(r'(?<!\d)(1[5-9]\d{2}|20\d{2})', str(value))
+        if match:
+            return int(match.group(1))
+    return None
+
+
+class ResearchCatalog:
+    """SQLite catalog of the organized research library."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS content_hashes (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            sha256 TEXT,
+            added_at TEXT NOT NULL,
+            mtime_ns INTEGER,
+            source TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_content_hashes_size ON content_hashes(size);
+        CREATE INDEX IF NOT EXISTS idx_content_hashes_sha256 ON content_hashes(sha256);
+
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            category TEXT,
+            title TEXT,
+            author TEXT,
+            year INTEGER,
+            extension TEXT,
+            size INTEGER,
+            sha256 TEXT,
+            metadata TEXT NOT NULL,
+            recorded_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_files_category ON files(category);
+        CREATE INDEX IF NOT EXISTS idx_files_author ON files(author COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_files_year ON files(year);
+        CREATE INDEX IF NOT EXISTS idx_files_extension ON files(extension);
+        CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files(sha256);
+
+        CREATE TABLE IF NOT EXISTS scispace_exports (
+            path TEXT PRIMARY KEY,
+            category TEXT,
+            title TEXT,
+            author TEXT,
+            year INTEGER,
+            extension TEXT,
+            size INTEGER,
+            sha256 TEXT,
+            metadata TEXT NOT NULL,
+            recorded_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_scispace_exports_category ON scispace_exports(category);
+        CREATE INDEX IF NOT EXISTS idx_scispace_exports_author ON scispace_exports(author COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_scispace_exports_year ON scispace_exports(year);
+        CREATE INDEX IF NOT EXISTS idx_scispace_exports_extension ON scispace_exports(extension);
+        CREATE INDEX IF NOT EXISTS idx_scispace_exports_sha256 ON scispace_exports(sha256);
+
+        CREATE TABLE IF NOT EXISTS scan_manifest (
+            directory TEXT NOT NULL,
+            name TEXT NOT NULL,
+            inode INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            PRIMARY KEY (directory, name)
+        );
+
+        CREATE TABLE IF NOT EXISTS zotero_spool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT NOT NULL,
+            item_data TEXT NOT NULL,
+            item_key TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            queued_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_zotero_spool_next_attempt ON zotero_spool(next_attempt_at);
+
+        CREATE TABLE IF NOT EXISTS bibtex_entries (
+            source_path TEXT NOT NULL,
+            citation_key TEXT NOT NULL,
+            entry_type TEXT,
+            doi TEXT,
+            title TEXT,
+            year INTEGER,
+            PRIMARY KEY (source_path, citation_key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_bibtex_entries_key ON bibtex_entries(citation_key);
+        CREATE INDEX IF NOT EXISTS idx_bibtex_entries_doi ON bibtex_entries(doi COLLATE NOCASE);
+    """
+
+    # BibTeX entries are written in transactions of this many rows
+    BIBTEX_BATCH_SIZE = 1000
+
+    # Metadata record kinds and the table each one is stored in
+    RECORD_TABLES = {
+        'files': 'files',
+        'scispace': 'scispace_exports'
+    }
+
+    def __init__(self, db_path: Path):
+        """Open (and create if needed) the catalog database."""
+        self.db_path = Path(db_path).expanduser()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Watch mode workers share one connection, so serialize access to it
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock, self.conn:
+            self.conn.executescript(self.SCHEMA)
+            self._add_missing_columns()
+        logger.info(f"Opened research catalog: {self.db_path}")
+
+    def _add_missing_columns(self):
+        # Catalogs created before mtime_ns and source were tracked
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(content_hashes)")}
+        for column in ('mtime_ns INTEGER', 'source TEXT'):
+            if column.split()[0] not in columns:
+                self.conn.execute(f"ALTER TABLE content_hashes ADD COLUMN {column}")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_content_hashes_source ON content_hashes(source)"
+        )
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self.conn.close()
+
+    def has_size(self, size: int) -> bool:
+        """Check whether any catalogued file has exactly this size."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM content_hashes WHERE size = ? LIMIT 1", (size,)
+            ).fetchone()
+        return row is not None
+
+    def find_duplicate(self, file_path: Path, size: int) -> Tuple[Optional[str], Optional[str]]:
+        """Look for catalogued content identical to a file.
+
+        Returns (path of the existing copy, SHA-256 of the file). The file is
+        only hashed when a catalogued file has the same size, and catalogued
+        files are hashed lazily the first time a same-size file shows up, so
+        the common case of new content costs a single indexed lookup. A
+        stored hash is only trusted while the library file keeps the size
+        and mtime it was hashed at; a copy edited or replaced in place is
+        hashed again.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT path, sha256, mtime_ns FROM content_hashes WHERE size = ?", (size,)
+            ).fetchall()
+
+        source = str(file_path)
+        candidates = [row for row in rows if row['path'] != source]
+        if not candidates:
+            return None, None
+
+        # The catalogued copy may have been moved, deleted or changed outside
+        # the manager; a stale row must never stand in for the current file
+        live = []
+        for row in candidates:
+            try:
+                stat = os.stat(row['path'])
+            except FileNotFoundError:
+                self.forget(row['path'])
+                continue
+            if stat.st_size != size:
+                with self._lock, self.conn:
+                    self.conn.execute(
+                        "UPDATE content_hashes SET size = ?, mtime_ns = ?, sha256 = NULL "
+                        "WHERE path = ?", (stat.st_size, stat.st_mtime_ns, row['path'])
+                    )
+                continue
+            live.append((row, stat))
+        if not live:
+            return None, None
+
+        sha256 = file_sha256(file_path)
+        for row, stat in live:
+            known_hash = row['sha256']
+            if known_hash is None or row['mtime_ns'] != stat.st_mtime_ns:
+                known_hash = file_sha256(Path(row['path']))
+                with self._lock, self.conn:
+                    self.conn.execute(
+                        "UPDATE content_hashes SET sha256 = ?, mtime_ns = ? WHERE path = ?",
+                        (known_hash, stat.st_mtime_ns, row['path'])
+                    )
+
+            if known_hash == sha256:
+                return row['path'], sha256
+
+        return None, sha256
+
+    def record_content(self, file_path: Path, size: int, sha256: Optional[str] = None,
+                       source: Optional[Path] = None):
+        """Remember the content of a file that is now part of the library.
+
+        source is the file it was copied from, when the original stays in place.
+        """
+        mtime_ns = os.stat(file_path).st_mtime_ns
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO content_hashes (path, size, sha256, added_at, mtime_ns, "
+                "source) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(file_path), size, sha256, datetime.now().isoformat(), mtime_ns,
+                 str(source) if source else None)
+            )
+
+    def is_copy_source(self, file_path: Path) -> bool:
+        """Check whether a library file was copied from this file."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM content_hashes WHERE source = ? LIMIT 1", (str(file_path),)
+            ).fetchone()
+        return row is not None
+
+    def forget(self, file_path: str):
+        """Drop a file from the content index."""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM content_hashes WHERE path = ?", (str(file_path),))
+
+    def record_metadata(self, file_path: Path, metadata: Dict, category: Optional[str] = None,
+                        sha256: Optional[str] = None, kind: str = 'files'):
+        """Store the extracted metadata of a file, replacing any earlier record."""
+        table = self.RECORD_TABLES[kind]
+        extension = str(metadata.get('extension') or Path(file_path).suffix).lower().lstrip('.')
+        with self._lock, self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {table} (path, category, title, author, year, extension, "
+                f"size, sha256, metadata, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(file_path),
+                    category,
+                    str(metadata.get('title') or '') or None,
+                    str(metadata.get('author') or '') or None,
+                    metadata_year(metadata),
+                    extension,
+                    metadata.get('size'),
+                    sha256,
+                    json.dumps(metadata, default=str),
+                    datetime.now().isoformat()
+                )
+            )
+
+    def query(self, kind: str = 'files', category: Optional[str] = None,
+              author: Optional[str] = None, year: Optional[int] = None,
+              extension: Optional[str] = None, sha256: Optional[str] = None,
+              path: Optional[str] = None, title: Optional[str] = None,
+              limit: Optional[int] = None) -> List[Dict]:
+        """Find catalogued records; author, path and title match case-insensitive substrings."""
+        conditions = []
+        params = []
+
+        if category:
+            conditions.append("category = ?")
+            params.append(category)
+        if year:
+            conditions.append("year = ?")
+            params.append(int(year))
+        if extension:
+            conditions.append("extension = ?")
+            params.append(extension.lower().lstrip('.'))
+        if sha256:
+            conditions.append("sha256 = ?")
+            params.append(sha256.lower())
+        for column, value in (('author', author), ('path', path), ('title', title)):
+            if value:
+                conditions.append(f"{column} LIKE ?")
+                params.append(f"%{value}%")
+
+        sql = f"SELECT * FROM {self.RECORD_TABLES[kind]}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY year DESC, author, title"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        records = []
+        for row in rows:
+            record = dict(row)
+            record['metadata'] = json.loads(record['metadata'])
+            records.append(record)
+        return records
+
+    def forget_metadata(self, file_path: Path, kind: str = 'files'):
+        """Remove the metadata record of a file."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                f"DELETE FROM {self.RECORD_TABLES[kind]} WHERE path = ?", (str(file_path),)
+            )
+
+    def export_sidecars(self, kind: str = 'files') -> int:
+        """Write a .metadata.json sidecar next to every catalogued file that still exists.
+
+        This is the compatibility export for tools that expect the sidecar files
+        the file manager used to write.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT path, metadata FROM {self.RECORD_TABLES[kind]}"
+            ).fetchall()
+
+        written = 0
+        for row in rows:
+            file_path = Path(row['path'])
+            if not file_path.exists():
+                continue
+            with open(file_path.with_suffix('.metadata.json'), 'w') as f:
+                json.dump(json.loads(row['metadata']), f, indent=2, default=str)
+            written += 1
+
+        logger.info(f"Exported {written} metadata sidecar files")
+        return written
+
+    def load_manifest(self, directory: str) -> Dict[str, Tuple[int, int, int]]:
+        """Return {name: (inode, size, mtime_ns)} for entries seen in an earlier scan."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT name, inode, size, mtime_ns FROM scan_manifest WHERE directory = ?",
+                (directory,)
+            ).fetchall()
+        return {row['name']: (row['inode'], row['size'], row['mtime_ns']) for row in rows}
+
+    def save_manifest(self, directory: str, entries: Dict[str, Tuple[int, int, int]]):
+        """Replace the manifest of a directory; entries that are gone are dropped."""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM scan_manifest WHERE directory = ?", (directory,))
+            self.conn.executemany(
+                "INSERT INTO scan_manifest (directory, name, inode, size, mtime_ns) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(directory, name, *signature) for name, signature in entries.items()]
+            )
+
+    def index_bibtex_entries(self, source_path: Path, entries: Iterable[Dict]) -> int:
+        """Replace the indexed entries of a .bib file with entries from an iterator.
+
+        Entries are consumed and written in batches, so a library of any size
+        is indexed with one batch in memory.
+        """
+        source = str(source_path)
+        count = 0
+        batch = []
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM bibtex_entries WHERE source_path = ?", (source,))
+            for entry in entries:
+                if not entry.get('ID'):
+                    continue
+                batch.append((
+                    source,
+                    entry['ID'],
+                    entry.get('ENTRYTYPE'),
+                    entry.get('doi') or None,
+                    entry.get('title') or None,
+                    metadata_year({'year': entry.get('year')})
+                ))
+                if len(batch) >= self.BIBTEX_BATCH_SIZE:
+                    self._insert_bibtex_batch(batch)
+                    count += len(batch)
+                    batch = []
+            self._insert_bibtex_batch(batch)
+            count += len(batch)
+        return count
+
+    def _insert_bibtex_batch(self, batch: List[Tuple]):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO bibtex_entries (source_path, citation_key, entry_type, "
+            "doi, title, year) VALUES (?, ?, ?, ?, ?, ?)", batch
+        )
+
+    def find_bibtex_entries(self, citation_key: Optional[str] = None, doi: Optional[str] = None,
+                            title: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Find indexed BibTeX entries; title matches a case-insensitive substring."""
+        conditions = []
+        params = []
+        if citation_key:
+            conditions.append("citation_key = ?")
+            params.append(citation_key)
+        if doi:
+            conditions.append("doi = ? COLLATE NOCASE")
+            params.append(doi)
+        if title:
+            conditions.append("title LIKE ?")
+            params.append(f"%{title}%")
+
+        sql = "SELECT * FROM bibtex_entries"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY year DESC, citation_key"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def enqueue_zotero_item(self, file_path: Path, item_data: Dict) -> int:
+        """Spool a Zotero item (and the file to attach to it) for upload."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO zotero_spool (file_path, item_data, next_attempt_at, queued_at) "
+                "VALUES (?, ?, ?, ?)",
+                (str(file_path), json.dumps(item_data), time.time(), datetime.now().isoformat())
+            )
+        return cursor.lastrowid
+
+    def ready_zotero_jobs(self, limit: int) -> List[Dict]:
+        """Return up to limit spooled uploads that are due, oldest first."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM zotero_spool WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job['item_data'] = json.loads(job['item_data'])
+            jobs.append(job)
+        return jobs
+
+    def count_zotero_jobs(self) -> int:
+        """Count spooled uploads."""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM zotero_spool").fetchone()[0]
+
+    def next_zotero_attempt(self) -> Optional[float]:
+        """Return when the next spooled upload is due, or None if the spool is empty."""
+        with self._lock:
+            return self.conn.execute("SELECT MIN(next_attempt_at) FROM zotero_spool").fetchone()[0]
+
+    def set_zotero_item_key(self, job_id: int, item_key: str):
+        """Remember the created item so a retry only repeats the attachment upload."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE zotero_spool SET item_key = ? WHERE id = ?", (item_key, job_id)
+            )
+
+    def retry_zotero_job(self, job_id: int, delay: float, error: str):
+        """Reschedule a spooled upload after a failed attempt."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE zotero_spool SET attempts = attempts + 1, next_attempt_at = ?, "
+                "last_error = ? WHERE id = ?",
+                (time.time() + delay, error, job_id)
+            )
+
+    def remove_zotero_job(self, job_id: int):
+        """Drop a spooled upload once it is done (or has been given up on)."""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM zotero_spool WHERE id = ?", (job_id,))
+
+
+def _encode_cached_value(value):
+    # Keeps datetimes (e.g. DOCX core properties) round-tripping as datetimes
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    return str(value)
+
+
+def _decode_cached_object(obj: Dict):
+    if set(obj) == {'__datetime__'}:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+class ExtractionCache:
+    """Persistent cache of extracted metadata, keyed by file identity.
+
+    Entries are found by (device, inode, size, mtime_ns), which survives a
+    move within one volume, and otherwise by SHA-256 of the content, which
+    survives copies and touched timestamps. The content lookup only runs when
+    the caller already has the hash (from duplicate detection), unless
+    hash_on_miss is set, since hashing reads the whole file while most
+    extractors read only its header. The least recently used entries are
+    evicted once the cached metadata exceeds max_bytes.
+
+    It keeps its own connection, so extraction worker processes can share
+    the cache with the main process.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS extraction_cache (
+            device INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            sha256 TEXT,
+            metadata TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (device, inode, size, mtime_ns, kind)
+        );
+        CREATE INDEX IF NOT EXISTS idx_extraction_cache_sha256 ON extraction_cache(sha256, kind);
+        CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_used ON extraction_cache(last_used);
+    """
+
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+    # With hash_on_miss, larger files are not hashed just to look them up;
+    # reading them costs more than most extractors do
+    DEFAULT_HASH_MAX_SIZE = 1024 * 1024
+    # Total size is checked every this many stores
+    EVICT_EVERY = 100
+
+    def __init__(self, db_path: Path, max_bytes: int = DEFAULT_MAX_BYTES,
+                 hash_on_miss: bool = False, hash_max_size: int = DEFAULT_HASH_MAX_SIZE):
+        """Open (and create if needed) the cache table."""
+        self.db_path = Path(db_path).expanduser()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hash_on_miss = hash_on_miss
+        self.hash_max_size = hash_max_size
+        self.hits = 0
+        self.misses = 0
+        self._stores = 0
+
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # A lost entry is only re-extracted, so skip the fsync per commit
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self.conn:
+            self.conn.executescript(self.SCHEMA)
+        self.evict()
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self.conn.close()
+
+    def fetch(self, file_path: Path, stat: os.stat_result, kind: str,
+              extract: Callable[[], Dict], sha256: Optional[str] = None) -> Dict:
+        """Return cached metadata of this kind for a file, or extract and cache it.
+
+        A known SHA-256 of the file enables the lookup by content; without
+        one the file is only hashed if hash_on_miss is set.
+        Empty results are not cached, so a failed extraction is retried.
+        """
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, kind)
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT metadata FROM extraction_cache WHERE device = ? AND inode = ? "
+                "AND size = ? AND mtime_ns = ? AND kind = ?", key
+            ).fetchone()
+            if row:
+                self.conn.execute(
+                    "UPDATE extraction_cache SET last_used = ? WHERE device = ? AND inode = ? "
+                    "AND size = ? AND mtime_ns = ? AND kind = ?", (time.time(), *key)
+                )
+        if row:
+            self.hits += 1
+            return json.loads(row['metadata'], object_hook=_decode_cached_object)
+
+        if sha256 is None and self.hash_on_miss and stat.st_size <= self.hash_max_size:
+            sha256 = file_sha256(file_path)
+        if sha256:
+            with self._lock:
+                row = self.conn.execute(
+                    "SELECT metadata FROM extraction_cache WHERE sha256 = ? AND kind = ? "
+                    "ORDER BY last_used DESC LIMIT 1", (sha256, kind)
+                ).fetchone()
+            if row:
+                # Same content under a new identity: store it under that too
+                self.hits += 1
+                self._store(key, sha256, row['metadata'])
+                return json.loads(row['metadata'], object_hook=_decode_cached_object)
+
+        self.misses += 1
+        metadata = extract()
+        if metadata:
+            self._store(key, sha256, json.dumps(metadata, default=_encode_cached_value))
+        return metadata
+
+    def _store(self, key: Tuple, sha256: Optional[str], data: str):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache (device, inode, size, mtime_ns, kind, "
+                "sha256, metadata, bytes, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, sha256, data, len(data), time.time())
+            )
+            self._stores += 1
+        if self._stores % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        with self._lock, self.conn:
+            total = self.conn.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM extraction_cache"
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+
+            excess = total - self.max_bytes
+            dropped = 0
+            rows = self.conn.execute(
+                "SELECT rowid, bytes FROM extraction_cache ORDER BY last_used"
+            )
+            stale = []
+            for row in rows:
+                if dropped >= excess:
+                    break
+                stale.append((row['rowid'],))
+                dropped += row['bytes']
+            self.conn.executemany("DELETE FROM extraction_cache WHERE rowid = ?", stale)
+        logger.info(f"Evicted {len(stale)} extraction cache entries ({dropped} bytes)")
+        return len(stale)
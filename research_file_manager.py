@@ -10,38 +10,96 @@ and integrates with Zotero and Calibre for seamless research management.
 import sys
 import json
 import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import random
+import re
 import shutil
+import sqlite3
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Optional
+from xml.sax.saxutils import escape as xml_escape
 import PyPDF2
-from docx import Document
-import bibtexparser
 from pyzotero import zotero
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import time
+from research_catalog import ExtractionCache, ResearchCatalog
+from tool_runner import run_tool, runner as tool_runner
+from calibre_library import CalibreLibrary
+from category_resolver import CategoryResolver
+from format_readers import (CalibreMetadataWorker, iter_bibtex_entries, iter_pdf_pages,
+                            match_calibre_book_ids, read_docx_paragraphs, read_epub_metadata,
+                            read_image_header, read_mp4_metadata, read_ooxml_core_properties)
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('research_file_manager.log'),
+        logging.FileHandler('research_file_manager.log', delay=True),
         logging.StreamHandler(sys.stdout)
     ]
 )
 logger = logging.getLogger(__name__)
 
+# How much of a PDF extract_pdf_metadata reads; each tier includes the ones below
+PDF_TIER_INFO = 0         # trailer, Info dictionary and XMP only
+PDF_TIER_PAGE_COUNT = 1   # plus the page count from the page tree root
+PDF_TIER_FIRST_PAGE = 2   # plus text from the first page
+
+# Part of every extraction cache key; bump it when an extractor's output changes
+EXTRACTION_CACHE_VERSION = 3
+
 class ResearchFileManager:
     """Main class for managing research files automatically."""
 
-    def __init__(self, config_path: str = "config.json"):
-        """Initialize the research file manager."""
+    def __init__(self, config_path: str = "config.json", integrations: bool = True):
+        """Initialize the research file manager.
+        
+        With integrations disabled only the configuration is loaded, which is
+        all the metadata extraction workers need.
+        """
+        self.config_path = config_path
         self.config = self.load_config(config_path)
-        self.setup_directories()
-        self.zotero_client = self.setup_zotero()
-        self.calibre_db_path = self.config.get('calibre_db_path')
+        tool_runner.configure(self.config.get('tools', {}).get('limits'))
+        self.category_resolver = CategoryResolver(self.config.get('categories', {}))
+        if integrations:
+            self.setup_directories()
+            self.zotero_client = self.setup_zotero()
+            self.catalog = self.setup_catalog()
+        else:
+            self.zotero_client = None
+            self.catalog = None
+        # Extraction workers use the cache too, so it is opened either way
+        self.extraction_cache = self.setup_extraction_cache()
+        self.zotero_batcher = None
+        if self.zotero_client and self.catalog:
+            self.zotero_batcher = ZoteroBatcher(self.zotero_client, self.catalog)
+            self.zotero_batcher.start()
+        elif self.zotero_client:
+            logger.warning("Zotero uploads disabled: the catalog holding the upload spool is unavailable")
+        # Older configs keep the path at the top level
+        self.calibre_db_path = (self.config.get('calibre', {}).get('db_path')
+                                or self.config.get('calibre_db_path'))
+        self.calibre_library = self.setup_calibre_library() if integrations else None
+        self.calibre_batcher = CalibreBatcher(
+            self.config, self.config.get('calibre', {}).get('batch_size', CalibreBatcher.DEFAULT_BATCH_SIZE)
+        )
+        # Started on the first MOBI/AZW3 file, see calibre_metadata_worker
+        self._calibre_worker = None
+        self._calibre_worker_lock = threading.Lock()
+        # Serializes destination naming and the move so concurrent workers
+        # never pick the same free filename
+        self._placement_lock = threading.Lock()
         
     def load_config(self, config_path: str) -> Dict:
         """Load configuration from JSON file."""
@@ -76,7 +134,9 @@ class ResearchFileManager:
             "zotero": {
                 "library_id": "YOUR_LIBRARY_ID",
                 "api_key": "YOUR_API_KEY",
-                "library_type": "user"
+                "library_type": "user",
+                "batch_window": 30,
+                "drain_timeout": 60
             },
             "calibre_db_path": "~/Calibre Library/metadata.db",
             "file_naming": {
@@ -84,15 +144,42 @@ class ResearchFileManager:
                 "use_original_name": False,
                 "add_timestamp": True
             },
+            "extraction_cache": {
+                "enabled": True,
+                "max_mb": 64,
+                "hash_on_miss": False,
+                "hash_max_mb": 1
+            },
+            "tools": {
+                "limits": {"calibredb": 1, "ebook-meta": 2, "pdflatex": 2}
+            },
             "metadata_extraction": {
                 "extract_pdf_metadata": True,
+                "pdf_tier": PDF_TIER_FIRST_PAGE,
                 "extract_docx_metadata": True,
-                "extract_bibtex": True
+                "extract_bibtex": True,
+                "index_bibtex": True
             },
             "auto_organization": {
                 "enabled": True,
                 "move_files": True,
                 "create_backup": True
+            },
+            "deduplication": {
+                "enabled": True,
+                "policy": "keep"
+            },
+            "catalog": {
+                "write_sidecars": False
+            },
+            "watch": {
+                "workers": 4,
+                "queue_size": 256,
+                "enqueue_timeout": 1.0,
+                "stable_interval": 0.5,
+                "stable_checks": 2,
+                "stable_timeout": 300,
+                "summary_interval": 60
             }
         }
         
@@ -127,6 +214,9 @@ class ResearchFileManager:
                     zotero_config['library_type'],
                     zotero_config['api_key']
                 )
+                if zotero_config.get('api_base'):
+                    # e.g. a local stand-in (see zotero_standin.py)
+                    client.endpoint = zotero_config['api_base'].rstrip('/')
                 logger.info("Zotero client initialized successfully")
                 return client
             except Exception as e:
@@ -136,50 +226,149 @@ class ResearchFileManager:
             logger.warning("Zotero credentials not configured")
             return None
     
-    def categorize_file(self, file_path: Path) -> str:
-        """Determine the appropriate category for a file."""
-        extension = file_path.suffix.lower().lstrip('.')
+    def catalog_db_path(self) -> Path:
+        """Path of the SQLite catalog, by default in the research base directory."""
+        base_dir = Path(self.config['research_base_dir']).expanduser()
+        return Path(self.config.get('catalog', {}).get('db_path', base_dir / '.research_catalog.db'))
+    
+    def setup_catalog(self) -> Optional[ResearchCatalog]:
+        """Open the SQLite catalog that lives in the research base directory."""
+        try:
+            return ResearchCatalog(self.catalog_db_path())
+        except Exception as e:
+            logger.error(f"Failed to open research catalog: {e}")
+            return None
+    
+    def setup_extraction_cache(self) -> Optional[ExtractionCache]:
+        """Open the persistent metadata extraction cache (kept in the catalog database)."""
+        cache_config = self.config.get('extraction_cache', {})
+        if not cache_config.get('enabled', True):
+            return None
+        
+        try:
+            return ExtractionCache(
+                cache_config.get('db_path', self.catalog_db_path()),
+                max_bytes=int(cache_config.get('max_mb', 64) * 1024 * 1024),
+                hash_on_miss=cache_config.get('hash_on_miss', False),
+                hash_max_size=int(cache_config.get('hash_max_mb', 1) * 1024 * 1024)
+            )
+        except Exception as e:
+            logger.warning(f"Extraction cache unavailable, extracting without it: {e}")
+            return None
+    
+    def setup_calibre_library(self) -> Optional[CalibreLibrary]:
+        """Load the read-only title, author and ISBN indexes of the Calibre library."""
+        if not self.calibre_db_path or not self.config.get('calibre', {}).get('enabled', False):
+            return None
+        
+        db_path = Path(self.calibre_db_path).expanduser()
+        if not db_path.exists():
+            logger.warning(f"Calibre library database not found at: {db_path}")
+            return None
+        
+        try:
+            return CalibreLibrary(db_path)
+        except Exception as e:
+            logger.error(f"Failed to read Calibre library database: {e}")
+            return None
+    
+    def find_in_calibre(self, metadata: Dict) -> Optional[Dict]:
+        """Look up a book in the Calibre library by ISBN, or title and author."""
+        if not self.calibre_library:
+            return None
         
-        for category, extensions in self.config['categories'].items():
-            if extensions and extension in extensions:
-                return category
+        try:
+            return self.calibre_library.find_book(metadata)
+        except Exception as e:
+            logger.warning(f"Calibre library lookup failed: {e}")
+            return None
+    
+    def categorize_file(self, file_path: Path, metadata: Optional[Dict] = None) -> str:
+        """Determine the appropriate category for a file.
         
-        return 'unsorted'
+        Extensions listed under several categories (such as pdf) are decided
+        from the extracted metadata when it is given, see CategoryResolver.
+        """
+        return self.category_resolver.resolve(file_path.suffix, metadata)
     
-    def extract_metadata(self, file_path: Path) -> Dict:
-        """Extract metadata from various file types."""
+    def extract_metadata(self, file_path: Path, pdf_tier: Optional[int] = None,
+                         content_hash: Optional[str] = None) -> Dict:
+        """Extract metadata from various file types.
+        
+        pdf_tier limits how much of a PDF is read (see extract_pdf_metadata).
+        Format-specific metadata comes from the extraction cache when the file
+        (or identical content, see content_hash) was extracted before.
+        """
+        stat = file_path.stat()
         metadata = {
             'filename': file_path.name,
             'extension': file_path.suffix.lower(),
-            'size': file_path.stat().st_size,
-            'modified': datetime.fromtimestamp(file_path.stat().st_mtime),
+            'size': stat.st_size,
+            'modified': datetime.fromtimestamp(stat.st_mtime),
             'extracted_at': datetime.now()
         }
         
         try:
-            if file_path.suffix.lower() == '.pdf':
-                metadata.update(self.extract_pdf_metadata(file_path))
-            elif file_path.suffix.lower() in ['.docx', '.doc']:
-                metadata.update(self.extract_docx_metadata(file_path))
-            elif file_path.suffix.lower() == '.bib':
-                metadata.update(self.extract_bibtex_metadata(file_path))
-            elif file_path.suffix.lower() in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']:
-                metadata.update(self.extract_image_metadata(file_path))
-            elif file_path.suffix.lower() in ['.mp4', '.mov', '.avi', '.mkv', '.wmv']:
-                metadata.update(self.extract_video_metadata(file_path))
-            elif file_path.suffix.lower() in ['.epub', '.mobi', '.azw3']:
-                metadata.update(self.extract_ebook_metadata(file_path))
+            suffix = file_path.suffix.lower()
+            if suffix == '.pdf':
+                if pdf_tier is None:
+                    pdf_tier = self.default_pdf_tier()
+                kind = f"pdf:{pdf_tier}"
+                extract = lambda: self.extract_pdf_metadata(file_path, pdf_tier)
+            elif suffix in ['.docx', '.doc']:
+                kind, extract = 'docx', lambda: self.extract_docx_metadata(file_path)
+            elif suffix in ['.pptx', '.xlsx']:
+                kind, extract = 'office', lambda: self.extract_office_metadata(file_path)
+            elif suffix == '.bib':
+                kind, extract = 'bibtex', lambda: self.extract_bibtex_metadata(file_path)
+            elif suffix in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.heic']:
+                kind, extract = 'image', lambda: self.extract_image_metadata(file_path)
+            elif suffix in ['.mp4', '.m4v', '.mov', '.m4a', '.avi', '.mkv', '.wmv']:
+                kind, extract = 'video', lambda: self.extract_video_metadata(file_path)
+            elif suffix in ['.epub', '.mobi', '.azw3']:
+                kind, extract = 'ebook', lambda: self.extract_ebook_metadata(file_path)
+            else:
+                return metadata
+            
+            metadata.update(self.cached_extraction(file_path, stat, kind, extract, content_hash))
         except Exception as e:
             logger.warning(f"Failed to extract metadata from {file_path}: {e}")
         
         return metadata
     
-    def extract_pdf_metadata(self, file_path: Path) -> Dict:
-        """Extract metadata from PDF files."""
+    def cached_extraction(self, file_path: Path, stat: os.stat_result, kind: str,
+                          extract, content_hash: Optional[str] = None) -> Dict:
+        """Run an extractor through the extraction cache, if there is one."""
+        if not self.extraction_cache:
+            return extract()
+        
+        try:
+            return self.extraction_cache.fetch(file_path, stat, f"{kind}/v{EXTRACTION_CACHE_VERSION}",
+                                               extract, content_hash)
+        except sqlite3.Error as e:
+            logger.warning(f"Extraction cache lookup failed for {file_path}: {e}")
+            return extract()
+    
+    def default_pdf_tier(self) -> int:
+        """PDF extraction tier from metadata_extraction.pdf_tier in the config."""
+        return self.config.get('metadata_extraction', {}).get('pdf_tier', PDF_TIER_FIRST_PAGE)
+    
+    def extract_pdf_metadata(self, file_path: Path, tier: Optional[int] = None) -> Dict:
+        """Extract metadata from PDF files.
+        
+        Only the cross-reference table and the objects a tier needs are read:
+        PDF_TIER_INFO gives the document information, PDF_TIER_PAGE_COUNT adds
+        page_count and PDF_TIER_FIRST_PAGE adds first_page_text. The default
+        tier comes from metadata_extraction.pdf_tier in the config.
+        """
+        if tier is None:
+            tier = self.default_pdf_tier()
         metadata = {}
         
         try:
             with open(file_path, 'rb') as f:
+                # Parses the trailer and cross-reference table; objects are
+                # read from disk only when looked up
                 pdf_reader = PyPDF2.PdfReader(f)
                 
                 if pdf_reader.metadata:
@@ -191,14 +380,20 @@ class ResearchFileManager:
                         'creator': info.get('/Creator', ''),
                         'producer': info.get('/Producer', ''),
                         'creation_date': info.get('/CreationDate', ''),
-                        'modification_date': info.get('/ModDate', ''),
-                        'page_count': len(pdf_reader.pages)
+                        'modification_date': info.get('/ModDate', '')
                     })
                 
+                if not metadata.get('title') or not metadata.get('author'):
+                    metadata.update({key: value for key, value in pdf_xmp_metadata(pdf_reader).items()
+                                     if not metadata.get(key)})
+                
+                if tier >= PDF_TIER_PAGE_COUNT:
+                    metadata['page_count'] = pdf_page_count(pdf_reader)
+                
                 # Try to extract text from first page for better categorization
-                if len(pdf_reader.pages) > 0:
-                    first_page = pdf_reader.pages[0]
-                    text = first_page.extract_text()
+                if tier >= PDF_TIER_FIRST_PAGE and metadata.get('page_count'):
+                    first_page = pdf_first_page(pdf_reader)
+                    text = first_page.extract_text() if first_page is not None else ''
                     if text:
                         # First 500 chars
                         metadata['first_page_text'] = text[:500]
@@ -209,53 +404,61 @@ class ResearchFileManager:
         return metadata
     
     def extract_docx_metadata(self, file_path: Path) -> Dict:
-        """Extract metadata from DOCX files."""
-        metadata = {}
+        """Extract metadata from DOCX files.
+        
+        Reads the core properties and streams the document body only up to
+        the first 10 non-empty paragraphs, so long documents cost no more
+        than short ones.
+        """
+        metadata = self.extract_office_metadata(file_path)
+        if not metadata:
+            # Not a readable package (e.g. a binary .doc); already logged
+            return metadata
         
         try:
-            doc = Document(file_path)
-            
-            # Extract core properties
-            core_props = doc.core_properties
-            if core_props:
-                metadata.update({
-                    'title': core_props.title or '',
-                    'author': core_props.author or '',
-                    'subject': core_props.subject or '',
-                    'keywords': core_props.keywords or '',
-                    'created': core_props.created,
-                    'modified': core_props.modified,
-                    'revision': core_props.revision
-                })
-            
             # Extract text content for analysis
-            full_text = []
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    full_text.append(paragraph.text.strip())
-            
+            full_text = read_docx_paragraphs(file_path, limit=10)
             if full_text:
-                metadata['text_content'] = '\n'.join(full_text[:10])  # First 10 paragraphs
+                metadata['text_content'] = '\n'.join(full_text)  # First 10 paragraphs
                 
         except Exception as e:
             logger.error(f"Error extracting DOCX metadata from {file_path}: {e}")
         
         return metadata
     
+    def extract_office_metadata(self, file_path: Path) -> Dict:
+        """Extract core properties from Office Open XML files (DOCX, PPTX, XLSX)."""
+        metadata = {}
+        
+        try:
+            core_props = read_ooxml_core_properties(file_path)
+            metadata.update({
+                'title': core_props.get('title', ''),
+                'author': core_props.get('author', ''),
+                'subject': core_props.get('subject', ''),
+                'keywords': core_props.get('keywords', ''),
+                'created': core_props.get('created'),
+                'modified': core_props.get('modified'),
+                'revision': core_props.get('revision', 0)
+            })
+            
+        except Exception as e:
+            logger.error(f"Error extracting Office metadata from {file_path}: {e}")
+        
+        return metadata
+    
     def extract_bibtex_metadata(self, file_path: Path) -> Dict:
-        """Extract metadata from BibTeX files."""
+        """Extract metadata from BibTeX files.
+        
+        Only the first entry is parsed; the rest of the file is not read.
+        """
         metadata = {}
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            # Parse BibTeX content
-            bib_database = bibtexparser.loads(content)
+            # Use first entry as representative
+            entry = next(iter_bibtex_entries(file_path), None)
             
-            if bib_database.entries:
-                # Use first entry as representative
-                entry = bib_database.entries[0]
+            if entry:
                 metadata.update({
                     'entry_type': entry.get('ENTRYTYPE', ''),
                     'citation_key': entry.get('ID', ''),
@@ -274,15 +477,40 @@ class ResearchFileManager:
         
         return metadata
     
+    def index_bibtex_library(self, file_path: Path) -> int:
+        """Store key, DOI, title and year of every entry in a .bib file in the catalog."""
+        if not self.catalog:
+            return 0
+        
+        try:
+            started = time.perf_counter()
+            count = self.catalog.index_bibtex_entries(file_path, iter_bibtex_entries(file_path))
+            logger.info(f"Indexed {count} BibTeX entries from {file_path} "
+                        f"in {time.perf_counter() - started:.2f}s")
+            return count
+        except Exception as e:
+            logger.error(f"Failed to index BibTeX entries from {file_path}: {e}")
+            return 0
+    
     def extract_image_metadata(self, file_path: Path) -> Dict:
-        """Extract metadata from image files."""
+        """Extract metadata from image files.
+        
+        Width, height, DPI, format and capture date come from the file headers
+        (see format_readers.read_image_header). The macOS sips command is only
+        used for formats the header reader does not know.
+        """
         metadata = {}
         
         try:
+            metadata.update(read_image_header(file_path))
+            if metadata:
+                return metadata
+            
+            if not shutil.which('sips'):
+                return metadata
+            
             # Use macOS built-in sips command for image metadata
-            import subprocess
-            result = subprocess.run(['sips', '-g', 'all', str(file_path)], 
-                                 capture_output=True, text=True, timeout=10)
+            result = run_tool(['sips', '-g', 'all', str(file_path)], timeout=10)
             
             if result.returncode == 0:
                 output = result.stdout
@@ -306,15 +534,29 @@ class ResearchFileManager:
         return metadata
     
     def extract_video_metadata(self, file_path: Path) -> Dict:
-        """Extract metadata from video files."""
+        """Extract metadata from video files.
+        
+        MP4, MOV and M4A files are read natively from their moov box; ffprobe
+        is used for other containers, or when the box cannot be read.
+        """
         metadata = {}
         
         try:
+            if file_path.suffix.lower() in ['.mp4', '.m4v', '.mov', '.m4a']:
+                try:
+                    metadata.update(read_mp4_metadata(file_path))
+                except Exception as e:
+                    logger.debug(f"Could not read MP4 boxes of {file_path}, trying ffprobe: {e}")
+                if metadata:
+                    return metadata
+            
+            if not shutil.which('ffprobe'):
+                logger.warning(f"ffprobe not found, no video metadata for {file_path}")
+                return metadata
+            
             # Try to use ffprobe if available
-            import subprocess
-            result = subprocess.run(['ffprobe', '-v', 'quiet', '-print_format', 'json',
-                                   '-show_format', '-show_streams', str(file_path)], 
-                                 capture_output=True, text=True, timeout=15)
+            result = run_tool(['ffprobe', '-v', 'quiet', '-print_format', 'json',
+                               '-show_format', '-show_streams', str(file_path)], timeout=15)
             
             if result.returncode == 0:
                 import json
@@ -403,14 +645,35 @@ class ResearchFileManager:
         
         return filename
     
-    def organize_file(self, source_path: Path) -> bool:
-        """Organize a single file into the appropriate research directory."""
+    def organize_file(self, source_path: Path, metadata: Optional[Dict] = None) -> bool:
+        """Organize a single file into the appropriate research directory.
+        
+        Metadata that was already extracted (e.g. by a worker process) can be
+        passed in to skip extraction here.
+        """
         try:
-            # Determine category
-            category = self.categorize_file(source_path)
+            if self.is_library_link(source_path):
+                logger.info(f"Skipping link to a library file: {source_path}")
+                return True
+            
+            # Skip content that is already in the library before any extraction
+            size = source_path.stat().st_size
+            duplicate_of, content_hash = self.find_duplicate(source_path, size)
+            if duplicate_of:
+                if self.catalog.is_copy_source(source_path):
+                    # With move_files off the original stays where it was; a
+                    # rescan or modify event must not delete or replace it
+                    logger.info(f"Already organized as {duplicate_of}, leaving original "
+                                f"in place: {source_path}")
+                    return True
+                return self.handle_duplicate(source_path, Path(duplicate_of))
             
             # Extract metadata
-            metadata = self.extract_metadata(source_path)
+            if metadata is None:
+                metadata = self.extract_metadata(source_path, content_hash=content_hash)
+            
+            # Determine category, using the metadata for ambiguous extensions
+            category = self.categorize_file(source_path, metadata)
             
             # Generate new filename
             new_filename = self.generate_filename(metadata, source_path.name)
@@ -420,28 +683,36 @@ class ResearchFileManager:
             category_dir = base_dir / category
             destination_path = category_dir / new_filename
             
-            # Handle filename conflicts
-            counter = 1
-            original_destination = destination_path
-            while destination_path.exists():
-                stem = original_destination.stem
-                suffix = original_destination.suffix
-                destination_path = category_dir / f"{stem}_{counter}{suffix}"
-                counter += 1
-            
-            # Move/copy file
-            if self.config['auto_organization']['move_files']:
-                shutil.move(str(source_path), str(destination_path))
-                logger.info(f"Moved file to: {destination_path}")
-            else:
-                shutil.copy2(str(source_path), str(destination_path))
-                logger.info(f"Copied file to: {destination_path}")
+            with self._placement_lock:
+                # Handle filename conflicts
+                counter = 1
+                original_destination = destination_path
+                while destination_path.exists():
+                    stem = original_destination.stem
+                    suffix = original_destination.suffix
+                    destination_path = category_dir / f"{stem}_{counter}{suffix}"
+                    counter += 1
+                
+                # Move/copy file
+                if self.config['auto_organization']['move_files']:
+                    shutil.move(str(source_path), str(destination_path))
+                    logger.info(f"Moved file to: {destination_path}")
+                else:
+                    shutil.copy2(str(source_path), str(destination_path))
+                    logger.info(f"Copied file to: {destination_path}")
+            
+            if self.catalog:
+                copied = not self.config['auto_organization']['move_files']
+                self.catalog.record_content(destination_path, size, content_hash,
+                                            source=source_path if copied else None)
             
             # Save metadata
-            metadata_file = destination_path.with_suffix('.metadata.json')
-            with open(metadata_file, 'w') as f:
-                json.dump(metadata, f, indent=2, default=str)
-            logger.info(f"Created metadata file: {metadata_file}")
+            self.save_metadata(destination_path, metadata, category, content_hash)
+            
+            # Index every entry of a BibTeX library
+            if destination_path.suffix.lower() == '.bib' and \
+                    self.config.get('metadata_extraction', {}).get('index_bibtex', True):
+                self.index_bibtex_library(destination_path)
             
             # Add to Zotero if configured
             if self.zotero_client and category in ['papers', 'books']:
@@ -457,8 +728,62 @@ class ResearchFileManager:
             logger.error(f"Failed to organize file {source_path}: {e}")
             return False
     
+    def save_metadata(self, file_path: Path, metadata: Dict, category: Optional[str] = None,
+                      content_hash: Optional[str] = None, kind: str = 'files'):
+        """Record metadata in the catalog, writing a sidecar file when configured."""
+        write_sidecar = self.config.get('catalog', {}).get('write_sidecars', False)
+        
+        if self.catalog:
+            self.catalog.record_metadata(file_path, metadata, category, content_hash, kind)
+            logger.info(f"Catalogued metadata for: {file_path}")
+        else:
+            # Without a catalog the sidecar is the only place the metadata can go
+            write_sidecar = True
+        
+        if write_sidecar:
+            metadata_file = file_path.with_suffix('.metadata.json')
+            with open(metadata_file, 'w') as f:
+                json.dump(metadata, f, indent=2, default=str)
+            logger.info(f"Created metadata file: {metadata_file}")
+    
+    def find_duplicate(self, file_path: Path, size: int):
+        """Return (existing library path, content hash) if the file's content is already organized."""
+        if not self.catalog or not self.config.get('deduplication', {}).get('enabled', True):
+            return None, None
+        
+        return self.catalog.find_duplicate(file_path, size)
+    
+    def handle_duplicate(self, source_path: Path, existing_path: Path) -> bool:
+        """Apply the configured duplicate policy: delete, link or keep."""
+        policy = self.config.get('deduplication', {}).get('policy', 'keep')
+        
+        if policy == 'delete':
+            source_path.unlink()
+            logger.info(f"Deleted duplicate of {existing_path}: {source_path}")
+        elif policy == 'link':
+            source_path.unlink()
+            source_path.symlink_to(existing_path)
+            logger.info(f"Replaced duplicate with link to {existing_path}: {source_path}")
+        else:
+            logger.info(f"Duplicate of {existing_path}, leaving in place: {source_path}")
+        
+        return True
+    
+    def is_library_link(self, file_path: Path) -> bool:
+        """Check whether a file is a symlink into the research library (see the 'link' policy)."""
+        if not file_path.is_symlink():
+            return False
+        
+        base_dir = Path(self.config['research_base_dir']).expanduser().resolve()
+        return base_dir in file_path.resolve().parents
+    
     def add_to_zotero(self, file_path: Path, metadata: Dict):
-        """Add file to Zotero library."""
+        """Add file to Zotero library.
+        
+        The item is spooled and uploaded in the background (see ZoteroBatcher).
+        Inside a batching window it is created together with others when the
+        window closes or a batch fills up.
+        """
         try:
             # Create item data
             item_data = {
@@ -471,69 +796,92 @@ class ResearchFileManager:
                 'collections': ['Research Files']
             }
             
-            # Add item to Zotero
-            created_item = self.zotero_client.create_items([item_data])
-            
-            if created_item:
-                # Attach the file
-                item_id = created_item[0]['key']
-                self.zotero_client.attachment_simple(file_path, item_id)
-                logger.info(f"Added to Zotero: {file_path}")
-            else:
-                logger.warning(f"Failed to create Zotero item for: {file_path}")
+            self.zotero_batcher.add(file_path, item_data)
                 
         except Exception as e:
             logger.error(f"Failed to add {file_path} to Zotero: {e}")
     
+    @contextmanager
+    def zotero_batch(self):
+        """Collect Zotero items created inside the block and send them in batches."""
+        if not self.zotero_batcher:
+            yield
+            return
+        
+        with self.zotero_batcher.batching():
+            yield
+    
+    def finish_zotero_uploads(self):
+        """Wait a bounded time for spooled Zotero uploads before exiting."""
+        if self.zotero_batcher:
+            self.zotero_batcher.stop(self.config.get('zotero', {}).get('drain_timeout', 60))
+    
     def add_to_calibre(self, file_path: Path, metadata: Dict):
-        """Add file to Calibre library using calibredb command-line tool."""
-        try:
-            if not self.config.get('calibre', {}).get('enabled', False):
-                logger.info(f"Calibre integration is disabled")
-                return
-            
-            calibre_path = self.config['calibre']['path']
-            calibredb = Path(calibre_path) / 'calibredb'
-            
-            if not calibredb.exists():
-                logger.warning(f"Calibre command-line tool not found at: {calibredb}")
-                return
-            
-            # Use calibredb add command to add the book to Calibre library
-            import subprocess
-            
-            cmd = [
-                str(calibredb),
-                'add',
-                '--library-path', str(Path(self.config['calibre']['library_path']).expanduser()),
-                '--title', metadata.get('title', 'Unknown Title'),
-                '--authors', metadata.get('author', 'Unknown Author'),
-                '--tags', 'Research,Imported',
-                str(file_path)
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                logger.info(f"Successfully added {file_path} to Calibre library")
-                # Extract the book ID from output for future reference
-                if 'Added book id:' in result.stdout:
-                    book_id = result.stdout.split('Added book id:')[1].strip().split()[0]
-                    logger.info(f"Book ID: {book_id}")
-            else:
-                logger.warning(f"Calibre add command failed: {result.stderr}")
-                
-        except Exception as e:
-            logger.error(f"Failed to add {file_path} to Calibre: {e}")
+        """Add file to Calibre library using calibredb command-line tool.
+        
+        Inside a batching window (see CalibreBatcher.batching) the book is added
+        together with others when the window closes or a batch fills up. Books
+        already in the library are skipped without starting calibredb.
+        """
+        if not self.config.get('calibre', {}).get('enabled', False):
+            logger.info(f"Calibre integration is disabled")
+            return
+        
+        existing = self.find_in_calibre(metadata)
+        if existing:
+            logger.info(f"Already in Calibre library as book {existing['id']} "
+                        f"({existing['title']}), not adding: {file_path}")
+            return
+        
+        self.calibre_batcher.add(file_path, metadata)
+    
+    @contextmanager
+    def calibre_batch(self):
+        """Collect books added to Calibre inside the block and add them in batches."""
+        with self.calibre_batcher.batching():
+            yield
+    
+    def calibre_metadata_worker(self) -> Optional[CalibreMetadataWorker]:
+        """The warm calibre-debug worker for MOBI/AZW3 metadata, started on first use."""
+        with self._calibre_worker_lock:
+            if self._calibre_worker is None:
+                worker = CalibreMetadataWorker(self.config['calibre']['path'], timeout=30)
+                if not worker.available():
+                    logger.warning(f"calibre-debug not found at: {worker.calibre_debug}")
+                    return None
+                self._calibre_worker = worker
+            return self._calibre_worker
     
     def extract_ebook_metadata(self, file_path: Path) -> Dict:
-        """Extract metadata from e-book files using Calibre's ebook-meta tool."""
+        """Extract metadata from e-book files.
+        
+        EPUBs are read directly from their OPF package document. Other formats
+        go to a warm Calibre worker shared by all files, with a one-off
+        ebook-meta run as the fallback.
+        """
         metadata = {}
         
+        if file_path.suffix.lower() == '.epub':
+            try:
+                metadata = read_epub_metadata(file_path)
+            except Exception as e:
+                logger.warning(f"Could not read EPUB package of {file_path}: {e}")
+            if metadata:
+                logger.info(f"Extracted e-book metadata from {file_path}")
+                return metadata
+        
         try:
             if not self.config.get('calibre', {}).get('enabled', False):
                 return metadata
             
+            worker = self.calibre_metadata_worker()
+            if worker:
+                metadata = worker.read(file_path)
+                if metadata is not None:
+                    logger.info(f"Extracted e-book metadata from {file_path}")
+                    return metadata
+                metadata = {}
+            
             calibre_path = self.config['calibre']['path']
             ebook_meta = Path(calibre_path) / 'ebook-meta'
             
@@ -542,10 +890,8 @@ class ResearchFileManager:
                 return metadata
             
             # Use ebook-meta to extract metadata
-            import subprocess
-            
             cmd = [str(ebook_meta), str(file_path)]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            result = run_tool(cmd, timeout=30)
             
             if result.returncode == 0:
                 output = result.stdout
@@ -572,6 +918,10 @@ class ResearchFileManager:
                             metadata['series'] = value
                         elif key == 'published':
                             metadata['year'] = value
+                        elif key == 'identifiers':
+                            isbn = re.search(r'isbn:([\dXx-]+)', value)
+                            if isbn:
+                                metadata['isbn'] = isbn.group(1)
                 
                 logger.info(f"Extracted e-book metadata from {file_path}")
                 
@@ -592,8 +942,7 @@ class ResearchFileManager:
                 logger.warning(f"Bean not found at: {bean_path}")
                 return False
             
-            import subprocess
-            subprocess.run(['open', '-a', bean_path, str(file_path)], check=True)
+            run_tool(['open', '-a', bean_path, str(file_path)], check=True)
             logger.info(f"Opened {file_path} in Bean")
             return True
             
@@ -613,8 +962,7 @@ class ResearchFileManager:
                 logger.warning(f"TexStudio not found at: {texstudio_path}")
                 return False
             
-            import subprocess
-            subprocess.run([texstudio_path, str(file_path)], check=True)
+            run_tool([texstudio_path, str(file_path)], check=True)
             logger.info(f"Opened {file_path} in TexStudio")
             return True
             
@@ -636,11 +984,9 @@ class ResearchFileManager:
             working_dir = tex_file.parent
             tex_filename = tex_file.name
             
-            import subprocess
-            
             # Run pdflatex
             cmd = [f"{latex_path}/{compiler}", "-interaction=nonstopmode", tex_filename]
-            result = subprocess.run(cmd, cwd=working_dir, capture_output=True, text=True, timeout=60)
+            result = run_tool(cmd, cwd=working_dir, timeout=60)
             
             if result.returncode == 0:
                 logger.info(f"Successfully compiled {tex_file} to PDF")
@@ -650,11 +996,11 @@ class ResearchFileManager:
                 if Path(working_dir / f"{tex_file.stem}.bib").exists():
                     # Run bibtex
                     bibtex_cmd = [bibtex_path, tex_filename[:-4]]  # Remove .tex extension
-                    subprocess.run(bibtex_cmd, cwd=working_dir, capture_output=True, text=True, timeout=30)
+                    run_tool(bibtex_cmd, cwd=working_dir, timeout=30)
                     
                     # Run pdflatex twice more for references
-                    subprocess.run(cmd, cwd=working_dir, capture_output=True, text=True, timeout=60)
-                    subprocess.run(cmd, cwd=working_dir, capture_output=True, text=True, timeout=60)
+                    run_tool(cmd, cwd=working_dir, timeout=60)
+                    run_tool(cmd, cwd=working_dir, timeout=60)
                 
                 return True
             else:
@@ -807,9 +1153,7 @@ Your content here.
             metadata['export_date'] = datetime.now().isoformat()
             
             # Save metadata
-            metadata_file = destination.with_suffix('.metadata.json')
-            with open(metadata_file, 'w') as f:
-                json.dump(metadata, f, indent=2, default=str)
+            self.save_metadata(destination, metadata, kind='scispace')
             
             logger.info(f"Processed SciSpace export: {destination}")
             return True
@@ -818,53 +1162,198 @@ Your content here.
             logger.error(f"Failed to process SciSpace export {export_file}: {e}")
             return False
     
-    def process_directory(self, directory_path: str):
-        """Process all files in a directory."""
+    def process_directory(self, directory_path: str, jobs: int = 1, incremental: bool = True) -> Dict:
+        """Process all files in a directory.
+        
+        With more than one job, metadata extraction runs in a process pool while
+        naming and moving stay serialized in this process, in directory order.
+        
+        In incremental mode a stat manifest (inode, size, mtime) from the previous
+        run is used to skip entries that have not changed since, so an unchanged
+        directory costs a single scandir pass.
+        """
+        counts = {'processed': 0, 'failed': 0, 'unchanged': 0}
         directory = Path(directory_path).expanduser()
         
         if not directory.exists():
             logger.warning(f"Directory not found: {directory}")
-            return
+            return counts
         
         logger.info(f"Processing directory: {directory}")
         
-        # Get all files
-        files = [f for f in directory.iterdir() if f.is_file()]
-        logger.info(f"Found {len(files)} files to process")
+        manifest_key = str(directory.resolve())
+        use_manifest = incremental and self.catalog is not None
+        previous = self.catalog.load_manifest(manifest_key) if use_manifest else {}
+        
+        # Get all new or changed files
+        files = []
+        manifest = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                if previous.get(entry.name) == signature:
+                    manifest[entry.name] = signature
+                    counts['unchanged'] += 1
+                else:
+                    files.append(Path(entry.path))
+        logger.info(f"Found {len(files)} files to process ({counts['unchanged']} unchanged)")
+        
+        with self.zotero_batch(), self.calibre_batch():
+            for file_path, metadata in self._iter_with_metadata(files, jobs):
+                try:
+                    if self.organize_file(file_path, metadata):
+                        counts['processed'] += 1
+                        # Files that stay in place (copy mode, kept duplicates) are
+                        # remembered; failures are retried on the next run
+                        if file_path.exists():
+                            stat = file_path.stat()
+                            manifest[file_path.name] = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                    else:
+                        counts['failed'] += 1
+                except Exception as e:
+                    logger.error(f"Error processing {file_path}: {e}")
+                    counts['failed'] += 1
+        
+        if use_manifest:
+            self.catalog.save_manifest(manifest_key, manifest)
+        
+        logger.info(f"Directory processing complete. Processed: {counts['processed']}, "
+                    f"Failed: {counts['failed']}, Unchanged (skipped): {counts['unchanged']}")
+        return counts
+    
+    def process_source_directories(self, jobs: int = 1, incremental: bool = True):
+        """Process every configured source directory and log the combined counts."""
+        totals = {'processed': 0, 'failed': 0, 'unchanged': 0}
+        for directory in self.config['source_directories']:
+            counts = self.process_directory(directory, jobs=jobs, incremental=incremental)
+            for key in totals:
+                totals[key] += counts[key]
+        
+        logger.info(f"All source directories complete. Processed: {totals['processed']}, "
+                    f"Failed: {totals['failed']}, Unchanged (skipped): {totals['unchanged']}")
+        return totals
+    
+    def _iter_with_metadata(self, files, jobs: int):
+        """Yield (file, metadata) pairs in order, extracting in parallel when jobs > 1.
+        
+        Metadata is None when it should be extracted in-process instead.
+        """
+        if jobs == 0:
+            jobs = os.cpu_count() or 1
+        if jobs <= 1 or len(files) < 2:
+            for file_path in files:
+                yield file_path, None
+            return
+        
+        jobs = min(jobs, len(files))
+        logger.info(f"Extracting metadata with {jobs} worker processes")
+        # Workers send their log records here and only this process writes
+        # them, so the log file has a single writer
+        root_logger = logging.getLogger()
+        log_queue = multiprocessing.Queue()
+        log_listener = logging.handlers.QueueListener(log_queue, *root_logger.handlers,
+                                                      respect_handler_level=True)
+        log_listener.start()
+        try:
+            yield from self._iter_with_workers(files, jobs, log_queue, root_logger.level)
+        finally:
+            log_listener.stop()
+    
+    def _iter_with_workers(self, files, jobs: int, log_queue, log_level: int):
+        """Yield (file, metadata) pairs in order from a pool of extraction workers."""
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 initializer=_init_extraction_worker,
+                                 initargs=(self.config_path, tool_runner.shared_semaphores(),
+                                           log_queue, log_level)) as executor:
+            # Files that may be duplicates are left to organize_file(), which
+            # checks the content index before extracting anything
+            futures = [
+                None if self._may_be_duplicate(f)
+                else executor.submit(_extract_metadata_in_worker, str(f))
+                for f in files
+            ]
+            for file_path, future in zip(files, futures):
+                if future is None:
+                    yield file_path, None
+                    continue
+                try:
+                    metadata = future.result()
+                except Exception as e:
+                    logger.warning(f"Worker failed to extract metadata from {file_path}: {e}")
+                    metadata = None
+                yield file_path, metadata
+    
+    def _may_be_duplicate(self, file_path: Path) -> bool:
+        """Cheap pre-filter: a file can only be a duplicate if its size is catalogued."""
+        if not self.catalog or not self.config.get('deduplication', {}).get('enabled', True):
+            return False
         
-        processed = 0
-        failed = 0
+        try:
+            return self.catalog.has_size(file_path.stat().st_size)
+        except OSError:
+            return False
+    
+    def wait_for_stable_size(self, file_path: Path) -> bool:
+        """Wait until a file has stopped growing, i.e. its download/write finished."""
+        watch_config = self.config.get('watch', {})
+        interval = watch_config.get('stable_interval', 0.5)
+        required_checks = watch_config.get('stable_checks', 2)
+        deadline = time.monotonic() + watch_config.get('stable_timeout', 300)
         
-        for file_path in files:
+        last_size = None
+        stable_checks = 0
+        while time.monotonic() < deadline:
             try:
-                if self.organize_file(file_path):
-                    processed += 1
-                else:
-                    failed += 1
-            except Exception as e:
-                logger.error(f"Error processing {file_path}: {e}")
-                failed += 1
+                size = file_path.stat().st_size
+            except FileNotFoundError:
+                # Temporary file that was renamed or removed before we got to it
+                return False
+            
+            if size == last_size:
+                stable_checks += 1
+                if stable_checks >= required_checks:
+                    return True
+            else:
+                stable_checks = 0
+                last_size = size
+            
+            time.sleep(interval)
         
-        logger.info(f"Directory processing complete. Processed: {processed}, Failed: {failed}")
+        logger.warning(f"File still changing after timeout, skipping: {file_path}")
+        return False
     
-    def start_watching(self):
+    def start_watching(self, workers: Optional[int] = None):
         """Start watching source directories for new files."""
         if not self.config['auto_organization']['enabled']:
             logger.info("Auto-organization is disabled in config")
             return
         
+        watch_config = self.config.get('watch', {})
+        ingest_queue = IngestQueue(
+            self,
+            workers=workers or watch_config.get('workers', 4),
+            max_size=watch_config.get('queue_size', 256),
+            enqueue_timeout=watch_config.get('enqueue_timeout', 1.0)
+        )
+        summary_interval = watch_config.get('summary_interval', 60)
+        
         class FileHandler(FileSystemEventHandler):
-            def __init__(self, manager):
-                self.manager = manager
+            def __init__(self, ingest_queue):
+                self.ingest_queue = ingest_queue
             
             def on_created(self, event):
                 if not event.is_directory:
-                    logger.info(f"New file detected: {event.src_path}")
-                    # Wait a bit for file to be fully written
-                    time.sleep(2)
-                    self.manager.organize_file(Path(event.src_path))
+                    self.ingest_queue.submit(Path(event.src_path))
+            
+            def on_moved(self, event):
+                # Browsers write to a temporary name and rename when done
+                if not event.is_directory:
+                    self.ingest_queue.submit(Path(event.dest_path))
         
-        event_handler = FileHandler(self)
+        event_handler = FileHandler(ingest_queue)
         observer = Observer()
         
         for directory in self.config['source_directories']:
@@ -875,17 +1364,587 @@ Your content here.
             else:
                 logger.warning(f"Source directory not found: {dir_path}")
         
+        # Zotero items and Calibre books from files arriving within these
+        # windows are sent together
+        zotero_window = self.config.get('zotero', {}).get('batch_window', 30)
+        calibre_window = self.config.get('calibre', {}).get('batch_window', 30)
+        
+        ingest_queue.start()
         observer.start()
         logger.info("File watching started. Press Ctrl+C to stop.")
         
+        with self.zotero_batch(), self.calibre_batch():
+            try:
+                last_summary = last_zotero_flush = last_calibre_flush = time.monotonic()
+                while True:
+                    time.sleep(1)
+                    ingest_queue.retry_deferred()
+                    if time.monotonic() - last_summary >= summary_interval:
+                        ingest_queue.log_summary()
+                        last_summary = time.monotonic()
+                    if self.zotero_batcher and time.monotonic() - last_zotero_flush >= zotero_window:
+                        self.zotero_batcher.flush()
+                        last_zotero_flush = time.monotonic()
+                    if time.monotonic() - last_calibre_flush >= calibre_window:
+                        self.calibre_batcher.flush()
+                        last_calibre_flush = time.monotonic()
+            except KeyboardInterrupt:
+                observer.stop()
+                logger.info("File watching stopped.")
+            
+            observer.join()
+            ingest_queue.stop()
+            ingest_queue.log_summary()
+        self.finish_zotero_uploads()
+
+
+class ZoteroBatcher:
+    """Uploads new Zotero items from a durable spool in a background thread.
+    
+    Items are written to the catalog's spool table first, so organizing a file
+    never waits on the network and pending uploads survive restarts and
+    offline periods. The worker creates up to 50 items per API request and
+    then attaches each file to its item. Failed requests are retried with
+    exponential backoff, or after the delay the server asks for with a
+    Retry-After or Backoff header.
+    
+    Outside a batching window every item is sent right away, as before.
+    """
+    
+    # The Zotero write API accepts at most 50 items per request
+    MAX_BATCH_SIZE = 50
+    # Retry delays in seconds
+    BASE_RETRY_DELAY = 30
+    MAX_RETRY_DELAY = 3600
+    # Items the API rejects are given up on after this many attempts
+    MAX_ATTEMPTS = 8
+    # How often the worker looks for retries that have become due
+    POLL_INTERVAL = 5
+    
+    def __init__(self, zotero_client, catalog: ResearchCatalog, batch_size: int = MAX_BATCH_SIZE):
+        self.zotero_client = zotero_client
+        self.catalog = catalog
+        self.batch_size = max(1, min(batch_size, self.MAX_BATCH_SIZE))
+        self.create_calls = 0
+        # Seconds from spooling to finished upload, for recent items
+        self.latencies = deque(maxlen=10000)
+        self._windows = 0
+        self._added = 0
+        self._force = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start the upload worker; uploads left over from earlier runs are sent first."""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name='zotero-upload', daemon=True)
+        self._thread.start()
+        
+        pending = self.catalog.count_zotero_jobs()
+        if pending:
+            logger.info(f"Resuming {pending} spooled Zotero uploads")
+            self.flush()
+    
+    def stop(self, timeout: float = 60):
+        """Give the worker up to timeout seconds to send what is due, then stop it."""
+        if not self._thread:
+            return
+        
+        # Keep waiting while some upload is due or will be retried in time
+        self.flush()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            next_attempt = self.catalog.next_zotero_attempt()
+            if next_attempt is None or next_attempt - time.time() > deadline - time.monotonic():
+                break
+            time.sleep(0.5)
+        
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout=max(0, deadline - time.monotonic()) + 5)
+        self._thread = None
+        
+        remaining = self.catalog.count_zotero_jobs()
+        if remaining:
+            logger.info(f"{remaining} Zotero uploads left in the spool for the next run")
+    
+    @contextmanager
+    def batching(self):
+        """Hold items back until the outermost window closes or a batch is full."""
+        with self._lock:
+            self._windows += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._windows -= 1
+            self.flush()
+    
+    def add(self, file_path: Path, item_data: Dict):
+        """Spool an item; the file is attached once the item has been created."""
+        self.catalog.enqueue_zotero_item(file_path, item_data)
+        with self._lock:
+            self._added += 1
+            send_now = self._windows == 0 or self._added >= self.batch_size
+        
+        if send_now:
+            self.flush()
+    
+    def flush(self):
+        """Ask the worker to send everything that is due, including partial batches."""
+        with self._lock:
+            self._force = True
+            self._added = 0
+        self._wake.set()
+    
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.POLL_INTERVAL)
+            self._wake.clear()
+            with self._lock:
+                force = self._force or self._windows == 0
+                self._force = False
+            
+            try:
+                self._drain(force)
+            except Exception as e:
+                logger.error(f"Zotero upload worker error: {e}")
+    
+    def _drain(self, force: bool):
+        while not self._stopping.is_set():
+            jobs = self.catalog.ready_zotero_jobs(self.batch_size)
+            if not jobs or (len(jobs) < self.batch_size and not force):
+                return
+            
+            # Items created on an earlier attempt only need their attachment
+            for job in jobs:
+                if job['item_key']:
+                    self._attach(job)
+            
+            new_items = [job for job in jobs if not job['item_key']]
+            if new_items:
+                self._create_batch(new_items)
+    
+    def _create_batch(self, jobs):
+        try:
+            response = self.zotero_client.create_items([job['item_data'] for job in jobs])
+            self.create_calls += 1
+        except Exception as e:
+            logger.warning(f"Failed to create {len(jobs)} Zotero items: {e}")
+            for job in jobs:
+                self._retry_or_drop(job, str(e))
+            return
+        if not isinstance(response, dict):
+            response = {}
+        
+        # Results are keyed by the position of the item in the request; an
+        # item reported as unchanged already exists under the given key
+        created = 0
+        for section in ('success', 'unchanged'):
+            for index, item_key in (response.get(section) or {}).items():
+                job = jobs[int(index)]
+                if job['item_key'] or not isinstance(item_key, str):
+                    continue
+                self.catalog.set_zotero_item_key(job['id'], item_key)
+                job['item_key'] = item_key
+                self._attach(job)
+                created += 1
+        failures = {int(index): failure for index, failure in (response.get('failed') or {}).items()}
+        
+        # Every job left without a key is rescheduled, including any the
+        # response says nothing about; otherwise it would stay due and be
+        # sent again straight away
+        for index, job in enumerate(jobs):
+            if job['item_key']:
+                continue
+            failure = failures.get(index)
+            if failure is None:
+                message = 'item missing from the create response'
+            else:
+                message = failure.get('message', failure) if isinstance(failure, dict) else failure
+            self._retry_or_drop(job, f"failed to create item: {message}")
+        logger.info(f"Created {created} of {len(jobs)} Zotero items in one request")
+    
+    def _attach(self, job: Dict):
+        file_path = Path(job['file_path'])
+        if not file_path.exists():
+            logger.warning(f"Dropping Zotero attachment, file no longer exists: {file_path}")
+            self.catalog.remove_zotero_job(job['id'])
+            return
+        
+        try:
+            result = self.zotero_client.attachment_simple([str(file_path)], job['item_key'])
+            if isinstance(result, dict) and result.get('failure'):
+                raise RuntimeError(f"upload rejected: {result['failure']}")
+        except Exception as e:
+            self._retry_or_drop(job, f"failed to attach to item {job['item_key']}: {e}")
+            return
+        
+        self.catalog.remove_zotero_job(job['id'])
+        self.latencies.append(time.time() - datetime.fromisoformat(job['queued_at']).timestamp())
+        logger.info(f"Added to Zotero: {file_path}")
+    
+    def _retry_or_drop(self, job: Dict, error: str):
+        """Reschedule a failed job, or give up on it after MAX_ATTEMPTS."""
+        if job['attempts'] + 1 >= self.MAX_ATTEMPTS:
+            logger.error(f"Giving up on Zotero upload of {job['file_path']}: {error}")
+            self.catalog.remove_zotero_job(job['id'])
+        else:
+            logger.warning(f"Zotero upload of {job['file_path']} will be retried: {error}")
+            self.catalog.retry_zotero_job(job['id'], self._retry_delay(job['attempts']), error)
+    
+    def _retry_delay(self, attempts: int) -> float:
+        """Delay before the next attempt, preferring the one the server asked for."""
+        response = getattr(self.zotero_client, 'request', None)
+        if getattr(response, 'status_code', None) in (429, 503):
+            for header in ('Retry-After', 'Backoff'):
+                try:
+                    return float(response.headers[header])
+                except (KeyError, TypeError, ValueError):
+                    continue
+        
+        delay = min(self.BASE_RETRY_DELAY * 2 ** attempts, self.MAX_RETRY_DELAY)
+        return delay * random.uniform(1, 1.25)
+
+
+class CalibreBatcher:
+    """Collects books for Calibre and adds them with one calibredb call per batch.
+    
+    Every calibredb start takes seconds and locks the library. Each book is
+    staged in a temporary directory as a symlink next to an OPF file with its
+    own title and author, which calibredb reads when adding, so one call can
+    add many books without losing per-book metadata.
+    
+    Outside a batching window every book is added right away, as before.
+    """
+    
+    DEFAULT_BATCH_SIZE = 50
+    
+    def __init__(self, config: Dict, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.config = config
+        self.batch_size = max(1, batch_size)
+        self.pending = []
+        self.add_calls = 0
+        self._windows = 0
+        self._lock = threading.Lock()
+        # calibredb takes a library lock, so only one call runs at a time
+        self._calibredb_lock = threading.Lock()
+    
+    @contextmanager
+    def batching(self):
+        """Hold books back until the outermost window closes or a batch is full."""
+        with self._lock:
+            self._windows += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._windows -= 1
+            self.flush()
+    
+    def add(self, file_path: Path, metadata: Dict):
+        """Queue a book for Calibre."""
+        with self._lock:
+            self.pending.append((file_path, metadata))
+            send_now = self._windows == 0 or len(self.pending) >= self.batch_size
+        
+        if send_now:
+            self.flush()
+    
+    def flush(self) -> Dict[Path, Optional[int]]:
+        """Add all pending books; returns {file: Calibre book id, None if not added}."""
+        with self._lock:
+            batch, self.pending = self.pending, []
+        
+        results = {}
+        for start in range(0, len(batch), self.batch_size):
+            results.update(self._add_batch(batch[start:start + self.batch_size]))
+        return results
+    
+    def _add_batch(self, batch) -> Dict[Path, Optional[int]]:
+        results = {file_path: None for file_path, _ in batch}
+        calibre_config = self.config['calibre']
+        calibredb = Path(calibre_config['path']) / 'calibredb'
+        
+        if not calibredb.exists():
+            logger.warning(f"Calibre command-line tool not found at: {calibredb}")
+            return results
+        
+        import subprocess
+        
+        with tempfile.TemporaryDirectory(prefix='calibre_batch_') as staging_dir, \
+                self._calibredb_lock:
+            staged = []
+            for index, (file_path, metadata) in enumerate(batch):
+                staged_path = Path(staging_dir) / f"{index:04d}_{file_path.name}"
+                os.symlink(file_path.resolve(), staged_path)
+                write_calibre_opf(staged_path.with_suffix('.opf'),
+                                  metadata.get('title', 'Unknown Title'),
+                                  metadata.get('author', 'Unknown Author'))
+                staged.append(staged_path)
+            
+            cmd = [
+                str(calibredb),
+                'add',
+                '--library-path', str(Path(calibre_config['library_path']).expanduser()),
+                '--tags', 'Research,Imported',
+                *[str(path) for path in staged]
+            ]
+            
+            try:
+                # Calibre starts once per batch; allow extra time per book
+                result = run_tool(cmd, timeout=30 + 10 * len(batch))
+            except subprocess.TimeoutExpired:
+                logger.error(f"calibredb timed out adding {len(batch)} books")
+                return results
+            self.add_calls += 1
+        
+        if result.returncode != 0:
+            logger.warning(f"Calibre add command failed: {result.stderr}")
+            return results
+        
+        book_ids = match_calibre_book_ids([str(path) for path in staged], result.stdout)
+        if book_ids is None:
+            logger.warning(f"Added {len(batch)} books to Calibre but could not match "
+                           f"their book ids: {result.stdout.strip()}")
+            return results
+        
+        for (file_path, _), book_id in zip(batch, book_ids):
+            results[file_path] = book_id
+            if book_id is None:
+                logger.info(f"Already in Calibre library, not added: {file_path}")
+            else:
+                logger.info(f"Successfully added {file_path} to Calibre library (book id {book_id})")
+        logger.info(f"Added {sum(1 for book_id in book_ids if book_id)} of {len(batch)} "
+                    f"books to Calibre with one calibredb call")
+        return results
+
+
+def write_calibre_opf(opf_path: Path, title: str, author: str):
+    """Write a minimal OPF that calibredb reads as metadata for the book beside it."""
+    opf_path.write_text(
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="2.0">\n'
+        '  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" '
+        'xmlns:opf="http://www.idpf.org/2007/opf">\n'
+        f'    <dc:title>{xml_escape(str(title))}</dc:title>\n'
+        f'    <dc:creator opf:role="aut">{xml_escape(str(author))}</dc:creator>\n'
+        '  </metadata>\n'
+        '</package>\n',
+        encoding='utf-8'
+    )
+
+
+def pdf_xmp_metadata(pdf_reader) -> Dict:
+    """Title and author from a PDF's XMP packet, for files with an empty Info dictionary."""
+    metadata = {}
+    try:
+        xmp = pdf_reader.xmp_metadata
+        if xmp is None:
+            return metadata
+        if xmp.dc_title:
+            metadata['title'] = xmp.dc_title.get('x-default') or next(iter(xmp.dc_title.values()))
+        if xmp.dc_creator:
+            metadata['author'] = ', '.join(xmp.dc_creator)
+    except Exception as e:
+        logger.debug(f"Could not read XMP metadata: {e}")
+    return metadata
+
+
+def pdf_page_count(pdf_reader) -> int:
+    """Page count from /Root /Pages /Count, without walking the page tree.
+    
+    len(pdf_reader.pages) visits every page node; that is only the fallback
+    for files whose page tree root has no usable count.
+    """
+    try:
+        return int(pdf_reader.trailer['/Root']['/Pages']['/Count'])
+    except Exception:
+        return len(pdf_reader.pages)
+
+
+def pdf_first_page(pdf_reader):
+    """The first page, without flattening the rest of the page tree (see iter_pdf_pages)."""
+    return next(iter_pdf_pages(pdf_reader, 1), None)
+
+
+# Manager used by metadata extraction worker processes
+_worker_manager = None
+
+
+def _init_extraction_worker(config_path: str, tool_semaphores: Dict, log_queue, log_level: int):
+    """Create the per-process manager used for metadata extraction.
+    
+    The parent's tool semaphores are adopted, so external tool limits hold
+    across all workers rather than per worker. Log records go to the parent
+    through log_queue instead of to the handlers set up on import, so only
+    the parent writes the log file.
+    """
+    global _worker_manager
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+        handler.close()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(log_level)
+    
+    _worker_manager = ResearchFileManager(config_path, integrations=False)
+    tool_runner.adopt_semaphores(tool_semaphores)
+
+
+def _extract_metadata_in_worker(file_path: str) -> Dict:
+    """Extract metadata for one file inside a worker process."""
+    return _worker_manager.extract_metadata(Path(file_path))
+
+
+class IngestQueue:
+    """Bounded queue of newly detected files served by a pool of worker threads."""
+    
+    # Partial downloads that will be renamed once complete
+    TEMPORARY_SUFFIXES = {'.crdownload', '.part', '.partial', '.download', '.tmp'}
+    
+    def __init__(self, manager: ResearchFileManager, workers: int = 4, max_size: int = 256,
+                 enqueue_timeout: float = 1.0):
+        self.manager = manager
+        self.queue = queue.Queue(maxsize=max_size)
+        self.enqueue_timeout = enqueue_timeout
+        self.threads = [
+            threading.Thread(target=self._worker, name=f"ingest-{i + 1}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        self._pending = set()
+        # Files that found the queue full, for retry_deferred
+        self._deferred = set()
+        self._lock = threading.Lock()
+        
+        # Counters for the periodic summary
+        self.processed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.max_depth = 0
+        self._window_start = time.monotonic()
+        self._window_completed = 0
+    
+    def start(self):
+        """Start the worker threads."""
+        for thread in self.threads:
+            thread.start()
+        logger.info(f"Started {len(self.threads)} ingest workers (queue size {self.queue.maxsize})")
+    
+    def submit(self, file_path: Path):
+        """Queue a file for organization, ignoring temporary and already queued files.
+        
+        Called from the observer thread, so a full queue is waited on for at
+        most enqueue_timeout seconds; the file is then deferred to
+        retry_deferred instead of stalling event delivery.
+        """
+        if file_path.name.startswith('.') or file_path.suffix.lower() in self.TEMPORARY_SUFFIXES:
+            return
+        
+        logger.info(f"New file detected: {file_path}")
+        if not self._enqueue(file_path, self.enqueue_timeout):
+            logger.warning(f"Ingest queue full ({self.queue.maxsize} files), "
+                           f"deferring {file_path} to the next rescan")
+    
+    def retry_deferred(self):
+        """Queue deferred files again while there is room, without blocking.
+        
+        Files still deferred when watching stops are not in the scan manifest,
+        so the next --process-all run picks them up.
+        """
+        with self._lock:
+            deferred = list(self._deferred)
+        for file_path in deferred:
+            if not file_path.exists():
+                with self._lock:
+                    self._deferred.discard(file_path)
+            elif not self._enqueue(file_path):
+                break
+    
+    def _enqueue(self, file_path: Path, timeout: float = 0) -> bool:
+        """Put a file on the queue unless already queued; False if it was deferred."""
+        with self._lock:
+            self._deferred.discard(file_path)
+            if file_path in self._pending:
+                return True
+            self._pending.add(file_path)
+        
         try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            observer.stop()
-            logger.info("File watching stopped.")
+            if timeout > 0:
+                self.queue.put(file_path, timeout=timeout)
+            else:
+                self.queue.put_nowait(file_path)
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(file_path)
+                self._deferred.add(file_path)
+            return False
         
-        observer.join()
+        with self._lock:
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+    
+    def stop(self):
+        """Let the workers finish queued files, then shut them down."""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+    
+    def log_summary(self):
+        """Log queue depth and throughput since the previous summary."""
+        with self._lock:
+            elapsed = time.monotonic() - self._window_start
+            throughput = self._window_completed / elapsed if elapsed > 0 else 0.0
+            logger.info(
+                f"Ingest queue: depth {self.queue.qsize()} (max {self.max_depth}), "
+                f"deferred {len(self._deferred)}, "
+                f"processed {self.processed}, failed {self.failed}, skipped {self.skipped}, "
+                f"throughput {throughput:.2f} files/s"
+            )
+            self._window_start = time.monotonic()
+            self._window_completed = 0
+    
+    def _worker(self):
+        while True:
+            file_path = self.queue.get()
+            if file_path is None:
+                self.queue.task_done()
+                return
+            
+            try:
+                if not self.manager.wait_for_stable_size(file_path):
+                    outcome = 'skipped'
+                elif self.manager.organize_file(file_path):
+                    outcome = 'processed'
+                else:
+                    outcome = 'failed'
+            except Exception as e:
+                logger.error(f"Error processing {file_path}: {e}")
+                outcome = 'failed'
+            finally:
+                with self._lock:
+                    self._pending.discard(file_path)
+                self.queue.task_done()
+            
+            with self._lock:
+                setattr(self, outcome, getattr(self, outcome) + 1)
+                self._window_completed += 1
+
+
+def print_query_results(records, as_json: bool = False):
+    """Print catalog query results as a table or as JSON."""
+    if as_json:
+        print(json.dumps(records, indent=2, default=str))
+        return
+    
+    for record in records:
+        print(f"{record['year'] or '----'}  {(record['author'] or 'Unknown')[:30]:<30}  "
+              f"{(record['title'] or '')[:50]:<50}  {record['path']}")
+
 
 def main():
     """Main function to run the research file manager."""
@@ -896,26 +1955,100 @@ def main():
     parser.add_argument('--watch', action='store_true', help='Start watching directories')
     parser.add_argument('--process', help='Process a specific directory')
     parser.add_argument('--process-all', action='store_true', help='Process all source directories')
+    parser.add_argument('--workers', type=int, help='Number of worker threads in watch mode')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of processes for metadata extraction (0 = one per CPU core)')
+    parser.add_argument('--rescan', action='store_true',
+                        help='Ignore the scan manifest and process every file again')
+    
+    subparsers = parser.add_subparsers(dest='command')
+    
+    query_parser = subparsers.add_parser('query', help='Search the metadata catalog')
+    query_parser.add_argument('--kind', choices=sorted(ResearchCatalog.RECORD_TABLES),
+                              default='files', help='Record kind to search')
+    query_parser.add_argument('--category', help='Category, e.g. papers')
+    query_parser.add_argument('--author', help='Author name (substring)')
+    query_parser.add_argument('--year', type=int, help='Publication year')
+    query_parser.add_argument('--ext', help='File extension, e.g. pdf')
+    query_parser.add_argument('--hash', help='SHA-256 of the file content')
+    query_parser.add_argument('--path', help='Library path (substring)')
+    query_parser.add_argument('--title', help='Title (substring)')
+    query_parser.add_argument('--limit', type=int, help='Maximum number of results')
+    query_parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    
+    bibtex_parser = subparsers.add_parser('bibtex', help='Index or search BibTeX entries')
+    bibtex_parser.add_argument('--index', metavar='BIB_FILE', help='Index every entry of a .bib file')
+    bibtex_parser.add_argument('--key', help='Citation key')
+    bibtex_parser.add_argument('--doi', help='DOI')
+    bibtex_parser.add_argument('--title', help='Title (substring)')
+    bibtex_parser.add_argument('--limit', type=int, help='Maximum number of results')
+    bibtex_parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    
+    export_parser = subparsers.add_parser('export-sidecars',
+                                          help='Write .metadata.json files from the catalog')
+    export_parser.add_argument('--kind', choices=sorted(ResearchCatalog.RECORD_TABLES),
+                               default='files', help='Record kind to export')
     
     args = parser.parse_args()
     
+    if args.command in ('query', 'bibtex', 'export-sidecars'):
+        # Catalog commands only need the configuration, keep the output clean
+        logging.getLogger().setLevel(logging.WARNING)
+        manager = ResearchFileManager(args.config, integrations=False)
+        catalog = manager.setup_catalog()
+        if not catalog:
+            sys.exit(1)
+        
+        if args.command == 'export-sidecars':
+            print(f"Exported {catalog.export_sidecars(args.kind)} sidecar files")
+            return
+        
+        if args.command == 'bibtex':
+            if args.index:
+                manager.catalog = catalog
+                print(f"Indexed {manager.index_bibtex_library(Path(args.index).expanduser())} entries")
+                return
+            records = catalog.find_bibtex_entries(args.key, args.doi, args.title, args.limit)
+            if args.json:
+                print(json.dumps(records, indent=2))
+            else:
+                for record in records:
+                    print(f"{record['year'] or '----'}  {record['citation_key'][:25]:<25}  "
+                          f"{(record['title'] or '')[:50]:<50}  {record['doi'] or ''}  "
+                          f"{record['source_path']}")
+                print(f"{len(records)} results")
+            return
+        
+        started = time.perf_counter()
+        records = catalog.query(
+            kind=args.kind, category=args.category, author=args.author, year=args.year,
+            extension=args.ext, sha256=args.hash, path=args.path, title=args.title,
+            limit=args.limit
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print_query_results(records, args.json)
+        if not args.json:
+            print(f"{len(records)} results in {elapsed_ms:.1f} ms")
+        return
+    
     # Initialize manager
     manager = ResearchFileManager(args.config)
     
     if args.process:
         # Process specific directory
-        manager.process_directory(args.process)
+        manager.process_directory(args.process, jobs=args.jobs, incremental=not args.rescan)
     elif args.process_all:
         # Process all source directories
-        for directory in manager.config['source_directories']:
-            manager.process_directory(directory)
+        manager.process_source_directories(jobs=args.jobs, incremental=not args.rescan)
     elif args.watch:
         # Start watching mode
-        manager.start_watching()
+        manager.start_watching(workers=args.workers)
     else:
         # Default: process all source directories once
-        for directory in manager.config['source_directories']:
-            manager.process_directory(directory)
+        manager.process_source_directories(jobs=args.jobs, incremental=not args.rescan)
+    
+    manager.finish_zotero_uploads()
+    tool_runner.log_summary()
 
 if __name__ == "__main__":
     main()
@@ -6,6 +6,8 @@ Run this to verify everything is working correctly
 
 import os
 import json
+import tempfile
+import threading
 from pathlib import Path
 
 
@@ -195,6 +197,362 @@ def test_sample_files():
     
     return True
 
+def test_calibredb_output():
+    """Test matching calibredb add output to the files that were added."""
+    print("\n📚 Testing calibredb Output Parsing...")
+    
+    from format_readers import match_calibre_book_ids
+    
+    paths = ['/tmp/calibre_batch/0000_a.pdf', '/tmp/calibre_batch/0001_b.epub',
+             '/tmp/calibre_batch/0002_c.pdf']
+    
+    # As `calibredb add` prints it when the second book is a duplicate: the
+    # header and titles go to stderr, the duplicate's path to stdout
+    stdout = ("    /tmp/calibre_batch/0001_b.epub\n"
+              "Added book ids: 41, 42\n")
+    stderr = ("The following books were not added as they already exist in the database "
+              "(see --duplicates option or --automerge option):\n"
+              "  Existing Book\n")
+    
+    assert match_calibre_book_ids(paths, stdout) == [41, None, 42]
+    assert match_calibre_book_ids(paths, stdout + stderr) == [41, None, 42]
+    assert match_calibre_book_ids(paths, "Added book ids: 7, 5, 6\n") == [5, 6, 7]
+    assert match_calibre_book_ids(paths[:1], "Added book id: 9\n") == [9]
+    # Ids that cannot be matched to the files are not guessed at
+    assert match_calibre_book_ids(paths, "Added book ids: 41, 42\n") is None
+    print("  ✅ Book ids matched, duplicates recognised")
+    
+    return True
+
+def run_briefly(function, timeout=30):
+    """Run function in a thread; True if it returned within timeout seconds."""
+    thread = threading.Thread(target=function, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+def test_duplicate_policies():
+    """Test the delete, link and keep policies for re-downloaded files."""
+    print("\n🗂️  Testing Duplicate Policies...")
+    
+    from research_file_manager import ResearchFileManager
+    
+    with open('config.json', 'r') as f:
+        base_config = json.load(f)
+    
+    def make_manager(temp_dir, policy, move_files=True):
+        config = dict(base_config)
+        config['research_base_dir'] = str(Path(temp_dir) / 'library')
+        config['source_directories'] = []
+        config['zotero'] = {}
+        config['calibre'] = {**config.get('calibre', {}), 'enabled': False}
+        config['catalog'] = {'db_path': str(Path(temp_dir) / f"{policy}_{move_files}.db")}
+        config['auto_organization'] = {**config['auto_organization'], 'move_files': move_files}
+        config['deduplication'] = {'enabled': True, 'policy': policy}
+        config_path = Path(temp_dir) / 'config.json'
+        config_path.write_text(json.dumps(config))
+        return ResearchFileManager(str(config_path))
+    
+    for policy in ('delete', 'link', 'keep'):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manager = make_manager(temp_dir, policy)
+            content = os.urandom(4096)
+            original = Path(temp_dir) / 'notes.txt'
+            original.write_bytes(content)
+            assert manager.organize_file(original)
+            library_copy = next(Path(temp_dir, 'library').rglob('notes*.txt'))
+            
+            download = Path(temp_dir) / 'notes (1).txt'
+            download.write_bytes(content)
+            assert manager.organize_file(download)
+            if policy == 'delete':
+                assert not download.exists()
+            elif policy == 'link':
+                assert download.is_symlink() and download.resolve() == library_copy.resolve()
+            else:
+                assert download.read_bytes() == content and not download.is_symlink()
+            
+            # A library copy changed in place no longer matches its old hash
+            library_copy.write_bytes(os.urandom(4096))
+            again = Path(temp_dir) / 'notes (2).txt'
+            again.write_bytes(content)
+            assert manager.organize_file(again)
+            assert not again.exists() and not again.is_symlink()
+            assert any(path.read_bytes() == content for path in Path(temp_dir, 'library').rglob('*.txt'))
+            print(f"  ✅ {policy}: duplicate handled, edited library copy not trusted")
+    
+    # With move_files off the original the copy was made from is left alone
+    for policy in ('delete', 'link'):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manager = make_manager(temp_dir, policy, move_files=False)
+            original = Path(temp_dir) / 'draft.txt'
+            original.write_bytes(os.urandom(4096))
+            assert manager.organize_file(original)
+            assert manager.organize_file(original)
+            assert original.exists() and not original.is_symlink()
+            print(f"  ✅ {policy} with move_files off: original kept on rescan")
+    
+    return True
+
+def test_batch_course_detection():
+    """Test that batch course classification agrees with per-file detection."""
+    print("\n🎓 Testing Batch Course Detection...")
+    
+    import sys
+    scripts_dir = Path(__file__).parent / '~' / 'Documents' / 'Research'
+    sys.path.insert(0, str(scripts_dir))
+    from bulk_reorganize_files import classify_courses_batch
+    from intelligent_research_workflow import intelligent_course_detection
+    
+    with open(scripts_dir / 'config.json', 'r') as f:
+        config = json.load(f)
+    
+    filenames = ['EDSP505_notes.txt', 'behavioral_support_plan.txt', 'autism spectrum review.txt',
+                 'EDSP 554 autism intervention.txt', 'first nations education.txt', 'shopping.txt']
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_paths = []
+        for filename in filenames:
+            file_path = Path(temp_dir) / filename
+            file_path.write_text('')
+            file_paths.append(str(file_path))
+        
+        table = classify_courses_batch(file_paths, config, sample_chars=0)
+        for row, file_path in zip(table, file_paths):
+            single = intelligent_course_detection(file_path, config)
+            assert (row['course_name'], row['score'], row['confidence']) == \
+                (single['course_name'], single['score'], single['confidence']), \
+                (os.path.basename(file_path), row, single)
+            print(f"  ✅ {os.path.basename(file_path)}: {row['course_name']} "
+                  f"({row['score']}, {row['confidence']})")
+    
+    return True
+
+def test_course_matching():
+    """Test that overlapping course pattern matches are all counted."""
+    print("\n🔎 Testing Course Matching...")
+    
+    import sys
+    sys.path.insert(0, str(Path(__file__).parent / '~' / 'Documents' / 'Research'))
+    from enhanced_research_workflow import match_courses
+    
+    # 'edsp 505' and '505' overlap, and '554' and 'assessment' belong to another course
+    matched = match_courses('EDSP 505 behavior 554 assessment.pdf', {})
+    assert [(course['course_name'], course['score']) for course in matched] == \
+        [('EDSP 505', 3), ('EDSP 554', 2)], matched
+    print(f"  ✅ Overlapping matches counted: {matched}")
+    
+    # Patterns of different courses may overlap each other as well
+    config = {'course_patterns': {'Reading': [r'reading'], 'Reading Assessment': [r'reading\s*assessment']}}
+    matched = match_courses('reading assessment.pdf', config)
+    assert [course['course_name'] for course in matched] == ['Reading', 'Reading Assessment'], matched
+    print("  ✅ Courses with overlapping patterns both matched")
+    
+    return True
+
+def test_zotero_batcher():
+    """Test Zotero batch result mapping and retries against the local stand-in."""
+    print("\n📤 Testing Zotero Batch Uploads...")
+    
+    from pyzotero import zotero
+    from research_catalog import ResearchCatalog
+    from research_file_manager import ZoteroBatcher
+    from zotero_standin import ZoteroStandIn
+    
+    def make_client(standin):
+        client = zotero.Zotero('1', 'user', 'test')
+        client.endpoint = standin.url
+        return client
+    
+    def make_due(catalog):
+        with catalog.conn:
+            catalog.conn.execute("UPDATE zotero_spool SET next_attempt_at = 0")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        files = []
+        for number in range(3):
+            file_path = Path(temp_dir) / f"paper_{number}.pdf"
+            file_path.write_bytes(os.urandom(1024))
+            files.append(file_path)
+        
+        # Every item is created in one request and gets its file
+        standin = ZoteroStandIn()
+        standin.start()
+        try:
+            catalog = ResearchCatalog(Path(temp_dir) / 'batch.db')
+            batcher = ZoteroBatcher(make_client(standin), catalog)
+            for file_path in files:
+                catalog.enqueue_zotero_item(file_path, {'itemType': 'document', 'title': file_path.stem})
+            assert run_briefly(lambda: batcher._drain(force=True))
+            assert catalog.count_zotero_jobs() == 0
+            assert batcher.create_calls == 1
+            assert standin.stats['files_uploaded'] == 3
+            print("  ✅ Items created in one request and files attached")
+            
+            # Jobs missing from the response are rescheduled, not sent again at once
+            class SilentClient:
+                calls = 0
+                def create_items(self, items):
+                    SilentClient.calls += 1
+                    return {'success': {}, 'unchanged': {}, 'failed': {}}
+            batcher = ZoteroBatcher(SilentClient(), catalog)
+            for file_path in files:
+                catalog.enqueue_zotero_item(file_path, {'itemType': 'document', 'title': file_path.stem})
+            assert run_briefly(lambda: batcher._drain(force=True))
+            assert SilentClient.calls == 1
+            assert catalog.count_zotero_jobs() == 3 and not catalog.ready_zotero_jobs(10)
+            print("  ✅ Items missing from the response are retried later")
+            
+            # Failures count towards MAX_ATTEMPTS, then the job is dropped
+            for attempt in range(ZoteroBatcher.MAX_ATTEMPTS):
+                make_due(catalog)
+                assert run_briefly(lambda: batcher._drain(force=True))
+            assert catalog.count_zotero_jobs() == 0
+            print("  ✅ Failing items are given up on after MAX_ATTEMPTS")
+        finally:
+            standin.stop()
+        
+        # Attachment uploads that keep failing are given up on as well
+        standin = ZoteroStandIn(failure_rate=1.0)
+        standin.start()
+        try:
+            catalog = ResearchCatalog(Path(temp_dir) / 'attach.db')
+            batcher = ZoteroBatcher(make_client(standin), catalog)
+            job_id = catalog.enqueue_zotero_item(files[0], {'itemType': 'document', 'title': 'x'})
+            catalog.set_zotero_item_key(job_id, 'ABCD2345')
+            for attempt in range(ZoteroBatcher.MAX_ATTEMPTS):
+                make_due(catalog)
+                assert run_briefly(lambda: batcher._drain(force=True))
+            assert catalog.count_zotero_jobs() == 0
+            print("  ✅ Failing attachment uploads are given up on after MAX_ATTEMPTS")
+        finally:
+            standin.stop()
+    
+    return True
+
+def test_zotero_spool():
+    """Test the workflow scripts' Zotero spool: claims, recovery and retries."""
+    print("\n📥 Testing Zotero Upload Spool...")
+    
+    import sys
+    sys.path.insert(0, str(Path(__file__).parent / '~' / 'Documents' / 'Research'))
+    import zotero_spool
+    from zotero_standin import ZoteroStandIn
+    
+    standin = ZoteroStandIn()
+    standin.start()
+    original_upload = zotero_spool.upload_file
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool_dir = Path(temp_dir) / 'spool'
+            config = {'zotero': {'library_id': '1', 'api_key': 'test', 'library_type': 'user',
+                                 'api_base': standin.url, 'spool_dir': str(spool_dir)}}
+            file_path = Path(temp_dir) / 'paper.pdf'
+            file_path.write_bytes(os.urandom(2048))
+            
+            def queue_job(job_id):
+                job = {'id': job_id, 'file_path': str(file_path),
+                       'item_data': {'itemType': 'attachment', 'title': 'paper.pdf',
+                                     'filename': 'paper.pdf', 'tags': ['test']},
+                       'collection_key': None, 'item_key': None, 'attachment_key': None,
+                       'file_uploaded': False, 'attempts': 0, 'next_attempt_at': 0,
+                       'last_error': None, 'queued_at': '2024-01-01T00:00:00'}
+                zotero_spool.write_job(str(get_spool_dir() / f"{job_id}.json"), job)
+            
+            def get_spool_dir():
+                return Path(zotero_spool.get_spool_dir(config))
+            
+            def read_job(job_id):
+                with open(get_spool_dir() / f"{job_id}.json") as f:
+                    return json.load(f)
+            
+            def make_due(job_id):
+                job = read_job(job_id)
+                job['next_attempt_at'] = 0
+                zotero_spool.write_job(str(get_spool_dir() / f"{job_id}.json"), job)
+            
+            def failing_upload(transport, job):
+                raise KeyError('url')
+            
+            # An unexpected error keeps the created keys and releases the claim
+            queue_job('job1')
+            zotero_spool.upload_file = failing_upload
+            zotero_spool.drain_spool(config)
+            assert not list(get_spool_dir().glob('*.inflight'))
+            job = read_job('job1')
+            assert job['item_key'] and job['attachment_key'] and job['attempts'] == 1
+            print("  ✅ Failed job released with its item keys saved")
+            
+            # The retry only uploads the file; no second parent item is created
+            zotero_spool.upload_file = original_upload
+            make_due('job1')
+            assert zotero_spool.drain_spool(config) == (1, 0)
+            assert len(standin.items) == 2 and standin.stats['files_uploaded'] == 1
+            assert standin.items[job['attachment_key']]['data']['parentItem'] == job['item_key']
+            print("  ✅ Retry resumed after the created items")
+            
+            # A claim left by a run that died mid-job is recovered with its keys
+            queue_job('job2')
+            zotero_spool.upload_file = failing_upload
+            claim_path = get_spool_dir() / 'job2.json.inflight'
+            os.rename(get_spool_dir() / 'job2.json', claim_path)
+            claimed = json.loads(claim_path.read_text())
+            try:
+                zotero_spool.send_job(config, claimed,
+                                      save=lambda: zotero_spool.write_job(str(claim_path), claimed))
+            except KeyError:
+                pass
+            old = os.path.getmtime(claim_path) - zotero_spool.STALE_CLAIM_AGE - 1
+            os.utime(claim_path, (old, old))
+            zotero_spool.recover_stale_claims(config)
+            assert read_job('job2')['item_key'] == claimed['item_key']
+            zotero_spool.upload_file = original_upload
+            items_before = len(standin.items)
+            assert zotero_spool.drain_spool(config) == (1, 0)
+            assert len(standin.items) == items_before
+            print("  ✅ Stale claim recovered without creating items again")
+            
+            # Errors that keep coming back count towards MAX_ATTEMPTS
+            queue_job('job3')
+            zotero_spool.upload_file = failing_upload
+            for attempt in range(zotero_spool.MAX_ATTEMPTS):
+                if attempt:
+                    make_due('job3')
+                zotero_spool.drain_spool(config)
+            assert not list(get_spool_dir().iterdir())
+            print("  ✅ Job given up on after MAX_ATTEMPTS")
+    finally:
+        zotero_spool.upload_file = original_upload
+        standin.stop()
+    
+    return True
+
+def test_ingest_queue_full():
+    """Test that a full ingest queue defers files instead of blocking the observer."""
+    print("\n📥 Testing Full Ingest Queue...")
+    
+    from research_file_manager import IngestQueue
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # No workers are started, so nothing drains the queue of one slot
+        ingest_queue = IngestQueue(manager=None, workers=1, max_size=1, enqueue_timeout=0.1)
+        first, second = Path(temp_dir) / 'first.pdf', Path(temp_dir) / 'second.pdf'
+        for file_path in (first, second):
+            file_path.write_bytes(b'%PDF-1.4')
+        
+        assert run_briefly(lambda: ingest_queue.submit(first), timeout=5)
+        assert run_briefly(lambda: ingest_queue.submit(second), timeout=5), "submit blocked on a full queue"
+        assert ingest_queue._deferred == {second}
+        print("  ✅ Submit returns on a full queue and defers the file")
+        
+        ingest_queue.retry_deferred()
+        assert ingest_queue._deferred == {second}
+        assert ingest_queue.queue.get_nowait() == first
+        ingest_queue.retry_deferred()
+        assert not ingest_queue._deferred and ingest_queue.queue.get_nowait() == second
+        print("  ✅ Deferred file queued once there is room")
+    
+    return True
+
 def main():
     """Run all tests."""
     print("🧪 Research File Management System - System Test")
@@ -206,7 +564,14 @@ def main():
         ("Directories", test_directories),
         ("Configuration", test_config_file),
         ("Hazel Script", test_hazel_script),
-        ("Sample Files", test_sample_files)
+        ("Sample Files", test_sample_files),
+        ("calibredb Output", test_calibredb_output),
+        ("Duplicate Policies", test_duplicate_policies),
+        ("Batch Course Detection", test_batch_course_detection),
+        ("Course Matching", test_course_matching),
+        ("Zotero Batch Uploads", test_zotero_batcher),
+        ("Zotero Upload Spool", test_zotero_spool),
+        ("Full Ingest Queue", test_ingest_queue_full)
     ]
     
     results = []
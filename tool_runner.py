@@ -0,0 +1 @@
+~/Documents/Research/tool_runner.py
\ No newline at end of file
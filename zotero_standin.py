@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Local Zotero API Stand-in
+Serves the Zotero web API endpoints used by research_file_manager.py and the
+workflow scripts, so uploads can be tested and benchmarked offline. Latency,
+rate limiting (429 with Retry-After) and server failures can be injected.
+"""
+
+import json
+import logging
+import random
+import re
+import secrets
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+KEY_ALPHABET = string.ascii_uppercase + string.digits
+
+
+class ZoteroStandIn:
+    """In-memory Zotero library behind a local HTTP server."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, rate_limit_every: int = 0, retry_after: float = 1.0,
+                 failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+        self.items: Dict[str, Dict] = {}
+        self.files: Dict[str, Dict] = {}
+        self.collections: Dict[str, list] = {}
+        self.pending_uploads: Dict[str, Dict] = {}
+        self.version = 0
+        self.stats = {'requests': 0, 'rate_limited': 0, 'failed': 0,
+                      'items_created': 0, 'files_uploaded': 0, 'bytes_uploaded': 0}
+        self._lock = threading.Lock()
+
+        handler = type('Handler', (StandInHandler,), {'standin': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as zotero.api_base."""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        """Serve in a background thread and return the base URL."""
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        name='zotero-standin', daemon=True)
+        self._thread.start()
+        logger.info(f"Zotero stand-in listening on {self.url}")
+        return self.url
+
+    def stop(self):
+        """Shut the server down."""
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def new_key(self) -> str:
+        return ''.join(self.random.choice(KEY_ALPHABET) for _ in range(8))
+
+    def next_version(self) -> int:
+        with self._lock:
+            self.version += 1
+            return self.version
+
+    def count(self, stat: str, amount: int = 1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    def injected_fault(self) -> Optional[int]:
+        """Decide whether this request is rate limited (429) or fails (500)."""
+        with self._lock:
+            self.stats['requests'] += 1
+            number = self.stats['requests']
+
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        if self.rate_limit_every and number % self.rate_limit_every == 0:
+            self.count('rate_limited')
+            return 429
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            self.count('failed')
+            return 500
+        return None
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Routes requests by path suffix; the /users/<id> or /groups/<id> prefix is ignored."""
+
+    protocol_version = 'HTTP/1.1'
+    standin: ZoteroStandIn = None
+
+    ITEM_FILE = re.compile(r'/items/([A-Z0-9]{8})/file$')
+    ITEM = re.compile(r'/items/([A-Z0-9]{8})$')
+    COLLECTION_ITEMS = re.compile(r'/collections/([A-Z0-9]{8})/items$')
+    STORAGE = re.compile(r'^/storage/(\w+)$')
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _handle(self, method: str):
+        url = urlsplit(self.path)
+        path = url.path
+        # File bodies are only counted, not kept in memory
+        body = self._read_body(keep=not self.STORAGE.match(path))
+
+        fault = self.standin.injected_fault()
+        if fault == 429:
+            return self._reply(429, {'error': 'Too many requests'},
+                               {'Retry-After': str(self.standin.retry_after)})
+        if fault:
+            return self._reply(fault, {'error': 'Injected failure'})
+
+        if method == 'GET' and path.endswith('/items/new'):
+            return self._item_template(parse_qs(url.query))
+        if method == 'GET' and path.endswith('/items'):
+            limit = int(parse_qs(url.query).get('limit', ['25'])[0])
+            return self._reply(200, list(self.standin.items.values())[:limit])
+        if method == 'POST' and self.ITEM_FILE.search(path):
+            return self._item_file(self.ITEM_FILE.search(path).group(1), parse_qs(body.decode()))
+        if method == 'POST' and self.STORAGE.match(path):
+            return self._storage_upload(self.STORAGE.match(path).group(1), body)
+        if method == 'POST' and self.COLLECTION_ITEMS.search(path):
+            collection = self.standin.collections.setdefault(
+                self.COLLECTION_ITEMS.search(path).group(1), [])
+            collection.extend(json.loads(body or b'[]'))
+            return self._reply(204)
+        if method == 'POST' and path.endswith('/items'):
+            return self._create_items(json.loads(body or b'null'))
+        if method == 'DELETE' and self.ITEM.search(path):
+            self.standin.items.pop(self.ITEM.search(path).group(1), None)
+            return self._reply(204)
+
+        self._reply(404, {'error': f"Not implemented: {method} {path}"})
+
+    def _read_body(self, keep: bool = True):
+        length = int(self.headers.get('Content-Length') or 0)
+        if keep:
+            return self.rfile.read(length) if length else b''
+
+        remaining = length
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        return length - remaining
+
+    def _reply(self, status: int, payload=None, headers: Optional[Dict] = None):
+        data = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Last-Modified-Version', str(self.standin.version))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _item_template(self, query: Dict):
+        template = {'itemType': query.get('itemType', ['document'])[0], 'title': '',
+                    'tags': [], 'collections': [], 'relations': {}}
+        if template['itemType'] == 'attachment':
+            template.update({'linkMode': query.get('linkMode', ['imported_file'])[0],
+                             'contentType': '', 'charset': '', 'filename': '',
+                             'md5': None, 'mtime': None})
+        self._reply(200, template)
+
+    def _create_items(self, payload):
+        # Like api.zotero.org: only an array of at most 50 items is accepted,
+        # and the reply is the per-index result maps, never the item itself
+        if not isinstance(payload, list):
+            return self._reply(400, {'error': 'Uploaded data must be a JSON array'})
+        if len(payload) > 50:
+            return self._reply(413, {'error': 'Only 50 objects can be written in a single request'})
+        version = self.standin.next_version()
+
+        success, successful, failed = {}, {}, {}
+        for index, data in enumerate(payload):
+            if not isinstance(data, dict) or 'itemType' not in data:
+                failed[str(index)] = {'key': None, 'code': 400, 'message': "'itemType' property not provided"}
+                continue
+            error = self._item_error(data)
+            if error:
+                failed[str(index)] = {'key': None, 'code': 400, 'message': error}
+                continue
+            key = self.standin.new_key()
+            record = {'key': key, 'version': version, 'data': {**data, 'key': key, 'version': version}}
+            self.standin.items[key] = record
+            success[str(index)] = key
+            successful[str(index)] = record
+        self.standin.count('items_created', len(success))
+
+        self._reply(200, {'success': success, 'successful': successful,
+                          'unchanged': {}, 'failed': failed})
+
+    def _item_error(self, data: Dict) -> Optional[str]:
+        # Attachment rules api.zotero.org enforces
+        parent_key = data.get('parentItem')
+        if parent_key:
+            parent = self.standin.items.get(parent_key)
+            if parent is None:
+                return f"Parent item {parent_key} not found"
+            if parent['data'].get('itemType') in ('attachment', 'note'):
+                return 'Parent item cannot be a note or attachment'
+        if data['itemType'] == 'attachment' and 'linkMode' not in data:
+            return "'linkMode' property not provided"
+        return None
+
+    def _item_file(self, item_key: str, form: Dict):
+        if item_key not in self.standin.items:
+            return self._reply(404, {'error': f"Item {item_key} not found"})
+        if self.standin.items[item_key]['data'].get('itemType') != 'attachment':
+            return self._reply(400, {'error': 'Item is not an attachment'})
+
+        if 'upload' in form:
+            # Step 3: register a finished upload
+            upload = self.standin.pending_uploads.pop(form['upload'][0], None)
+            if not upload or not upload.get('received'):
+                return self._reply(400, {'error': 'Upload key not found or upload incomplete'})
+            self.standin.files[item_key] = upload
+            self.standin.next_version()
+            return self._reply(204)
+
+        # Step 1: authorize an upload
+        md5 = form.get('md5', [''])[0]
+        if self.standin.files.get(item_key, {}).get('md5') == md5:
+            return self._reply(200, {'exists': 1})
+
+        upload_key = secrets.token_hex(16)
+        self.standin.pending_uploads[upload_key] = {
+            'md5': md5, 'filename': form.get('filename', [''])[0],
+            'filesize': int(form.get('filesize', ['0'])[0])
+        }
+        url = f"{self.standin.url}/storage/{upload_key}"
+        if 'params' in form:
+            # pyzotero asks for multipart form parameters
+            return self._reply(200, {'url': url, 'params': {'key': upload_key},
+                                     'uploadKey': upload_key})
+        boundary = f"---------------------------{upload_key[:16]}"
+        self._reply(200, {
+            'url': url,
+            'contentType': f"multipart/form-data; boundary={boundary}",
+            'prefix': f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"\r\n\r\n",
+            'suffix': f"\r\n--{boundary}--",
+            'uploadKey': upload_key
+        })
+
+    def _storage_upload(self, upload_key: str, received: int):
+        # Step 2: the file itself, as the storage service would receive it
+        upload = self.standin.pending_uploads.get(upload_key)
+        if upload is None:
+            return self._reply(403, {'error': 'Unknown upload'})
+        upload['received'] = received
+        self.standin.count('files_uploaded')
+        self.standin.count('bytes_uploaded', received)
+        self._reply(201)
+
+
+def main():
+    """Run the stand-in until interrupted."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Local Zotero API stand-in')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8085, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency, up to this many seconds')
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help='Answer every Nth request with 429 (0 = never)')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After sent with 429 responses')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    standin = ZoteroStandIn(args.host, args.port, args.latency, args.jitter,
+                            args.rate_limit_every, args.retry_after, args.failure_rate)
+    standin.start()
+    logger.info(f'Set "api_base": "{standin.url}" in the zotero config section to use it')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info(f"Stopping, stats: {standin.stats}")
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,41 @@ Bulk File Reorganization Script
 Analyzes and reorganizes all existing files in your system.
 """
 
+import csv
 import os
 import sys
 import json
 import shutil
 from pathlib import Path
 from datetime import datetime
+from format_readers import read_image_header
+from intelligent_research_workflow import VERY_HIGH_SCORE, get_course_matcher, sample_file_content
 
-def analyze_and_reorganize_files(base_directory):
-    """Analyze and reorganize all files in the given directory."""
+# Files that can belong to a course
+DOCUMENT_EXTENSIONS = ['.pdf', '.doc', '.docx', '.rtf', '.txt', '.md']
+
+# Batch classification: the score each confidence tier needs, as in
+# intelligent_course_detection
+CONFIDENCE_TIERS = [(VERY_HIGH_SCORE, 'very_high'), (10, 'high'), (5, 'medium')]
+
+def iter_files(base_directory):
+    """Yield the paths of all non-hidden files, skipping tool and VCS directories."""
+    for root, dirs, files in os.walk(base_directory):
+        # Skip certain directories
+        if any(skip_dir in root for skip_dir in ['.git', 'node_modules', '__pycache__', '.DS_Store']):
+            continue
+            
+        for file in files:
+            if file.startswith('.'):  # Skip hidden files
+                continue
+            yield os.path.join(root, file)
+
+def analyze_and_reorganize_files(base_directory, batch=False, sample_chars=1000, table_path=None):
+    """Analyze and reorganize all files in the given directory.
+    
+    In batch mode all documents are assigned to courses up front in one
+    vectorized pass (see classify_courses_batch) instead of file by file.
+    """
     try:
         print(f"🔍 Analyzing files in: {base_directory}")
         
@@ -28,38 +54,39 @@ def analyze_and_reorganize_files(base_directory):
             'file_types': {}
         }
         
+        course_assignments = {}
+        if batch:
+            documents = [file_path for file_path in iter_files(base_directory)
+                         if Path(file_path).suffix.lower() in DOCUMENT_EXTENSIONS]
+            table = classify_courses_batch(documents, config, sample_chars)
+            if table is None:
+                return
+            print_assignment_table(table, table_path)
+            course_assignments = {row['file_path']: row for row in table}
+        
         # Walk through all files
-        for root, dirs, files in os.walk(base_directory):
-            # Skip certain directories
-            if any(skip_dir in root for skip_dir in ['.git', 'node_modules', '__pycache__', '.DS_Store']):
-                continue
-                
-            for file in files:
-                if file.startswith('.'):  # Skip hidden files
-                    continue
+        for file_path in iter_files(base_directory):
+            stats['total_files'] += 1
+            
+            # Determine file type
+            file_type = get_file_type(file_path)
+            if file_type not in stats['file_types']:
+                stats['file_types'][file_type] = 0
+            stats['file_types'][file_type] += 1
+            
+            print(f"📁 Processing: {file_path}")
+            
+            try:
+                # Process the file
+                if process_existing_file(file_path, config, course_assignments.get(file_path)):
+                    stats['processed_files'] += 1
+                    stats['moved_files'] += 1
+                else:
+                    stats['processed_files'] += 1
                     
-                file_path = os.path.join(root, file)
-                stats['total_files'] += 1
-                
-                # Determine file type
-                file_type = get_file_type(file_path)
-                if file_type not in stats['file_types']:
-                    stats['file_types'][file_type] = 0
-                stats['file_types'][file_type] += 1
-                
-                print(f"📁 Processing: {file_path}")
-                
-                try:
-                    # Process the file
-                    if process_existing_file(file_path, config):
-                        stats['processed_files'] += 1
-                        stats['moved_files'] += 1
-                    else:
-                        stats['processed_files'] += 1
-                        
-                except Exception as e:
-                    print(f"❌ Error processing {file_path}: {e}")
-                    stats['errors'] += 1
+            except Exception as e:
+                print(f"❌ Error processing {file_path}: {e}")
+                stats['errors'] += 1
         
         # Print summary
         print_summary(stats)
@@ -67,14 +94,18 @@ def analyze_and_reorganize_files(base_directory):
     except Exception as e:
         print(f"❌ Error during bulk reorganization: {e}")
 
-def process_existing_file(file_path, config):
-    """Process a single existing file and move it to correct location."""
+def process_existing_file(file_path, config, course_info=None):
+    """Process a single existing file and move it to correct location.
+    
+    course_info is a precomputed course assignment (batch mode); without
+    one the course is detected from the filename.
+    """
     try:
         filename = os.path.basename(file_path)
         extension = Path(file_path).suffix.lower()
         
         # Determine where this file should go
-        target_location = determine_target_location(file_path, config)
+        target_location = determine_target_location(file_path, config, course_info)
         
         if target_location and target_location != os.path.dirname(file_path):
             # File needs to be moved
@@ -104,15 +135,16 @@ def process_existing_file(file_path, config):
         print(f"❌ Error processing file {file_path}: {e}")
         return False
 
-def determine_target_location(file_path, config):
+def determine_target_location(file_path, config, course_info=None):
     """Determine where a file should be located based on its content and type."""
     try:
         filename = os.path.basename(file_path)
         extension = Path(file_path).suffix.lower()
         
         # Check if it's a research document with course context
-        if extension in ['.pdf', '.doc', '.docx', '.rtf', '.txt', '.md']:
-            course_info = detect_course_context(filename, config)
+        if extension in DOCUMENT_EXTENSIONS:
+            if course_info is None:
+                course_info = detect_course_context(filename, config)
             if course_info and course_info['course_name'] != 'General Research':
                 # Course-specific organization
                 year = datetime.now().year
@@ -121,7 +153,7 @@ def determine_target_location(file_path, config):
         
         # Type-based organization
         if extension in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.svg', '.heic']:
-            date_folder = datetime.now().strftime('%Y/%m')
+            date_folder = image_capture_date(file_path).strftime('%Y/%m')
             target_dir = os.path.expanduser(f'~/Documents/Research/Archives/By_Type/Images/{date_folder}')
             return target_dir
             
@@ -162,6 +194,16 @@ def determine_target_location(file_path, config):
         print(f"⚠️ Error determining target location: {e}")
         return None
 
+def image_capture_date(file_path):
+    """When an image was taken: EXIF capture date if present, else the file's modification time."""
+    try:
+        capture_date = read_image_header(file_path).get('capture_date')
+        if capture_date:
+            return capture_date
+    except Exception as e:
+        print(f"⚠️ Could not read image header of {os.path.basename(file_path)}: {e}")
+    return datetime.fromtimestamp(os.path.getmtime(file_path))
+
 def detect_course_context(filename, config):
     """Detect course context from filename."""
     try:
@@ -194,11 +236,139 @@ def detect_course_context(filename, config):
         print(f"⚠️ Error detecting course context: {e}")
         return None
 
+def course_term_weights(matcher):
+    """Vocabulary of course terms, and the points each term gives each course.
+    
+    The terms and points are those of the per-file detector's CourseMatcher
+    (course code, course number, title words and keywords), so a document
+    scores the same in both.
+    """
+    courses = list(matcher.course_terms)
+    vocabulary = {}
+    weights = []
+    for course_index, course_code in enumerate(courses):
+        terms, _ = matcher.course_terms[course_code]
+        for term, points, _ in terms:
+            if not term:
+                continue
+            if term not in vocabulary:
+                vocabulary[term] = len(weights)
+                weights.append([0] * len(courses))
+            weights[vocabulary[term]][course_index] += points
+    return courses, vocabulary, weights
+
+def sample_text(file_path, sample_chars):
+    """The first sample_chars characters of a document's text, read progressively."""
+    if sample_chars <= 0:
+        return ''
+    pieces = []
+    remaining = sample_chars
+    for piece in sample_file_content(file_path):
+        pieces.append(piece[:remaining])
+        remaining -= len(pieces[-1])
+        if remaining <= 0:
+            break
+    return ''.join(pieces)
+
+def classify_courses_batch(file_paths, config, sample_chars=1000):
+    """Assign every document to a course in one vectorized pass.
+    
+    The course terms found in each filename and up to sample_chars of its
+    text form a sparse binary term-document matrix; multiplying it by the
+    course weight matrix scores every file against every course at once.
+    Terms are found as substrings with intelligent_course_detection's
+    CourseMatcher, so scores and tiers match the per-file detector for the
+    same text. The per-file detector may read more text (until a course
+    reaches the very_high tier); batch mode reads sample_chars. Returns
+    one row per file with course_name, course_title, collection_key, score
+    and confidence (very_high, high, medium or low, where low means General
+    Research), or None if NumPy/SciPy are not installed.
+    """
+    try:
+        import numpy as np
+        from scipy import sparse
+    except ImportError:
+        print("❌ Batch mode needs NumPy and SciPy: pip install numpy scipy")
+        return None
+    
+    course_details = config.get('course_details', {})
+    matcher = get_course_matcher(config)
+    courses, vocabulary, weights = course_term_weights(matcher)
+    print(f"🧮 Scoring {len(file_paths)} documents against {len(courses)} courses "
+          f"({len(vocabulary)} terms)")
+    
+    # Column indices of the course terms found in each document
+    rows, columns = [], []
+    for row, file_path in enumerate(file_paths):
+        text = f"{os.path.basename(file_path)} "
+        if sample_chars:
+            try:
+                text += sample_text(file_path, sample_chars)
+            except Exception as e:
+                print(f"⚠️ Could not sample {os.path.basename(file_path)}: {e}")
+        for term in matcher.find_terms(text.lower()):
+            rows.append(row)
+            columns.append(vocabulary[term])
+    
+    documents = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, columns)),
+        shape=(len(file_paths), len(vocabulary)), dtype=np.int32)
+    scores = documents @ np.array(weights, dtype=np.int32).reshape(len(vocabulary), len(courses))
+    scores = np.asarray(scores)
+    
+    if courses:
+        # argmax keeps the first course on ties, like max() over the config order
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(file_paths)), best]
+    else:
+        best = np.zeros(len(file_paths), dtype=int)
+        best_scores = np.zeros(len(file_paths), dtype=int)
+    confidence = np.select([best_scores >= threshold for threshold, _ in CONFIDENCE_TIERS],
+                           [tier for _, tier in CONFIDENCE_TIERS], default='low')
+    
+    table = []
+    for file_path, course_index, score, tier in zip(file_paths, best.tolist(),
+                                                    best_scores.tolist(), confidence.tolist()):
+        if tier == 'low':
+            course_name, course_data = 'General Research', {'title': 'General Research'}
+        else:
+            course_name = courses[course_index]
+            course_data = course_details[course_name]
+        table.append({
+            'file_path': file_path,
+            'course_name': course_name,
+            'course_title': course_data.get('title', course_name),
+            'collection_key': course_data.get('collection_key'),
+            'score': score,
+            'confidence': tier
+        })
+    return table
+
+def print_assignment_table(table, table_path=None):
+    """Print the course assignment of every document, and save it as CSV if a path is given."""
+    print("\n📋 Course assignments:")
+    for row in table:
+        print(f"   {row['course_name']:<18} {row['confidence']:<10} {row['score']:>4}  "
+              f"{os.path.basename(row['file_path'])}")
+    
+    tiers = {}
+    for row in table:
+        tiers[row['confidence']] = tiers.get(row['confidence'], 0) + 1
+    print(f"📊 {len(table)} documents: " + ', '.join(f"{tier} {count}" for tier, count in tiers.items()))
+    
+    if table_path:
+        with open(os.path.expanduser(table_path), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['file_path', 'course_name', 'course_title',
+                                                   'collection_key', 'score', 'confidence'])
+            writer.writeheader()
+            writer.writerows(table)
+        print(f"💾 Saved course assignments to: {table_path}")
+
 def get_file_type(file_path):
     """Get the type/category of a file."""
     extension = Path(file_path).suffix.lower()
     
-    if extension in ['.pdf', '.doc', '.docx', '.rtf', '.txt', '.md']:
+    if extension in DOCUMENT_EXTENSIONS:
         return 'Documents'
     elif extension in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.svg', '.heic']:
         return 'Images'
@@ -272,15 +442,38 @@ def print_summary(stats):
     print("3. Enjoy automatic future organization!")
 
 def main():
-    """Main function."""
-    if len(sys.argv) > 1:
-        base_directory = sys.argv[1]
+    """Main function.
+    
+    Usage: bulk_reorganize_files.py [--batch] [--sample-chars N] [--table FILE.csv] [directory]
+    """
+    args = sys.argv[1:]
+    batch = '--batch' in args
+    sample_chars = 1000
+    table_path = None
+    positional = []
+    index = 0
+    while index < len(args):
+        if args[index] == '--sample-chars' and index + 1 < len(args):
+            sample_chars = int(args[index + 1])
+            index += 1
+        elif args[index] == '--table' and index + 1 < len(args):
+            table_path = args[index + 1]
+            index += 1
+        elif args[index] != '--batch':
+            positional.append(args[index])
+        index += 1
+    
+    if positional:
+        base_directory = positional[0]
     else:
         base_directory = os.path.expanduser('~/Documents/Research')
     
     print("🚀 Bulk File Reorganization Tool")
     print("="*50)
     print(f"Target directory: {base_directory}")
+    if batch:
+        print(f"Batch mode: documents are assigned to courses up front "
+              f"(filenames and {sample_chars} characters of text)")
     print("This will analyze and reorganize all files in the directory.")
     
     response = input("\nContinue? (y/N): ").strip().lower()
@@ -288,7 +481,8 @@ def main():
         print("Operation cancelled.")
         return
     
-    analyze_and_reorganize_files(base_directory)
+    analyze_and_reorganize_files(base_directory, batch=batch, sample_chars=sample_chars,
+                                 table_path=table_path)
 
 if __name__ == "__main__":
     main()
@@ -7,10 +7,10 @@ Automatically categorizes research files into Zotero collections based on course
 import os
 import sys
 import json
-import requests
 import re
 from pathlib import Path
 from datetime import datetime
+from zotero_spool import enqueue_upload, drain_spool, wait_for_uploads
 
 def process_research_file(file_path):
     """Process a single research file through the enhanced workflow."""
@@ -28,14 +28,14 @@ def process_research_file(file_path):
         # Determine course context and collection
         course_info = determine_course_context(file_path, config)
         
-        # Upload to Zotero with proper collection
-        zotero_id = upload_to_zotero(file_path, config, course_info)
-        
         # Organize file into course-specific folder
         organized_path = organize_file_by_course(file_path, course_info)
         
+        # Queue the Zotero upload with proper collection (sent in the background)
+        zotero_job_id = upload_to_zotero(organized_path or file_path, config, course_info)
+        
         # Create enhanced research summary
-        create_research_summary(file_path, course_info, zotero_id)
+        create_research_summary(file_path, course_info, zotero_job_id)
         
         print(f"✅ Successfully processed: {file_path}")
         print(f"📚 Course: {course_info['course_name']}")
@@ -46,48 +46,89 @@ def process_research_file(file_path):
         print(f"❌ Error processing research file {file_path}: {e}")
         return False
 
+# Filename patterns per course, used when config.json has no course_patterns
+DEFAULT_COURSE_PATTERNS = {
+    'EDSP 505': [
+        r'edsp\s*505', r'505', r'behavior', r'classroom', r'management',
+        r'discipline', r'intervention', r'positive\s*behavior'
+    ],
+    'EDSP 554': [
+        r'edsp\s*554', r'554', r'assessment', r'evaluation', r'measurement',
+        r'testing', r'data\s*collection', r'progress\s*monitoring'
+    ],
+    'EDSP 552': [
+        r'edsp\s*552', r'552', r'curriculum', r'instruction', r'teaching',
+        r'lesson\s*plan', r'educational\s*materials', r'pedagogy'
+    ],
+    'EDCX 513': [
+        r'edcx\s*513', r'513', r'research', r'methodology', r'statistics',
+        r'analysis', r'literature\s*review', r'academic\s*writing'
+    ]
+}
+
+# One compiled regex per course and the patterns they were built from;
+# rebuilt only when the configured patterns change
+course_regexes = []
+course_regex_patterns = None
+
+def compile_course_patterns(course_patterns):
+    """Compile each course's patterns into one lookahead regex, in configured order.
+    
+    The lookahead lets a match start at every position, so overlapping texts
+    such as 'edsp 505' and '505' are each found.
+    """
+    return [(course_name, re.compile(f"(?=({'|'.join(patterns)}))", re.IGNORECASE))
+            for course_name, patterns in course_patterns.items() if patterns]
+
+def match_courses(filename, config):
+    """All courses whose patterns occur in a filename, best first.
+    
+    Each course's precompiled pattern scans the filename on its own, so one
+    course's match never hides another's. A course scores a point for each
+    different text its patterns match; ties keep the configured order.
+    """
+    global course_regexes, course_regex_patterns
+    course_patterns = config.get('course_patterns') or DEFAULT_COURSE_PATTERNS
+    if course_patterns is not course_regex_patterns and course_patterns != course_regex_patterns:
+        course_regexes = compile_course_patterns(course_patterns)
+        course_regex_patterns = course_patterns
+    
+    matched = []
+    for course_name, course_regex in course_regexes:
+        texts = {match.group(1).lower() for match in course_regex.finditer(filename)}
+        if texts:
+            matched.append({'course_name': course_name, 'score': len(texts)})
+    
+    # sort is stable, so ties keep the configured order
+    matched.sort(key=lambda course: -course['score'])
+    return matched
+
 def determine_course_context(file_path, config):
     """Determine which course the file belongs to based on filename and content."""
     filename = os.path.basename(file_path).lower()
     
-    # Course detection patterns
-    course_patterns = {
-        'EDSP 505': [
-            r'edsp\s*505', r'505', r'behavior', r'classroom', r'management',
-            r'discipline', r'intervention', r'positive\s*behavior'
-        ],
-        'EDSP 554': [
-            r'edsp\s*554', r'554', r'assessment', r'evaluation', r'measurement',
-            r'testing', r'data\s*collection', r'progress\s*monitoring'
-        ],
-        'EDSP 552': [
-            r'edsp\s*552', r'552', r'curriculum', r'instruction', r'teaching',
-            r'lesson\s*plan', r'educational\s*materials', r'pedagogy'
-        ],
-        'EDCX 513': [
-            r'edcx\s*513', r'513', r'research', r'methodology', r'statistics',
-            r'analysis', r'literature\s*review', r'academic\s*writing'
-        ]
-    }
-    
     # Check filename for course indicators
-    for course_name, patterns in course_patterns.items():
-        for pattern in patterns:
-            if re.search(pattern, filename, re.IGNORECASE):
-                collection_key = config['zotero']['collections'][course_name]
-                return {
-                    'course_name': course_name,
-                    'collection_key': collection_key,
-                    'collection_name': course_name,
-                    'confidence': 'high'
-                }
+    matched_courses = match_courses(filename, config)
+    if matched_courses:
+        course_name = matched_courses[0]['course_name']
+        collection_key = config['zotero']['collections'][course_name]
+        return {
+            'course_name': course_name,
+            'collection_key': collection_key,
+            'collection_name': course_name,
+            'confidence': 'high',
+            'score': matched_courses[0]['score'],
+            'matched_courses': matched_courses
+        }
     
     # If no specific course detected, use default collection
     return {
         'course_name': 'General Research',
         'collection_key': None,
         'collection_name': 'General Research',
-        'confidence': 'low'
+        'confidence': 'low',
+        'score': 0,
+        'matched_courses': []
     }
 
 def upload_to_zotero(file_path, config, course_info):
@@ -97,16 +138,6 @@ def upload_to_zotero(file_path, config, course_info):
             print("ℹ️ Zotero integration disabled")
             return None
         
-        api_key = config['zotero']['api_key']
-        library_id = config['zotero']['library_id']
-        library_type = config['zotero']['library_type']
-        
-        base_url = f"https://api.zotero.org/{library_type}s/{library_id}"
-        headers = {
-            'Zotero-API-Key': api_key,
-            'Content-Type': 'application/json'
-        }
-        
         # Prepare item data with course context
         filename = os.path.basename(file_path)
         item_data = {
@@ -129,55 +160,16 @@ def upload_to_zotero(file_path, config, course_info):
                 'education'
             ])
         
-        print(f"📤 Uploading to Zotero: {filename}")
+        print(f"📤 Queuing Zotero upload: {filename}")
         print(f"🏷️ Course: {course_info['course_name']}")
         
-        # Create the item
-        item_response = requests.post(
-            f"{base_url}/items",
-            headers=headers,
-            json=item_data
-        )
-        
-        if item_response.status_code != 200:
-            print(f"❌ Failed to create Zotero item: {item_response.text}")
-            return None
-        
-        item = item_response.json()
-        item_key = item['key']
-        
-        # Upload the file attachment
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
-        
-        file_response = requests.post(
-            f"{base_url}/items/{item_key}/file",
-            headers={'Zotero-API-Key': api_key},
-            data=file_data
-        )
-        
-        if file_response.status_code != 200:
-            print(f"❌ Failed to upload file to Zotero: {file_response.text}")
-            return None
-        
-        # Add to specific collection if course was detected
-        if course_info['collection_key']:
-            collection_response = requests.post(
-                f"{base_url}/collections/{course_info['collection_key']}/items",
-                headers=headers,
-                json=[item_key]
-            )
-            
-            if collection_response.status_code == 200:
-                print(f"✅ Added to {course_info['course_name']} collection")
-            else:
-                print(f"⚠️ Could not add to collection: {collection_response.status_code}")
-        
-        print(f"✅ Successfully uploaded to Zotero: {item_key}")
-        return item_key
+        # Queue the upload; the collection is assigned once the item exists
+        job_id = enqueue_upload(config, file_path, item_data, course_info['collection_key'])
+        print(f"📥 Queued for Zotero upload: {job_id}")
+        return job_id
         
     except Exception as e:
-        print(f"⚠️ Error uploading to Zotero: {e}")
+        print(f"⚠️ Error queuing Zotero upload: {e}")
         return None
 
 def organize_file_by_course(file_path, course_info):
@@ -232,7 +224,7 @@ def generate_organized_filename(filename):
     
     return f"{base_name}{extension}"
 
-def create_research_summary(file_path, course_info, zotero_id=None):
+def create_research_summary(file_path, course_info, zotero_job_id=None):
     """Create an enhanced research summary with course context."""
     try:
         summary_dir = os.path.expanduser('~/Documents/Research/Research_Summaries')
@@ -245,7 +237,7 @@ def create_research_summary(file_path, course_info, zotero_id=None):
             'timestamp': timestamp,
             'original_file': file_path,
             'course_info': course_info,
-            'zotero_item_id': zotero_id,
+            'zotero_upload_job': zotero_job_id,
             'processing_status': 'completed',
             'auto_categorization': True
         }
@@ -290,11 +282,16 @@ def main():
                 # Process a specific file
                 file_path = sys.argv[2]
                 success = process_research_file(file_path)
+                wait_for_uploads(load_config())
                 if success:
                     print(f"✅ Successfully processed: {file_path}")
                 else:
                     print(f"❌ Failed to process: {file_path}")
                     sys.exit(1)
+            elif sys.argv[1] == '--drain-spool':
+                # Send queued Zotero uploads that are due
+                sent, pending = drain_spool(load_config())
+                print(f"📤 Sent {sent} Zotero uploads, {pending} still queued")
             elif sys.argv[1] == '--help':
                 print_help()
             else:
@@ -313,6 +310,7 @@ def main():
             if choice == '1':
                 file_path = input("Enter file path: ").strip()
                 success = process_research_file(file_path)
+                wait_for_uploads(load_config())
                 if success:
                     print(f"✅ Successfully processed: {file_path}")
                 else:
@@ -334,6 +332,7 @@ def print_help():
     print("=" * 60)
     print("Usage:")
     print("  python enhanced_research_workflow.py --process <file_path>")
+    print("  python enhanced_research_workflow.py --drain-spool")
     print("  python enhanced_research_workflow.py --help")
     print("  python enhanced_research_workflow.py (interactive mode)")
     print("\nEnhanced Features:")
@@ -0,0 +1,1112 @@
+#!/usr/bin/env python3
+"""
+Format Readers - lightweight metadata readers for common research file formats
+
+Each reader opens only the part of a file that holds the metadata, instead
+of loading the whole document through a general-purpose library, so time
+and memory stay flat however long the document is.
+"""
+
+import itertools
+import json
+import logging
+import os
+import posixpath
+import re
+import select
+import struct
+import subprocess
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from fractions import Fraction
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+
+# Office Open XML (.docx, .pptx, .xlsx) namespaces
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+CP_NS = '{http://schemas.openxmlformats.org/package/2006/metadata/core-properties}'
+DC_NS = '{http://purl.org/dc/elements/1.1/}'
+DCTERMS_NS = '{http://purl.org/dc/terms/}'
+PACKAGE_RELS_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+CORE_PROPERTIES_TYPE = ('http://schemas.openxmlformats.org/package/2006/relationships/'
+                        'metadata/core-properties')
+
+# Core property elements and the keys extract_docx_metadata has always used
+CORE_PROPERTIES = {
+    f'{DC_NS}title': 'title',
+    f'{DC_NS}creator': 'author',
+    f'{DC_NS}subject': 'subject',
+    f'{CP_NS}keywords': 'keywords',
+    f'{DCTERMS_NS}created': 'created',
+    f'{DCTERMS_NS}modified': 'modified',
+    f'{CP_NS}revision': 'revision'
+}
+
+# Run content and its text, as python-docx renders Paragraph.text
+RUN_TEXT = {
+    f'{W_NS}tab': '\t',
+    f'{W_NS}ptab': '\t',
+    f'{W_NS}cr': '\n',
+    f'{W_NS}noBreakHyphen': '-'
+}
+
+
+def _core_properties_part(package: zipfile.ZipFile) -> str:
+    """Name of the core properties part, from the package relationships."""
+    try:
+        rels = ElementTree.fromstring(package.read('_rels/.rels'))
+        for rel in rels.iter(f'{PACKAGE_RELS_NS}Relationship'):
+            if rel.get('Type') == CORE_PROPERTIES_TYPE:
+                return posixpath.normpath(rel.get('Target', '').lstrip('/'))
+    except (KeyError, ElementTree.ParseError):
+        pass
+    return 'docProps/core.xml'
+
+
+def _parse_w3cdtf(value: str):
+    """Parse a W3CDTF date such as 2024-03-01T10:00:00Z into a UTC datetime, like python-docx."""
+    parsed = None
+    for pattern in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d', '%Y-%m', '%Y'):
+        try:
+            parsed = datetime.strptime(value[:19], pattern)
+            break
+        except ValueError:
+            continue
+    if parsed is None:
+        return None
+
+    # A numeric offset such as -08:00 after the seconds
+    offset = value[19:]
+    if len(offset) == 6 and offset[0] in '+-':
+        try:
+            delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6]))
+        except ValueError:
+            return None
+        parsed = parsed - delta if offset[0] == '+' else parsed + delta
+    return parsed.replace(tzinfo=timezone.utc)
+
+
+def read_ooxml_core_properties(file_path: Path) -> Dict:
+    """Read title, author, dates and so on from an Office Open XML package.
+
+    Works for .docx, .pptx and .xlsx alike: only docProps/core.xml is read
+    from the zip. Missing properties are left out.
+    """
+    properties = {}
+    with zipfile.ZipFile(file_path) as package:
+        try:
+            root = ElementTree.fromstring(package.read(_core_properties_part(package)))
+        except KeyError:
+            return properties
+
+    for element in root:
+        key = CORE_PROPERTIES.get(element.tag)
+        if key is None or not element.text:
+            continue
+        value = element.text.strip()
+        if key in ('created', 'modified'):
+            value = _parse_w3cdtf(value)
+        elif key == 'revision':
+            try:
+                value = int(value)
+            except ValueError:
+                continue
+        if value not in (None, ''):
+            properties[key] = value
+    return properties
+
+
+def iter_docx_paragraphs(file_path: Path) -> Iterator[str]:
+    """Yield the non-empty body paragraphs of a .docx in order, stripped.
+
+    word/document.xml is decompressed and parsed as a stream, and nothing
+    past the last paragraph taken is read. Finished body elements are
+    dropped as they are read, so memory does not grow with the document.
+    Paragraphs inside tables are skipped, as in python-docx's
+    Document.paragraphs.
+    """
+    paragraph_tag, run_tag, hyperlink_tag = f'{W_NS}p', f'{W_NS}r', f'{W_NS}hyperlink'
+    text_tag, break_tag = f'{W_NS}t', f'{W_NS}br'
+
+    with zipfile.ZipFile(file_path) as package, package.open('word/document.xml') as stream:
+        # Open elements from the root: document, body, then the body child
+        stack = []
+        text = []
+        for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                stack.append(element)
+                continue
+            stack.pop()
+            tags = [open_element.tag for open_element in stack[2:]]
+
+            # Run content of a body paragraph, directly or inside a hyperlink
+            if tags in ([paragraph_tag, run_tag], [paragraph_tag, hyperlink_tag, run_tag]):
+                if element.tag == text_tag:
+                    text.append(element.text or '')
+                elif element.tag == break_tag:
+                    # Page and column breaks have no text equivalent
+                    if element.get(f'{W_NS}type', 'textWrapping') == 'textWrapping':
+                        text.append('\n')
+                elif element.tag in RUN_TEXT:
+                    text.append(RUN_TEXT[element.tag])
+
+            elif len(stack) == 2:
+                # A finished body child (paragraph, table, section properties)
+                if element.tag == paragraph_tag:
+                    paragraph_text = ''.join(text).strip()
+                    if paragraph_text:
+                        yield paragraph_text
+                text = []
+                stack[1].remove(element)
+
+
+def read_docx_paragraphs(file_path: Path, limit: int = 10) -> List[str]:
+    """Return the first `limit` non-empty body paragraphs of a .docx, stripped.
+
+    Parsing stops as soon as enough paragraphs are found, see
+    iter_docx_paragraphs.
+    """
+    paragraphs = iter_docx_paragraphs(file_path)
+    try:
+        return list(itertools.islice(paragraphs, limit))
+    finally:
+        paragraphs.close()
+
+
+# Page attributes a PDF page inherits from its ancestors in the page tree
+PDF_INHERITABLE = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+
+def iter_pdf_pages(pdf_reader, limit: Optional[int] = None) -> Iterator:
+    """Yield the pages of a PyPDF2 PdfReader in order, walking the page tree lazily.
+
+    reader.pages flattens the whole tree before the first page can be
+    read; here only the branches leading to the pages actually taken are
+    resolved. Inheritable attributes are copied down from parent nodes as
+    PdfReader does when it flattens.
+    """
+    from PyPDF2 import PageObject
+    from PyPDF2.generic import NameObject
+
+    stack = [(None, pdf_reader.trailer['/Root']['/Pages'], {})]
+    seen = set()
+    count = 0
+    while stack:
+        reference, node, inherited = stack.pop()
+        # A malformed tree could loop back on itself
+        idnum = getattr(reference, 'idnum', None)
+        if idnum is not None:
+            if idnum in seen:
+                continue
+            seen.add(idnum)
+        node = node.get_object()
+
+        if node.get('/Type') == '/Page' or '/Kids' not in node:
+            page = PageObject(pdf_reader, reference)
+            page.update(node)
+            for attr, value in inherited.items():
+                if attr not in page:
+                    page[NameObject(attr)] = value
+            yield page
+            count += 1
+            if limit is not None and count >= limit:
+                return
+            continue
+
+        inherited = {**inherited, **{attr: node[attr] for attr in PDF_INHERITABLE if attr in node}}
+        # Kids are pushed as references and only resolved when reached
+        for kid in reversed(node['/Kids']):
+            stack.append((kid, kid, inherited))
+
+
+# EPUB package namespaces
+OCF_NS = '{urn:oasis:names:tc:opendocument:xmlns:container}'
+OPF_NS = '{http://www.idpf.org/2007/opf}'
+
+
+def _epub_opf_path(package: zipfile.ZipFile) -> Optional[str]:
+    """Name of the OPF package document, from META-INF/container.xml."""
+    try:
+        container = ElementTree.fromstring(package.read('META-INF/container.xml'))
+        for rootfile in container.iter(f'{OCF_NS}rootfile'):
+            if rootfile.get('full-path'):
+                return posixpath.normpath(rootfile.get('full-path').lstrip('/'))
+    except (KeyError, ElementTree.ParseError):
+        pass
+    # Packages without a usable container.xml: take the first .opf in the zip
+    return next((name for name in package.namelist() if name.lower().endswith('.opf')), None)
+
+
+def _epub_isbn(identifier: ElementTree.Element) -> Optional[str]:
+    """The ISBN in a dc:identifier, marked by an opf:scheme attribute or a urn:isbn: prefix."""
+    value = (identifier.text or '').strip()
+    if identifier.get(f'{OPF_NS}scheme', '').lower() == 'isbn':
+        return value
+    if value.lower().startswith('urn:isbn:'):
+        return value[9:]
+    if value.lower().startswith('isbn:'):
+        return value[5:]
+    return None
+
+
+def read_epub_metadata(file_path: Path) -> Dict:
+    """Read title, author, publisher, language, tags, series, date and ISBN of an EPUB.
+
+    Only META-INF/container.xml and the OPF package document are read from
+    the zip. Keys follow what extract_ebook_metadata gets from Calibre's
+    ebook-meta; fields the book does not carry are left out.
+    """
+    with zipfile.ZipFile(file_path) as package:
+        opf_path = _epub_opf_path(package)
+        if opf_path is None:
+            return {}
+        try:
+            opf = ElementTree.fromstring(package.read(opf_path))
+        except KeyError:
+            return {}
+
+    dc_metadata = opf.find(f'{OPF_NS}metadata')
+    if dc_metadata is None:
+        return {}
+
+    def texts(tag):
+        return [element.text.strip() for element in dc_metadata.iter(f'{DC_NS}{tag}')
+                if element.text and element.text.strip()]
+
+    metadata = {}
+    for key, tag in (('title', 'title'), ('publisher', 'publisher'),
+                     ('language', 'language'), ('year', 'date')):
+        values = texts(tag)
+        if values:
+            metadata[key] = values[0]
+    authors = texts('creator')
+    if authors:
+        metadata['author'] = ' & '.join(authors)
+    subjects = texts('subject')
+    if subjects:
+        metadata['tags'] = ', '.join(subjects)
+
+    for identifier in dc_metadata.iter(f'{DC_NS}identifier'):
+        isbn = _epub_isbn(identifier)
+        if isbn:
+            metadata['isbn'] = isbn
+            break
+
+    # Calibre's own series meta (EPUB 2), else an EPUB 3 collection
+    for meta in dc_metadata.iter(f'{OPF_NS}meta'):
+        if meta.get('name') == 'calibre:series' and meta.get('content'):
+            metadata['series'] = meta.get('content').strip()
+            break
+        if meta.get('property') == 'belongs-to-collection' and meta.text and meta.text.strip():
+            metadata['series'] = meta.text.strip()
+            break
+    return metadata
+
+
+# BibTeX is read in chunks of this many characters; memory is bounded by
+# this plus the largest single entry
+BIBTEX_CHUNK_SIZE = 64 * 1024
+
+# Month macros are predefined, as bibtexparser expands them
+BIBTEX_MONTHS = {
+    'jan': 'January', 'feb': 'February', 'mar': 'March', 'apr': 'April',
+    'may': 'May', 'jun': 'June', 'jul': 'July', 'aug': 'August',
+    'sep': 'September', 'oct': 'October', 'nov': 'November', 'dec': 'December'
+}
+
+BIBTEX_BLOCK_START = re.compile(r'@\s*([A-Za-z]+)\s*([{(])')
+BIBTEX_DELIMITERS = re.compile(r'[{}()"]')
+BIBTEX_BRACES = re.compile(r'[{}]')
+BIBTEX_QUOTED = re.compile(r'[{}"]')
+BIBTEX_FIELD_NAME = re.compile(r'\s*([^\s=,{}"#()]+)\s*=\s*')
+BIBTEX_BARE_VALUE = re.compile(r'[^\s,#}"{]+')
+BIBTEX_SPACE = re.compile(r'\s*')
+
+
+def _bibtex_block_end(text: str, start: int, opener: str) -> Optional[int]:
+    """Index of the delimiter closing a block opened just before start, or None."""
+    depth = 0
+    in_quotes = False
+    for match in BIBTEX_DELIMITERS.finditer(text, start):
+        char = match.group()
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            if depth == 0:
+                if opener == '{':
+                    return match.start()
+                continue
+            depth -= 1
+        elif depth == 0 and char == '"' and opener == '(':
+            in_quotes = not in_quotes
+        elif depth == 0 and char == ')' and opener == '(' and not in_quotes:
+            return match.start()
+    return None
+
+
+def _iter_bibtex_blocks(stream, chunk_size: int) -> Iterator[Tuple[str, str]]:
+    """Yield (entry type, text between the delimiters) for each @block in a stream."""
+    buffer = ''
+    position = 0
+    eof = False
+
+    def read_more() -> bool:
+        nonlocal buffer, eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer += chunk
+        return True
+
+    while True:
+        at = buffer.find('@', position)
+        if at == -1:
+            # Nothing left to scan in the buffer
+            buffer, position = '', 0
+            if eof or not read_more():
+                return
+            continue
+
+        start = BIBTEX_BLOCK_START.match(buffer, at)
+        if start is None:
+            # "@" in a comment, or a block header cut off at the end of the buffer
+            if not eof and len(buffer) - at < 256 and read_more():
+                continue
+            position = at + 1
+            continue
+
+        end = _bibtex_block_end(buffer, start.end(), start.group(2))
+        if end is None:
+            if eof or not read_more():
+                return
+            continue
+
+        yield start.group(1).lower(), buffer[start.end():end]
+        position = end + 1
+        if position >= chunk_size:
+            buffer, position = buffer[position:], 0
+
+
+def _bibtex_value_end(text: str, start: int) -> int:
+    """Index of the brace or quote closing a value delimited at start."""
+    closer = '}' if text[start] == '{' else '"'
+    depth = 0
+    index = start + 1
+    while index < len(text):
+        match = (BIBTEX_QUOTED if closer == '"' else BIBTEX_BRACES).search(text, index)
+        if match is None:
+            return len(text)
+        char = match.group()
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            if depth == 0 and closer == '}':
+                return match.start()
+            depth = max(0, depth - 1)
+        elif depth == 0:
+            return match.start()
+        index = match.end()
+    return len(text)
+
+
+def _parse_bibtex_fields(body: str, index: int, strings: Dict[str, str]) -> Dict[str, str]:
+    """Parse name = value pairs, joining # concatenations and expanding @string macros."""
+    fields = {}
+    while True:
+        name = BIBTEX_FIELD_NAME.match(body, index)
+        if name is None:
+            return fields
+        index = name.end()
+
+        parts = []
+        while index < len(body):
+            char = body[index]
+            if char in '{"':
+                end = _bibtex_value_end(body, index)
+                parts.append(body[index + 1:end])
+                index = end + 1
+            else:
+                word = BIBTEX_BARE_VALUE.match(body, index)
+                if word is None:
+                    break
+                parts.append(strings.get(word.group().lower(), word.group()))
+                index = word.end()
+
+            index = BIBTEX_SPACE.match(body, index).end()
+            if body.startswith('#', index):
+                index = BIBTEX_SPACE.match(body, index + 1).end()
+                continue
+            break
+
+        # Line breaks are kept, the indentation after them is not
+        fields[name.group(1).lower()] = re.sub(r'\n[ \t]*', '\n', ''.join(parts))
+
+        index = BIBTEX_SPACE.match(body, index).end()
+        if not body.startswith(',', index):
+            return fields
+        index += 1
+
+
+def iter_bibtex_entries(file_path: Path, chunk_size: int = BIBTEX_CHUNK_SIZE) -> Iterator[Dict]:
+    """Yield the entries of a BibTeX file one at a time, as bibtexparser would return them.
+
+    Each entry is a dict of lowercased field names plus ENTRYTYPE and ID.
+    The file is read in chunks as entries are consumed, so taking only the
+    first entry reads only the start of the file, and iterating over all of
+    them holds one entry in memory at a time. @string macros defined before
+    use are expanded; @comment and @preamble blocks are skipped.
+    """
+    strings = dict(BIBTEX_MONTHS)
+    with open(file_path, 'r', encoding='utf-8') as stream:
+        for entry_type, body in _iter_bibtex_blocks(stream, chunk_size):
+            if entry_type in ('comment', 'preamble'):
+                continue
+            if entry_type == 'string':
+                strings.update({name.lower(): value for name, value in
+                                _parse_bibtex_fields(body, 0, strings).items()})
+                continue
+
+            key, comma, _ = body.partition(',')
+            entry = _parse_bibtex_fields(body, len(key) + 1, strings) if comma else {}
+            entry['ENTRYTYPE'] = entry_type
+            entry['ID'] = key.strip()
+            yield entry
+
+
+# TIFF/EXIF tags read by the image header parser
+TIFF_IMAGE_WIDTH = 0x0100
+TIFF_IMAGE_LENGTH = 0x0101
+TIFF_X_RESOLUTION = 0x011A
+TIFF_Y_RESOLUTION = 0x011B
+TIFF_RESOLUTION_UNIT = 0x0128
+TIFF_DATE_TIME = 0x0132
+TIFF_EXIF_IFD = 0x8769
+EXIF_DATE_TIME_ORIGINAL = 0x9003
+
+# Bytes per TIFF field type: BYTE, ASCII, SHORT, LONG, RATIONAL
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, ...)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Brands of HEIF files (iPhone photos and the like)
+HEIF_BRANDS = {b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1', b'avif'}
+
+METERS_PER_INCH = 0.0254
+
+
+def _parse_exif_date(value) -> Optional[datetime]:
+    """Parse an EXIF date such as "2023:05:01 14:30:00"."""
+    try:
+        return datetime.strptime(str(value).strip('\x00 ')[:19], '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def _read_tiff_ifd(data: bytes, offset: int, order: str, wanted: set) -> Dict[int, object]:
+    """Read the wanted tags of one IFD; rationals become floats, ASCII becomes str."""
+    values = {}
+    if offset + 2 > len(data):
+        return values
+    (count,) = struct.unpack_from(f'{order}H', data, offset)
+    for index in range(count):
+        entry = offset + 2 + index * 12
+        if entry + 12 > len(data):
+            break
+        tag, field_type, value_count = struct.unpack_from(f'{order}HHI', data, entry)
+        if tag not in wanted or field_type not in TIFF_TYPE_SIZES:
+            continue
+        size = TIFF_TYPE_SIZES[field_type] * value_count
+        value_offset = entry + 8
+        if size > 4:
+            (value_offset,) = struct.unpack_from(f'{order}I', data, entry + 8)
+        if value_offset + size > len(data):
+            continue
+
+        if field_type == 2:
+            values[tag] = data[value_offset:value_offset + value_count].split(b'\x00', 1)[0] \
+                .decode('ascii', errors='replace')
+        elif field_type == 3:
+            (values[tag],) = struct.unpack_from(f'{order}H', data, value_offset)
+        elif field_type in (4, 9):
+            (values[tag],) = struct.unpack_from(f'{order}I', data, value_offset)
+        elif field_type in (5, 10):
+            numerator, denominator = struct.unpack_from(f'{order}II', data, value_offset)
+            values[tag] = numerator / denominator if denominator else None
+    return values
+
+
+def parse_tiff_header(data: bytes) -> Dict:
+    """Size, resolution and dates from a TIFF structure (a TIFF file or an EXIF block)."""
+    if data[:4] == b'II*\x00':
+        order = '<'
+    elif data[:4] == b'MM\x00*':
+        order = '>'
+    else:
+        return {}
+
+    (ifd_offset,) = struct.unpack_from(f'{order}I', data, 4)
+    tags = _read_tiff_ifd(data, ifd_offset, order, {
+        TIFF_IMAGE_WIDTH, TIFF_IMAGE_LENGTH, TIFF_X_RESOLUTION, TIFF_Y_RESOLUTION,
+        TIFF_RESOLUTION_UNIT, TIFF_DATE_TIME, TIFF_EXIF_IFD
+    })
+    if TIFF_EXIF_IFD in tags:
+        tags.update(_read_tiff_ifd(data, tags[TIFF_EXIF_IFD], order, {EXIF_DATE_TIME_ORIGINAL}))
+
+    header = {}
+    if TIFF_IMAGE_WIDTH in tags and TIFF_IMAGE_LENGTH in tags:
+        header['width'], header['height'] = tags[TIFF_IMAGE_WIDTH], tags[TIFF_IMAGE_LENGTH]
+    # Resolution unit 2 is inches (the default), 3 is centimeters
+    scale = 2.54 if tags.get(TIFF_RESOLUTION_UNIT) == 3 else 1.0
+    if tags.get(TIFF_X_RESOLUTION) and tags.get(TIFF_Y_RESOLUTION) and tags.get(TIFF_RESOLUTION_UNIT) != 1:
+        header['dpi_width'] = round(tags[TIFF_X_RESOLUTION] * scale, 3)
+        header['dpi_height'] = round(tags[TIFF_Y_RESOLUTION] * scale, 3)
+    capture_date = _parse_exif_date(tags.get(EXIF_DATE_TIME_ORIGINAL) or tags.get(TIFF_DATE_TIME) or '')
+    if capture_date:
+        header['capture_date'] = capture_date
+    return header
+
+
+def _exif_block(segment: bytes) -> bytes:
+    """The TIFF structure inside an EXIF block that may start with "Exif\\0\\0"."""
+    return segment[6:] if segment.startswith(b'Exif\x00\x00') else segment
+
+
+def _read_png_header(stream) -> Dict:
+    stream.seek(8)
+    header = {'format': 'png'}
+    while True:
+        chunk_header = stream.read(8)
+        if len(chunk_header) < 8:
+            break
+        length, chunk_type = struct.unpack('>I4s', chunk_header)
+        if chunk_type == b'IHDR':
+            header['width'], header['height'] = struct.unpack('>II', stream.read(8))
+            stream.seek(length - 8 + 4, 1)
+        elif chunk_type == b'pHYs':
+            x_ppu, y_ppu, unit = struct.unpack('>IIB', stream.read(9))
+            if unit == 1:
+                header['dpi_width'] = round(x_ppu * METERS_PER_INCH, 3)
+                header['dpi_height'] = round(y_ppu * METERS_PER_INCH, 3)
+            stream.seek(4, 1)
+        elif chunk_type == b'eXIf':
+            exif = parse_tiff_header(_exif_block(stream.read(length)))
+            if 'capture_date' in exif:
+                header['capture_date'] = exif['capture_date']
+            stream.seek(4, 1)
+        elif chunk_type in (b'IDAT', b'IEND'):
+            # Metadata chunks that matter come before the image data
+            break
+        else:
+            stream.seek(length + 4, 1)
+    return header
+
+
+def _read_jpeg_header(stream) -> Dict:
+    stream.seek(2)
+    header = {'format': 'jpeg'}
+    while True:
+        marker = stream.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            break
+        code = marker[1]
+        if code == 0xFF:
+            # Fill byte before a marker
+            stream.seek(-1, 1)
+            continue
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        if code in (0xD9, 0xDA):
+            # End of image or start of scan: no more headers
+            break
+        (length,) = struct.unpack('>H', stream.read(2))
+
+        if code in JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack('>BHH', stream.read(5))
+            header['width'], header['height'] = width, height
+            break
+        if code == 0xE0 and 'dpi_width' not in header:
+            segment = stream.read(length - 2)
+            if segment.startswith(b'JFIF\x00') and len(segment) >= 12:
+                units, x_density, y_density = struct.unpack_from('>BHH', segment, 7)
+                # Units 1 are dots per inch, 2 dots per centimeter
+                if units in (1, 2):
+                    scale = 2.54 if units == 2 else 1.0
+                    header['dpi_width'] = round(x_density * scale, 3)
+                    header['dpi_height'] = round(y_density * scale, 3)
+            continue
+        if code == 0xE1:
+            segment = stream.read(length - 2)
+            if segment.startswith(b'Exif\x00\x00'):
+                exif = parse_tiff_header(_exif_block(segment))
+                exif.pop('width', None)
+                exif.pop('height', None)
+                # EXIF resolution wins over the JFIF density
+                header.update(exif)
+            continue
+        stream.seek(length - 2, 1)
+    return header
+
+
+def _read_gif_header(stream) -> Dict:
+    stream.seek(6)
+    width, height = struct.unpack('<HH', stream.read(4))
+    return {'format': 'gif', 'width': width, 'height': height}
+
+
+def _read_bmp_header(stream) -> Dict:
+    stream.seek(14)
+    (dib_size,) = struct.unpack('<I', stream.read(4))
+    if dib_size == 12:
+        # OS/2 BITMAPCOREHEADER
+        width, height = struct.unpack('<HH', stream.read(4))
+        return {'format': 'bmp', 'width': width, 'height': height}
+
+    width, height = struct.unpack('<ii', stream.read(8))
+    header = {'format': 'bmp', 'width': width, 'height': abs(height)}
+    if dib_size >= 40:
+        stream.seek(38)
+        x_ppm, y_ppm = struct.unpack('<ii', stream.read(8))
+        if x_ppm > 0 and y_ppm > 0:
+            header['dpi_width'] = round(x_ppm * METERS_PER_INCH, 3)
+            header['dpi_height'] = round(y_ppm * METERS_PER_INCH, 3)
+    return header
+
+
+def _iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """Yield (type, payload start, payload end) for ISO base media boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, position)
+        header_size = 8
+        if size == 1:
+            if position + 16 > end:
+                return
+            (size,) = struct.unpack_from('>Q', data, position + 8)
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size:
+            return
+        yield box_type, position + header_size, min(position + size, end)
+        position += size
+
+
+def _read_heif_header(stream, brand: bytes) -> Dict:
+    header = {'format': 'avif' if brand == b'avif' else 'heic' if brand.startswith((b'hei', b'hev')) else 'heif'}
+    # ftyp and meta sit at the start of the file; the EXIF item data is
+    # fetched separately from wherever iloc says it is
+    data = stream.read(256 * 1024)
+
+    meta = next(((start, end) for box_type, start, end in _iter_boxes(data) if box_type == b'meta'), None)
+    if meta is None:
+        return header
+
+    exif_items = set()
+    locations = {}
+    sizes = []
+    # meta is a full box: skip version and flags
+    for box_type, start, end in _iter_boxes(data, meta[0] + 4, meta[1]):
+        if box_type == b'iinf':
+            version = data[start]
+            entries_start = start + (6 if version == 0 else 8)
+            for entry_type, entry_start, entry_end in _iter_boxes(data, entries_start, end):
+                if entry_type != b'infe' or data[entry_start] < 2:
+                    continue
+                if data[entry_start] == 2:
+                    (item_id,) = struct.unpack_from('>H', data, entry_start + 4)
+                    item_type = data[entry_start + 8:entry_start + 12]
+                else:
+                    (item_id,) = struct.unpack_from('>I', data, entry_start + 4)
+                    item_type = data[entry_start + 10:entry_start + 14]
+                if item_type == b'Exif':
+                    exif_items.add(item_id)
+        elif box_type == b'iloc':
+            locations = _parse_iloc(data, start)
+        elif box_type == b'iprp':
+            for child_type, child_start, child_end in _iter_boxes(data, start, end):
+                if child_type != b'ipco':
+                    continue
+                for prop_type, prop_start, _ in _iter_boxes(data, child_start, child_end):
+                    if prop_type == b'ispe':
+                        sizes.append(struct.unpack_from('>II', data, prop_start + 4))
+
+    if sizes:
+        # Thumbnails and grid tiles are smaller than the full image
+        header['width'], header['height'] = max(sizes, key=lambda size: size[0] * size[1])
+
+    for item_id in exif_items:
+        if item_id not in locations:
+            continue
+        offset, length = locations[item_id]
+        stream.seek(offset)
+        block = stream.read(min(length, 256 * 1024))
+        if len(block) < 4:
+            continue
+        # The item starts with the offset of the TIFF header after these 4 bytes
+        (tiff_offset,) = struct.unpack_from('>I', block, 0)
+        exif = parse_tiff_header(block[4 + tiff_offset:])
+        exif.pop('width', None)
+        exif.pop('height', None)
+        header.update(exif)
+        break
+    return header
+
+
+def _parse_iloc(data: bytes, start: int) -> Dict[int, Tuple[int, int]]:
+    """Map item id -> (file offset, length) of its first extent from an iloc box."""
+    version = data[start]
+    position = start + 4
+    sizes = data[position] << 8 | data[position + 1]
+    offset_size, length_size = sizes >> 12, (sizes >> 8) & 0xF
+    base_offset_size, index_size = (sizes >> 4) & 0xF, sizes & 0xF
+    position += 2
+
+    def read(size: int) -> int:
+        nonlocal position
+        value = int.from_bytes(data[position:position + size], 'big') if size else 0
+        position += size
+        return value
+
+    item_count = read(2 if version < 2 else 4)
+    locations = {}
+    for _ in range(item_count):
+        item_id = read(2 if version < 2 else 4)
+        construction_method = read(2) & 0xF if version in (1, 2) else 0
+        read(2)  # data reference index
+        base_offset = read(base_offset_size)
+        extent_count = read(2)
+        extents = []
+        for _ in range(extent_count):
+            if version in (1, 2):
+                read(index_size)
+            extents.append((read(offset_size), read(length_size)))
+        # Only items stored in the file itself (not in idat) can be read back
+        if construction_method == 0 and extents:
+            locations[item_id] = (base_offset + extents[0][0], extents[0][1])
+    return locations
+
+
+def read_image_header(file_path: Path) -> Dict:
+    """Read format, width, height, DPI and capture date from an image's headers.
+
+    Supports PNG, JPEG, GIF, BMP, TIFF and HEIC/HEIF. Only the header
+    structures are read (a few KB, plus the EXIF block where the format
+    keeps it elsewhere), never the pixel data. Returns {} for formats it
+    does not recognize; fields the file does not carry are left out.
+    """
+    with open(file_path, 'rb') as stream:
+        signature = stream.read(16)
+        if signature.startswith(b'\x89PNG\r\n\x1a\n'):
+            return _read_png_header(stream)
+        if signature.startswith(b'\xff\xd8'):
+            return _read_jpeg_header(stream)
+        if signature[:6] in (b'GIF87a', b'GIF89a'):
+            return _read_gif_header(stream)
+        if signature.startswith(b'BM'):
+            return _read_bmp_header(stream)
+        if signature[:4] in (b'II*\x00', b'MM\x00*'):
+            # The IFD can sit anywhere, but writers put it in the first KBs
+            stream.seek(0)
+            header = parse_tiff_header(stream.read(256 * 1024))
+            if header:
+                header['format'] = 'tiff'
+            return header
+        if signature[4:8] == b'ftyp' and signature[8:12] in HEIF_BRANDS:
+            stream.seek(0)
+            return _read_heif_header(stream, signature[8:12])
+    return {}
+
+
+# moov boxes larger than this are not read (they are a few MB even for long films)
+MP4_MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+# Sample entry types and the codec names ffprobe reports for them
+MP4_CODECS = {
+    b'avc1': 'h264', b'avc3': 'h264', b'hvc1': 'hevc', b'hev1': 'hevc', b'av01': 'av1',
+    b'vp09': 'vp9', b'mp4v': 'mpeg4', b'apcn': 'prores', b'apch': 'prores', b'apcs': 'prores',
+    b'apco': 'prores', b'ap4h': 'prores', b'jpeg': 'mjpeg', b'mp4a': 'aac', b'alac': 'alac',
+    b'ac-3': 'ac3', b'ec-3': 'eac3', b'Opus': 'opus', b'fLaC': 'flac', b'.mp3': 'mp3',
+    b'lpcm': 'pcm_s16le', b'sowt': 'pcm_s16le', b'twos': 'pcm_s16be'
+}
+
+# Boxes on the way from a track to its sample table
+MP4_CONTAINER_BOXES = {b'trak', b'mdia', b'minf', b'stbl'}
+
+
+def _read_mp4_track(data: bytes, start: int, end: int) -> Dict:
+    """Handler, codec, dimensions, audio format and frame rate of one trak box."""
+    track = {}
+    pending = [(start, end)]
+    while pending:
+        box_start, box_end = pending.pop()
+        for box_type, payload, payload_end in _iter_boxes(data, box_start, box_end):
+            if box_type in MP4_CONTAINER_BOXES:
+                pending.append((payload, payload_end))
+            elif box_type == b'mdhd':
+                if data[payload] == 1:
+                    timescale, duration = struct.unpack_from('>IQ', data, payload + 20)
+                else:
+                    timescale, duration = struct.unpack_from('>II', data, payload + 12)
+                track['timescale'], track['duration'] = timescale, duration
+            elif box_type == b'hdlr':
+                track['handler'] = data[payload + 8:payload + 12]
+            elif box_type == b'stsd':
+                # The first sample entry: size, type, 6 reserved, data reference index
+                entry = payload + 8
+                entry_type = data[entry + 4:entry + 8]
+                track['codec'] = MP4_CODECS.get(entry_type, entry_type.decode('latin-1').strip())
+                fields = entry + 16
+                # Video entries: 16 bytes of predefined fields, then width and height
+                track['width'], track['height'] = struct.unpack_from('>HH', data, fields + 16)
+                (track['channels'],) = struct.unpack_from('>H', data, fields + 8)
+                # Audio entries keep the sample rate (16.16) where video keeps the width
+                (track['sample_rate'],) = struct.unpack_from('>H', data, fields + 16)
+            elif box_type == b'stts':
+                (count,) = struct.unpack_from('>I', data, payload + 4)
+                deltas = [struct.unpack_from('>II', data, payload + 8 + index * 8)
+                          for index in range(count)]
+                track['sample_deltas'] = deltas
+    return track
+
+
+def _mp4_frame_rate(track: Dict) -> Optional[str]:
+    """Frame rate as ffprobe's r_frame_rate fraction, e.g. "30000/1001"."""
+    deltas = track.get('sample_deltas')
+    timescale = track.get('timescale')
+    if not deltas or not timescale:
+        return None
+    if len(deltas) == 1 or all(delta == deltas[0][1] for _, delta in deltas):
+        rate = Fraction(timescale, deltas[0][1]) if deltas[0][1] else None
+    else:
+        samples = sum(count for count, _ in deltas)
+        duration = sum(count * delta for count, delta in deltas)
+        rate = Fraction(samples * timescale, duration).limit_denominator(1001) if duration else None
+    return f"{rate.numerator}/{rate.denominator}" if rate else None
+
+
+def read_mp4_metadata(file_path: Path) -> Dict:
+    """Read duration, codecs, dimensions and frame rate of an MP4/MOV/M4A file.
+
+    Top-level boxes are skipped by seeking, so only the moov box is read,
+    wherever it is in the file; no media data is decoded. Keys and value
+    formats follow what extract_video_metadata gets from ffprobe. Returns
+    {} when the file has no readable moov box.
+    """
+    size = os.path.getsize(file_path)
+    moov = None
+    with open(file_path, 'rb') as stream:
+        position = 0
+        while position + 8 <= size:
+            stream.seek(position)
+            box_size, box_type = struct.unpack('>I4s', stream.read(8))
+            header_size = 8
+            if box_size == 1:
+                (box_size,) = struct.unpack('>Q', stream.read(8))
+                header_size = 16
+            elif box_size == 0:
+                box_size = size - position
+            if box_size < header_size:
+                break
+
+            if box_type == b'moov':
+                if box_size > MP4_MAX_MOOV_SIZE:
+                    return {}
+                moov = stream.read(box_size - header_size)
+                break
+            position += box_size
+
+    if moov is None:
+        return {}
+
+    metadata = {}
+    tracks = []
+    for box_type, start, end in _iter_boxes(moov):
+        if box_type == b'mvhd':
+            if moov[start] == 1:
+                timescale, duration = struct.unpack_from('>IQ', moov, start + 20)
+            else:
+                timescale, duration = struct.unpack_from('>II', moov, start + 12)
+            if timescale:
+                seconds = duration / timescale
+                metadata['duration'] = f"{seconds:.6f}"
+                if seconds:
+                    metadata['bit_rate'] = str(int(size * 8 / seconds))
+        elif box_type == b'trak':
+            tracks.append(_read_mp4_track(moov, start, end))
+
+    metadata['size'] = str(size)
+    # ffprobe names the demuxer, which is the same for the whole family
+    metadata['format_name'] = 'mov,mp4,m4a,3gp,3g2,mj2'
+
+    video = next((track for track in tracks if track.get('handler') == b'vide'), None)
+    audio = next((track for track in tracks if track.get('handler') == b'soun'), None)
+    if video:
+        metadata.update({
+            'video_codec': video.get('codec', ''),
+            'video_width': video.get('width', ''),
+            'video_height': video.get('height', ''),
+            'video_fps': _mp4_frame_rate(video) or ''
+        })
+    if audio:
+        metadata.update({
+            'audio_codec': audio.get('codec', ''),
+            'audio_channels': audio.get('channels', ''),
+            # mdhd's timescale is the sample rate for audio tracks
+            'audio_sample_rate': str(audio.get('timescale') or audio.get('sample_rate', ''))
+        })
+    if not video and not audio:
+        return {}
+    return metadata
+
+
+# Runs inside calibre-debug: one JSON-encoded path per line in, one JSON
+# object per line out. Calibre's own messages go to stderr so they cannot
+# interleave with the replies.
+CALIBRE_WORKER_SCRIPT = r'''
+import json, sys
+from calibre.ebooks.metadata.meta import get_metadata
+replies, sys.stdout = sys.stdout, sys.stderr
+for line in sys.stdin:
+    path = json.loads(line)
+    reply = {}
+    try:
+        with open(path, 'rb') as stream:
+            mi = get_metadata(stream, stream_type=path.rpartition('.')[2].lower())
+        if mi.title and mi.title != 'Unknown':
+            reply['title'] = mi.title
+        authors = [name for name in (mi.authors or []) if name != 'Unknown']
+        if authors:
+            reply['author'] = ' & '.join(authors)
+        if mi.publisher:
+            reply['publisher'] = mi.publisher
+        if mi.languages:
+            reply['language'] = mi.languages[0]
+        if mi.tags:
+            reply['tags'] = ', '.join(mi.tags)
+        if mi.series:
+            reply['series'] = mi.series
+        if mi.pubdate and mi.pubdate.year > 101:
+            reply['year'] = mi.pubdate.isoformat()
+        if mi.isbn:
+            reply['isbn'] = mi.isbn
+    except Exception as e:
+        reply = {'error': str(e)}
+    replies.write(json.dumps(reply) + '\n')
+    replies.flush()
+'''
+
+
+def match_calibre_book_ids(paths: List[str], stdout: str) -> Optional[List[Optional[int]]]:
+    """Match `calibredb add` output back to the paths it was given.
+
+    calibredb prints the new book ids in ascending order, which is the order
+    the books were added in. For books skipped as duplicates it writes a
+    header and their titles to stderr but their paths, indented, to stdout
+    ahead of the ids line, so only stdout is parsed. Returns one book id per
+    path (None for duplicates), or None when the counts differ.
+    """
+    match = re.search(r'^Added book ids?:\s*([\d, ]+)', stdout, re.MULTILINE)
+    book_ids = sorted(int(book_id) for book_id in re.findall(r'\d+', match.group(1))) if match else []
+
+    listed = {os.path.abspath(line.strip()) for line in stdout.splitlines() if line.strip()}
+    added = [path for path in paths if os.path.abspath(path) not in listed]
+    if len(book_ids) != len(added):
+        return None
+
+    ids_by_path = dict(zip(added, book_ids))
+    return [ids_by_path.get(path) for path in paths]
+
+
+class CalibreMetadataWorker:
+    """A long-running calibre-debug process that reads e-book metadata on request.
+
+    Calibre takes a second or more to start, so instead of running ebook-meta
+    per book one calibre-debug process is started on first use and kept
+    warm; each read() sends it a path over a pipe and waits for the reply.
+    A worker that times out or dies is killed and started again on the next
+    request. The process exits when close() is called or this process ends.
+    """
+
+    def __init__(self, calibre_path: str, timeout: float = 30):
+        self.calibre_debug = Path(calibre_path).expanduser() / 'calibre-debug'
+        self.timeout = timeout
+        self._process = None
+        self._buffer = b''
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether calibre-debug exists at the configured path."""
+        return self.calibre_debug.exists()
+
+    def _start(self):
+        self._process = subprocess.Popen(
+            [str(self.calibre_debug), '-c', CALIBRE_WORKER_SCRIPT],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self._buffer = b''
+        logger.info(f"Started Calibre metadata worker (pid {self._process.pid})")
+
+    def _read_line(self, deadline: float) -> Optional[bytes]:
+        """The next reply line, or None if the worker exits or the deadline passes."""
+        stdout = self._process.stdout.fileno()
+        while b'\n' not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([stdout], [], [], remaining)[0]:
+                return None
+            chunk = os.read(stdout, 65536)
+            if not chunk:
+                return None
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line
+
+    def read(self, file_path: Path) -> Optional[Dict]:
+        """Metadata of one e-book, or None if the worker could not answer in time."""
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            deadline = time.monotonic() + self.timeout
+            try:
+                self._process.stdin.write(json.dumps(str(file_path)).encode() + b'\n')
+                self._process.stdin.flush()
+                line = self._read_line(deadline)
+            except OSError:
+                line = None
+            if line is None:
+                logger.warning(f"Calibre metadata worker gave no answer for {file_path}, restarting it")
+                self._stop(kill=True)
+                return None
+
+        reply = json.loads(line)
+        if 'error' in reply:
+            logger.warning(f"Calibre could not read {file_path}: {reply['error']}")
+            return {}
+        return reply
+
+    def _stop(self, kill: bool = False):
+        if self._process is None:
+            return
+        try:
+            # The worker exits by itself once its input is closed
+            self._process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._process.wait(timeout=0 if kill else 5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+
+    def close(self):
+        """Stop the worker process."""
+        with self._lock:
+            self._stop()
@@ -7,10 +7,13 @@ Uses actual course titles and keywords for highly accurate categorization.
 import os
 import sys
 import json
-import requests
 import re
+from collections import OrderedDict, deque
 from pathlib import Path
 from datetime import datetime
+from format_readers import iter_docx_paragraphs, iter_pdf_pages
+from tool_runner import run_tool
+from zotero_spool import enqueue_upload, drain_spool, wait_for_uploads
 
 def process_research_file(file_path):
     """Process a single research file through the intelligent workflow."""
@@ -28,14 +31,14 @@ def process_research_file(file_path):
         # Determine course context with enhanced detection
         course_info = intelligent_course_detection(file_path, config)
         
-        # Upload to Zotero with proper collection
-        zotero_id = upload_to_zotero(file_path, config, course_info)
-        
         # Organize file into course-specific folder
         organized_path = organize_file_by_course(file_path, course_info)
         
+        # Queue the Zotero upload with proper collection (sent in the background)
+        zotero_job_id = upload_to_zotero(organized_path or file_path, config, course_info)
+        
         # Create enhanced research summary
-        create_research_summary(file_path, course_info, zotero_id)
+        create_research_summary(file_path, course_info, zotero_job_id)
         
         print(f"✅ Successfully processed: {file_path}")
         print(f"📚 Course: {course_info['course_name']}")
@@ -48,50 +51,162 @@ def process_research_file(file_path):
         print(f"❌ Error processing research file {file_path}: {e}")
         return False
 
+class CourseMatcher:
+    """Finds every course code, number, title word and keyword in one pass over the text.
+    
+    The terms of all courses are compiled once into an Aho-Corasick automaton
+    (stored as a full transition table), so scanning costs the same however
+    many courses and keywords there are. Terms match as substrings, exactly
+    as the per-term `in` checks did.
+    """
+    
+    def __init__(self, course_details):
+        # Per course, in scoring order: (term, points, label for matched_keywords)
+        self.course_terms = {}
+        for course_code, course_data in course_details.items():
+            terms = [(course_code.lower(), 10, course_code)]
+            course_number = course_code.split()[-1]
+            terms.append((course_number, 5, course_number))
+            # Only meaningful title words
+            terms.extend((word, 2, word) for word in course_data['title'].lower().split() if len(word) > 3)
+            terms.extend((keyword.lower(), 3, keyword) for keyword in course_data['keywords'])
+            self.course_terms[course_code] = (terms, course_data)
+        
+        self.transitions, self.outputs = self.build_automaton(
+            {term for terms, _ in self.course_terms.values() for term, _, _ in terms if term})
+    
+    @staticmethod
+    def build_automaton(terms):
+        """Transition table and per-state matched terms of an Aho-Corasick automaton."""
+        goto, outputs = [{}], [frozenset()]
+        for term in terms:
+            state = 0
+            for char in term:
+                if char not in goto[state]:
+                    goto[state][char] = len(goto)
+                    goto.append({})
+                    outputs.append(frozenset())
+                state = goto[state][char]
+            outputs[state] = outputs[state] | {term}
+        
+        # Breadth-first, so a state's failure state is complete before the state
+        fail = [0] * len(goto)
+        transitions = [dict(goto[0])]
+        transitions.extend({} for _ in goto[1:])
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] = outputs[state] | outputs[fail[state]]
+            # Characters with no edge here continue from the failure state
+            transitions[state] = {**transitions[fail[state]], **goto[state]}
+            for char, next_state in goto[state].items():
+                fail[next_state] = transitions[fail[state]].get(char, 0)
+                queue.append(next_state)
+        return transitions, outputs
+    
+    def scan(self, text, state=0):
+        """Terms ending in the text, and the automaton state to continue from.
+        
+        Passing the returned state to the next call scans consecutive pieces
+        of a document as if they were one text, so terms spanning two pieces
+        are found too.
+        """
+        transitions, outputs = self.transitions, self.outputs
+        matched_states = set()
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                matched_states.add(state)
+        found = set()
+        for matched_state in matched_states:
+            found |= outputs[matched_state]
+        return found, state
+    
+    def find_terms(self, text):
+        """All terms occurring in the text."""
+        return self.scan(text)[0]
+    
+    def score_terms(self, found):
+        """Score, matched keywords and course data of every course, given the terms found."""
+        course_scores = {}
+        for course_code, (terms, course_data) in self.course_terms.items():
+            score = 0
+            matched_keywords = []
+            for term, points, label in terms:
+                if term in found:
+                    score += points
+                    matched_keywords.append(label)
+            course_scores[course_code] = {
+                'score': score,
+                'matched_keywords': matched_keywords,
+                'course_data': course_data
+            }
+        return course_scores
+    
+    def score(self, search_text):
+        """Score, matched keywords and course data of every course for the text."""
+        return self.score_terms(self.find_terms(search_text))
+
+# Automaton for the configured courses, rebuilt when course_details changes
+course_matcher = None
+course_matcher_key = None
+
+# Scores at or above this are 'very_high' confidence; content sampling stops there
+VERY_HIGH_SCORE = 15
+
+# Content is scored in pieces of this many characters, from at most this
+# many PDF pages and characters in total
+SAMPLE_STEP = 500
+MAX_SAMPLE_PAGES = 20
+MAX_SAMPLE_CHARS = 50000
+
+# Detection results by file identity and name, most recently used last
+COURSE_CACHE_SIZE = 1024
+course_cache = OrderedDict()
+
+def get_course_matcher(config):
+    """The course matcher for config['course_details'], built once."""
+    global course_matcher, course_matcher_key
+    key = json.dumps(config['course_details'], sort_keys=True)
+    if course_matcher is None or key != course_matcher_key:
+        course_matcher = CourseMatcher(config['course_details'])
+        course_matcher_key = key
+    return course_matcher
+
+def file_identity(file_path):
+    """Device, inode, size and mtime of a file; changes whenever its content may have."""
+    stat = os.stat(file_path)
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
 def intelligent_course_detection(file_path, config):
-    """Intelligent course detection using actual course titles and keywords."""
+    """Intelligent course detection using actual course titles and keywords.
+    
+    Results are cached by file identity and name, so the same file is not
+    read and scored again within a run. Looking a file up only stats it.
+    """
     filename = os.path.basename(file_path).lower()
-    file_content = extract_file_content(file_path)
+    matcher = get_course_matcher(config)
     
-    # Combine filename and content for analysis
-    search_text = f"{filename} {file_content}".lower()
+    cache_key = (file_identity(file_path), filename, course_matcher_key)
+    if cache_key in course_cache:
+        course_cache.move_to_end(cache_key)
+        cached = course_cache[cache_key]
+        return {**cached, 'matched_keywords': list(cached['matched_keywords'])}
     
-    course_scores = {}
-    
-    # Analyze each course
-    for course_code, course_data in config['course_details'].items():
-        score = 0
-        matched_keywords = []
-        
-        # Check course code
-        if course_code.lower() in search_text:
-            score += 10
-            matched_keywords.append(course_code)
-        
-        # Check course number
-        course_number = course_code.split()[-1]
-        if course_number in search_text:
-            score += 5
-            matched_keywords.append(course_number)
-        
-        # Check course title keywords
-        title_words = course_data['title'].lower().split()
-        for word in title_words:
-            if len(word) > 3 and word in search_text:  # Only meaningful words
-                score += 2
-                matched_keywords.append(word)
-        
-        # Check specific keywords
-        for keyword in course_data['keywords']:
-            if keyword.lower() in search_text:
-                score += 3
-                matched_keywords.append(keyword)
-        
-        course_scores[course_code] = {
-            'score': score,
-            'matched_keywords': matched_keywords,
-            'course_data': course_data
-        }
+    # Score the filename first, then read the content a piece at a time
+    # until one course clearly wins or the sample budget is spent
+    found, state = matcher.scan(f"{filename} ")
+    course_scores = matcher.score_terms(found)
+    sampled_chars = 0
+    if max((info['score'] for info in course_scores.values()), default=0) < VERY_HIGH_SCORE:
+        for piece in sample_file_content(file_path):
+            piece_found, state = matcher.scan(piece.lower(), state)
+            sampled_chars += len(piece)
+            if piece_found - found:
+                found |= piece_found
+                course_scores = matcher.score_terms(found)
+                if max(info['score'] for info in course_scores.values()) >= VERY_HIGH_SCORE:
+                    break
     
     # Find the best match
     best_course = max(course_scores.items(), key=lambda x: x[1]['score'])
@@ -99,7 +214,7 @@ def intelligent_course_detection(file_path, config):
     best_course_info = best_course[1]
     
     # Determine confidence level
-    if best_course_info['score'] >= 15:
+    if best_course_info['score'] >= VERY_HIGH_SCORE:
         confidence = 'very_high'
     elif best_course_info['score'] >= 10:
         confidence = 'high'
@@ -109,58 +224,90 @@ def intelligent_course_detection(file_path, config):
         confidence = 'low'
         best_course_code = 'General Research'
         best_course_info = {
+            'score': best_course_info['score'],
+            'matched_keywords': best_course_info['matched_keywords'],
             'course_data': {
                 'title': 'General Research',
                 'collection_key': None
             }
         }
     
-    return {
+    result = {
         'course_name': best_course_code,
         'course_title': best_course_info['course_data']['title'],
         'collection_key': best_course_info['course_data']['collection_key'],
         'collection_name': best_course_code,
         'confidence': confidence,
         'score': best_course_info['score'],
-        'matched_keywords': best_course_info['matched_keywords']
+        'matched_keywords': best_course_info['matched_keywords'],
+        'sampled_chars': sampled_chars
     }
+    
+    course_cache[cache_key] = result
+    if len(course_cache) > COURSE_CACHE_SIZE:
+        course_cache.popitem(last=False)
+    return {**result, 'matched_keywords': list(result['matched_keywords'])}
 
-def extract_file_content(file_path):
-    """Extract text content from file for better analysis."""
+def iter_file_content(file_path):
+    """Yield a document's text in reading order: PDF pages, Word paragraphs or text blocks.
+    
+    Text is extracted in-process and lazily, so a caller that stops early
+    never pays for the rest of the document.
+    """
+    extension = Path(file_path).suffix.lower()
+    
+    if extension == '.pdf':
+        try:
+            import PyPDF2
+        except ImportError:
+            PyPDF2 = None
+        if PyPDF2:
+            with open(file_path, 'rb') as f:
+                # Pages are reached one at a time, so stopping early leaves
+                # the rest of the page tree unread
+                reader = PyPDF2.PdfReader(f)
+                for page in iter_pdf_pages(reader, MAX_SAMPLE_PAGES):
+                    yield (page.extract_text() or '') + '\n'
+        else:
+            # Without PyPDF2, pdftotext one page per call
+            for page_number in range(1, MAX_SAMPLE_PAGES + 1):
+                result = run_tool(['pdftotext', '-f', str(page_number), '-l', str(page_number),
+                                   file_path, '-'], timeout=30)
+                if result.returncode != 0:
+                    break
+                yield result.stdout
+    
+    elif extension == '.docx':
+        for paragraph in iter_docx_paragraphs(file_path):
+            yield paragraph + '\n'
+    
+    elif extension == '.doc':
+        # Legacy Word files need textutil, which converts the whole document
+        result = run_tool(['textutil', '-convert', 'txt', '-stdout', file_path], timeout=30)
+        if result.returncode == 0:
+            yield result.stdout[:MAX_SAMPLE_CHARS]
+    
+    elif extension in ['.txt', '.md']:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            for block in iter(lambda: f.read(SAMPLE_STEP), ''):
+                yield block
+
+def sample_file_content(file_path):
+    """Yield a document's text in pieces of at most SAMPLE_STEP characters, up to MAX_SAMPLE_CHARS.
+    
+    Extraction errors end the sample instead of failing detection.
+    """
+    remaining = MAX_SAMPLE_CHARS
     try:
-        extension = Path(file_path).suffix.lower()
-        
-        if extension == '.pdf':
-            # Try to extract text from PDF
-            try:
-                result = os.system(f"pdftotext '{file_path}' - 2>/dev/null")
-                if result == 0:
-                    with open(file_path.replace('.pdf', '.txt'), 'r') as f:
-                        return f.read()[:1000]  # First 1000 characters
-            except:
-                pass
-        
-        elif extension in ['.doc', '.docx']:
-            # Try to extract text from Word documents
-            try:
-                result = os.system(f"textutil -convert txt -stdout '{file_path}' 2>/dev/null")
-                if result == 0:
-                    return result[:1000]  # First 1000 characters
-            except:
-                pass
-        
-        elif extension in ['.txt', '.md']:
-            # Read text files directly
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()[:1000]  # First 1000 characters
-            except:
-                pass
-        
-        return ""
-        
-    except Exception:
-        return ""
+        for text in iter_file_content(file_path):
+            for start in range(0, len(text), SAMPLE_STEP):
+                piece = text[start:start + SAMPLE_STEP][:remaining]
+                yield piece
+                remaining -= len(piece)
+                if remaining <= 0:
+                    return
+    except Exception as e:
+        print(f"⚠️ Could not read content of {os.path.basename(file_path)}: {e}")
 
 def upload_to_zotero(file_path, config, course_info):
     """Upload research file to Zotero with enhanced metadata."""
@@ -169,16 +316,6 @@ def upload_to_zotero(file_path, config, course_info):
             print("ℹ️ Zotero integration disabled")
             return None
         
-        api_key = config['zotero']['api_key']
-        library_id = config['zotero']['library_id']
-        library_type = config['zotero']['library_type']
-        
-        base_url = f"https://api.zotero.org/{library_type}s/{library_id}"
-        headers = {
-            'Zotero-API-Key': api_key,
-            'Content-Type': 'application/json'
-        }
-        
         # Prepare enhanced item data
         filename = os.path.basename(file_path)
         item_data = {
@@ -207,57 +344,18 @@ def upload_to_zotero(file_path, config, course_info):
             for keyword in course_info['matched_keywords']:
                 item_data['tags'].append(f"keyword:{keyword}")
         
-        print(f"📤 Uploading to Zotero: {filename}")
+        print(f"📤 Queuing Zotero upload: {filename}")
         print(f"🏷️ Course: {course_info['course_name']}")
         print(f"📖 Title: {course_info['course_title']}")
         print(f"🎯 Keywords matched: {', '.join(course_info['matched_keywords'])}")
         
-        # Create the item
-        item_response = requests.post(
-            f"{base_url}/items",
-            headers=headers,
-            json=item_data
-        )
-        
-        if item_response.status_code != 200:
-            print(f"❌ Failed to create Zotero item: {item_response.text}")
-            return None
-        
-        item = item_response.json()
-        item_key = item['key']
-        
-        # Upload the file attachment
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
-        
-        file_response = requests.post(
-            f"{base_url}/items/{item_key}/file",
-            headers={'Zotero-API-Key': api_key},
-            data=file_data
-        )
-        
-        if file_response.status_code != 200:
-            print(f"❌ Failed to upload file to Zotero: {file_response.text}")
-            return None
-        
-        # Add to specific collection if course was detected
-        if course_info['collection_key']:
-            collection_response = requests.post(
-                f"{base_url}/collections/{course_info['collection_key']}/items",
-                headers=headers,
-                json=[item_key]
-            )
-            
-            if collection_response.status_code == 200:
-                print(f"✅ Added to {course_info['course_name']} collection")
-            else:
-                print(f"⚠️ Could not add to collection: {collection_response.status_code}")
-        
-        print(f"✅ Successfully uploaded to Zotero: {item_key}")
-        return item_key
+        # Queue the upload; the collection is assigned once the item exists
+        job_id = enqueue_upload(config, file_path, item_data, course_info['collection_key'])
+        print(f"📥 Queued for Zotero upload: {job_id}")
+        return job_id
         
     except Exception as e:
-        print(f"⚠️ Error uploading to Zotero: {e}")
+        print(f"⚠️ Error queuing Zotero upload: {e}")
         return None
 
 def organize_file_by_course(file_path, course_info):
@@ -317,7 +415,7 @@ def generate_organized_filename(filename, course_info):
     
     return f"{base_name}{extension}"
 
-def create_research_summary(file_path, course_info, zotero_id=None):
+def create_research_summary(file_path, course_info, zotero_job_id=None):
     """Create an intelligent research summary with enhanced course context."""
     try:
         summary_dir = os.path.expanduser('~/Documents/Research/Research_Summaries')
@@ -330,7 +428,7 @@ def create_research_summary(file_path, course_info, zotero_id=None):
             'timestamp': timestamp,
             'original_file': file_path,
             'course_info': course_info,
-            'zotero_item_id': zotero_id,
+            'zotero_upload_job': zotero_job_id,
             'processing_status': 'completed',
             'intelligent_categorization': True,
             'detection_score': course_info['score'],
@@ -375,14 +473,20 @@ def main():
         # Process command line arguments
         if len(sys.argv) > 1:
             if sys.argv[1] == '--process':
-                # Process a specific file
-                file_path = sys.argv[2]
-                success = process_research_file(file_path)
-                if success:
-                    print(f"✅ Successfully processed: {file_path}")
+                # Process one or more files; the course matcher is built once
+                file_paths = sys.argv[2:]
+                results = [process_research_file(file_path) for file_path in file_paths]
+                wait_for_uploads(load_config())
+                if all(results):
+                    print(f"✅ Successfully processed: {', '.join(file_paths)}")
                 else:
-                    print(f"❌ Failed to process: {file_path}")
+                    failed = [path for path, success in zip(file_paths, results) if not success]
+                    print(f"❌ Failed to process: {', '.join(failed)}")
                     sys.exit(1)
+            elif sys.argv[1] == '--drain-spool':
+                # Send queued Zotero uploads that are due
+                sent, pending = drain_spool(load_config())
+                print(f"📤 Sent {sent} Zotero uploads, {pending} still queued")
             elif sys.argv[1] == '--help':
                 print_help()
             else:
@@ -401,6 +505,7 @@ def main():
             if choice == '1':
                 file_path = input("Enter file path: ").strip()
                 success = process_research_file(file_path)
+                wait_for_uploads(load_config())
                 if success:
                     print(f"✅ Successfully processed: {file_path}")
                 else:
@@ -421,7 +526,8 @@ def print_help():
     print("🧠 Intelligent Research Workflow Automation System")
     print("=" * 70)
     print("Usage:")
-    print("  python intelligent_research_workflow.py --process <file_path>")
+    print("  python intelligent_research_workflow.py --process <file_path> [<file_path> ...]")
+    print("  python intelligent_research_workflow.py --drain-spool")
     print("  python intelligent_research_workflow.py --help")
     print("  python intelligent_research_workflow.py (interactive mode)")
     print("\nIntelligent Features:")
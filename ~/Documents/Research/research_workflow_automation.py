@@ -8,43 +8,66 @@ for research materials that Zotero doesn't automatically capture.
 import os
 import sys
 import json
-import subprocess
-import requests
 from pathlib import Path
 from datetime import datetime
 import re
+from format_readers import CalibreMetadataWorker, match_calibre_book_ids, read_epub_metadata
+from tool_runner import run_tool
+from zotero_spool import enqueue_upload, drain_spool, wait_for_uploads
 
 def process_research_file(file_path):
     """Process a single research file through the complete workflow."""
-    try:
+    return process_research_files([file_path])
+
+def process_research_files(file_paths):
+    """Process research files through the complete workflow.
+    
+    All files are archived to Calibre with a single calibredb call, so a
+    large import pays Calibre's startup once per batch instead of per file.
+    """
+    files = []
+    success = True
+    for file_path in file_paths:
         file_path = os.path.expanduser(file_path)
         if not os.path.exists(file_path):
             print(f"❌ File not found: {file_path}")
-            return False
-        
-        print(f"🔬 Processing research file: {file_path}")
-        
+            success = False
+            continue
+        files.append(file_path)
+    
+    try:
         # Step 1: Extract metadata
-        metadata = extract_file_metadata(file_path)
-        
-        # Step 2: Upload to Zotero
-        zotero_item_id = upload_to_zotero(file_path, metadata)
-        
-        # Step 3: Archive to Calibre
-        calibre_id = archive_to_calibre(file_path, metadata)
-        
-        # Step 4: Move to organized research folder
-        organized_path = organize_research_file(file_path, metadata)
-        
-        # Step 5: Create research summary
-        create_research_summary(file_path, metadata, zotero_item_id, calibre_id)
-        
-        print(f"✅ Successfully processed: {file_path}")
-        return True
+        metadata_by_file = {}
+        for file_path in files:
+            print(f"🔬 Processing research file: {file_path}")
+            metadata_by_file[file_path] = extract_file_metadata(file_path)
         
+        # Step 2: Archive to Calibre
+        calibre_ids = archive_batch_to_calibre(files, metadata_by_file)
     except Exception as e:
-        print(f"❌ Error processing research file {file_path}: {e}")
+        print(f"❌ Error processing research files: {e}")
         return False
+    
+    for file_path in files:
+        try:
+            metadata = metadata_by_file[file_path]
+            
+            # Step 3: Move to organized research folder
+            organized_path = organize_research_file(file_path, metadata)
+            
+            # Step 4: Queue the Zotero upload (sent in the background)
+            zotero_job_id = upload_to_zotero(organized_path or file_path, metadata)
+            
+            # Step 5: Create research summary
+            create_research_summary(file_path, metadata, zotero_job_id, calibre_ids.get(file_path))
+            
+            print(f"✅ Successfully processed: {file_path}")
+            
+        except Exception as e:
+            print(f"❌ Error processing research file {file_path}: {e}")
+            success = False
+    
+    return success
 
 def extract_file_metadata(file_path):
     """Extract comprehensive metadata from research files."""
@@ -76,7 +99,7 @@ def extract_file_metadata(file_path):
 def extract_pdf_metadata(file_path):
     """Extract metadata from PDF files."""
     try:
-        result = subprocess.run(['pdfinfo', file_path], capture_output=True, text=True)
+        result = run_tool(['pdfinfo', file_path], timeout=30)
         if result.returncode == 0:
             metadata = {}
             for line in result.stdout.split('\n'):
@@ -89,14 +112,41 @@ def extract_pdf_metadata(file_path):
     
     return {'type': 'PDF', 'pages': 'Unknown'}
 
+# One warm Calibre process answers all MOBI/AZW3 files of a run
+calibre_worker = None
+
 def extract_ebook_metadata(file_path):
-    """Extract metadata from e-book files."""
+    """Extract metadata from e-book files.
+    
+    EPUBs are read straight from their OPF package document; MOBI and AZW3
+    go to a calibre-debug worker that stays running between files.
+    """
+    global calibre_worker
+    calibre_path = '/Applications/calibre.app/Contents/MacOS'
+    
+    if file_path.lower().endswith('.epub'):
+        try:
+            metadata = read_epub_metadata(file_path)
+            if metadata:
+                return metadata
+        except Exception as e:
+            print(f"⚠️ Could not read EPUB package: {e}")
+    
+    try:
+        if calibre_worker is None:
+            calibre_worker = CalibreMetadataWorker(calibre_path)
+        if calibre_worker.available():
+            metadata = calibre_worker.read(file_path)
+            if metadata:
+                return metadata
+    except Exception:
+        pass
+    
     try:
-        calibre_path = '/Applications/calibre.app/Contents/MacOS'
         ebook_meta = os.path.join(calibre_path, 'ebook-meta')
         
         if os.path.exists(ebook_meta):
-            result = subprocess.run([ebook_meta, file_path], capture_output=True, text=True)
+            result = run_tool([ebook_meta, file_path], timeout=30)
             if result.returncode == 0:
                 metadata = {}
                 for line in result.stdout.split('\n'):
@@ -112,8 +162,7 @@ def extract_ebook_metadata(file_path):
 def extract_word_metadata(file_path):
     """Extract metadata from Word documents."""
     try:
-        result = subprocess.run(['textutil', '-convert', 'txt', '-stdout', file_path], 
-                              capture_output=True, text=True)
+        result = run_tool(['textutil', '-convert', 'txt', '-stdout', file_path], timeout=30)
         if result.returncode == 0:
             text = result.stdout[:500]  # First 500 characters
             return {
@@ -127,7 +176,7 @@ def extract_word_metadata(file_path):
     return {'type': 'Word Document'}
 
 def upload_to_zotero(file_path, metadata):
-    """Upload research file to Zotero."""
+    """Queue research file for upload to Zotero; returns the spool job id."""
     try:
         # Load configuration
         config = load_config()
@@ -137,18 +186,11 @@ def upload_to_zotero(file_path, metadata):
         
         api_key = config['zotero']['api_key']
         library_id = config['zotero']['library_id']
-        library_type = config['zotero']['library_type']
         
         if api_key == 'YOUR_API_KEY' or library_id == 'YOUR_LIBRARY_ID':
             print("⚠️ Zotero API credentials not configured")
             return None
         
-        base_url = f"https://api.zotero.org/{library_type}s/{library_id}"
-        headers = {
-            'Zotero-API-Key': api_key,
-            'Content-Type': 'application/json'
-        }
-        
         # Prepare Zotero item data
         item_data = {
             'itemType': 'attachment',
@@ -164,84 +206,73 @@ def upload_to_zotero(file_path, metadata):
         if 'date' in metadata:
             item_data['dateAdded'] = metadata['date']
         
-        print(f"📤 Uploading to Zotero: {metadata.get('filename', 'Unknown')}")
-        
-        # First, create the item
-        item_response = requests.post(
-            f"{base_url}/items",
-            headers=headers,
-            json=item_data
-        )
-        
-        if item_response.status_code != 200:
-            print(f"❌ Failed to create Zotero item: {item_response.text}")
-            return None
-        
-        item = item_response.json()
-        item_key = item['key']
-        
-        # Then, upload the file attachment
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
-        
-        file_response = requests.post(
-            f"{base_url}/items/{item_key}/file",
-            headers={'Zotero-API-Key': api_key},
-            data=file_data
-        )
-        
-        if file_response.status_code != 200:
-            print(f"❌ Failed to upload file to Zotero: {file_response.text}")
-            return None
-        
-        print(f"✅ Successfully uploaded to Zotero: {item_key}")
-        return item_key
+        job_id = enqueue_upload(config, file_path, item_data)
+        print(f"📤 Queued for Zotero upload: {metadata.get('filename', 'Unknown')}")
+        return job_id
         
     except Exception as e:
-        print(f"⚠️ Error uploading to Zotero: {e}")
+        print(f"⚠️ Error queuing Zotero upload: {e}")
         return None
 
 def archive_to_calibre(file_path, metadata):
     """Archive research file to Calibre."""
+    return archive_batch_to_calibre([file_path], {file_path: metadata}).get(file_path)
+
+def archive_batch_to_calibre(file_paths, metadata_by_file):
+    """Archive research files to Calibre; returns {file: book id} for added files."""
     try:
+        if not file_paths:
+            return {}
+        
         config = load_config()
         if not config['calibre']['enabled']:
             print("ℹ️ Calibre integration disabled")
-            return None
+            return {}
         
         calibre_path = config['calibre']['path']
         calibredb = os.path.join(calibre_path, 'calibredb')
         
         if not os.path.exists(calibredb):
             print("⚠️ Calibre command-line tools not found")
-            return None
+            return {}
         
         library_path = os.path.expanduser(config['calibre']['library_path'])
+        batch_size = config['calibre'].get('batch_size', 50)
         
-        print(f"📚 Adding to Calibre: {metadata.get('filename', 'Unknown')}")
-        
-        # Add book to Calibre library
-        result = subprocess.run([
-            calibredb, 'add',
-            '--library-path', library_path,
-            file_path
-        ], capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            # Extract book ID from output
-            output_lines = result.stdout.split('\n')
-            for line in output_lines:
-                if 'Added book id:' in line:
-                    book_id = line.split(':')[1].strip()
+        book_ids = {}
+        for start in range(0, len(file_paths), batch_size):
+            batch = file_paths[start:start + batch_size]
+            for file_path in batch:
+                print(f"📚 Adding to Calibre: {metadata_by_file[file_path].get('filename', 'Unknown')}")
+            
+            # Add the whole batch with one calibredb call
+            result = run_tool([
+                calibredb, 'add',
+                '--library-path', library_path,
+                *batch
+            ], timeout=30 + 10 * len(batch))
+            
+            if result.returncode != 0:
+                print(f"⚠️ Failed to add to Calibre: {result.stderr}")
+                continue
+            
+            batch_ids = match_calibre_book_ids(batch, result.stdout)
+            if batch_ids is None:
+                print(f"⚠️ Added to Calibre, but could not match book ids: {result.stdout.strip()}")
+                continue
+            
+            for file_path, book_id in zip(batch, batch_ids):
+                if book_id is None:
+                    print(f"ℹ️ Already in Calibre: {os.path.basename(file_path)}")
+                else:
                     print(f"✅ Added to Calibre: {book_id}")
-                    return book_id
+                    book_ids[file_path] = book_id
         
-        print(f"⚠️ Failed to add to Calibre: {result.stderr}")
-        return None
+        return book_ids
         
     except Exception as e:
         print(f"⚠️ Error adding to Calibre: {e}")
-        return None
+        return {}
 
 def organize_research_file(file_path, metadata):
     """Organize research file into structured folders."""
@@ -355,7 +386,7 @@ def get_content_type(file_path):
     
     return content_types.get(extension, 'application/octet-stream')
 
-def create_research_summary(file_path, metadata, zotero_id=None, calibre_id=None):
+def create_research_summary(file_path, metadata, zotero_job_id=None, calibre_id=None):
     """Create a summary of the research file processing."""
     try:
         summary_dir = os.path.expanduser('~/Documents/Research/Research_Summaries')
@@ -368,7 +399,7 @@ def create_research_summary(file_path, metadata, zotero_id=None, calibre_id=None
             'timestamp': timestamp,
             'original_file': file_path,
             'metadata': metadata,
-            'zotero_item_id': zotero_id,
+            'zotero_upload_job': zotero_job_id,
             'calibre_id': calibre_id,
             'processing_status': 'completed'
         }
@@ -414,14 +445,19 @@ def main():
         # Process command line arguments
         if len(sys.argv) > 1:
             if sys.argv[1] == '--process':
-                # Process a specific file
-                file_path = sys.argv[2]
-                success = process_research_file(file_path)
+                # Process one or more files; Calibre gets them in one batch
+                file_paths = sys.argv[2:]
+                success = process_research_files(file_paths)
+                wait_for_uploads(load_config())
                 if success:
-                    print(f"✅ Successfully processed: {file_path}")
+                    print(f"✅ Successfully processed: {', '.join(file_paths)}")
                 else:
-                    print(f"❌ Failed to process: {file_path}")
+                    print(f"❌ Failed to process: {', '.join(file_paths)}")
                     sys.exit(1)
+            elif sys.argv[1] == '--drain-spool':
+                # Send queued Zotero uploads that are due
+                sent, pending = drain_spool(load_config())
+                print(f"📤 Sent {sent} Zotero uploads, {pending} still queued")
             elif sys.argv[1] == '--help':
                 print_help()
             else:
@@ -440,6 +476,7 @@ def main():
             if choice == '1':
                 file_path = input("Enter file path: ").strip()
                 success = process_research_file(file_path)
+                wait_for_uploads(load_config())
                 if success:
                     print(f"✅ Successfully processed: {file_path}")
                 else:
@@ -460,11 +497,12 @@ def print_help():
     print("🔬 Research Workflow Automation System")
     print("=" * 50)
     print("Usage:")
-    print("  python research_workflow_automation.py --process <file_path>")
+    print("  python research_workflow_automation.py --process <file_path> [<file_path> ...]")
+    print("  python research_workflow_automation.py --drain-spool")
     print("  python research_workflow_automation.py --help")
     print("  python research_workflow_automation.py (interactive mode)")
     print("\nFeatures:")
-    print("  • Automatic Zotero upload for research files")
+    print("  • Automatic Zotero upload for research files (queued, retried when offline)")
     print("  • Automatic Calibre archiving with metadata")
     print("  • Smart file organization and naming")
     print("  • Comprehensive metadata extraction")
@@ -5,7 +5,7 @@ Verifies that the Zotero API connection works with your credentials.
 """
 
 import json
-import requests
+from zotero_transport import get_transport
 
 def test_zotero_connection():
     """Test the Zotero API connection."""
@@ -23,16 +23,12 @@ def test_zotero_connection():
         print(f"🏷️ Library Type: {library_type}")
         
         # Test API connection
-        base_url = f"https://api.zotero.org/{library_type}s/{library_id}"
-        headers = {
-            'Zotero-API-Key': api_key,
-            'Content-Type': 'application/json'
-        }
+        transport = get_transport(config)
         
-        print(f"\n🌐 Testing connection to: {base_url}")
+        print(f"\n🌐 Testing connection to: {transport.base_url}")
         
         # Test with a simple GET request
-        response = requests.get(f"{base_url}/items", headers=headers, params={'limit': 1})
+        response = transport.get('/items', params={'limit': 1})
         
         if response.status_code == 200:
             print("✅ Zotero API connection successful!")
@@ -63,44 +59,33 @@ def test_file_upload_simulation():
         with open('config.json', 'r') as f:
             config = json.load(f)
         
-        api_key = config['zotero']['api_key']
-        library_id = config['zotero']['library_id']
-        library_type = config['zotero']['library_type']
-        
-        base_url = f"https://api.zotero.org/{library_type}s/{library_id}"
-        headers = {
-            'Zotero-API-Key': api_key,
-            'Content-Type': 'application/json'
-        }
+        # Reuses the connection opened by the connection test
+        transport = get_transport(config)
         
         # Simulate creating a test item
         test_item = {
-            'itemType': 'attachment',
+            'itemType': 'document',
             'title': 'Test Research File',
-            'filename': 'test_research.pdf',
-            'contentType': 'application/pdf',
-            'tags': ['test', 'auto_imported', 'research_workflow']
+            'tags': [{'tag': 'test'}, {'tag': 'auto_imported'}, {'tag': 'research_workflow'}]
         }
         
         print("📤 Simulating item creation...")
         
         # Test item creation (this won't actually create anything permanent)
-        response = requests.post(
-            f"{base_url}/items",
-            headers=headers,
-            json=test_item
-        )
+        # The API takes an array of items and reports results per index
+        response = transport.post('/items', json=[test_item])
+        created = response.json().get('successful', {}).get('0', {}) if response.status_code == 200 else {}
+        item_key = created.get('key')
         
-        if response.status_code == 200:
+        if item_key:
             print("✅ Item creation simulation successful!")
-            item = response.json()
-            print(f"🔑 Created test item with key: {item.get('key', 'Unknown')}")
+            print(f"🔑 Created test item with key: {item_key}")
             
             # Clean up test item
             print("🧹 Cleaning up test item...")
-            delete_response = requests.delete(
-                f"{base_url}/items/{item.get('key')}",
-                headers=headers
+            delete_response = transport.delete(
+                f"/items/{item_key}",
+                headers={'If-Unmodified-Since-Version': str(created.get('version', 0))}
             )
             
             if delete_response.status_code == 204:
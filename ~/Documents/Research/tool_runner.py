@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Tool Runner - shared governor for external tool subprocesses
+
+Every call to pdfinfo, pdftotext, textutil, ffprobe, sips, ebook-meta,
+calibredb, pdflatex, bibtex and the like goes through run(). Each tool has
+a concurrency limit, so parallel extraction cannot start more copies of a
+heavy tool than the machine can serve. A tool that overruns its timeout is
+killed together with any processes it started. Calls, failures, timeouts
+and time spent are counted per tool.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Concurrent copies allowed per tool; tools not listed get one per CPU
+DEFAULT_LIMITS = {
+    'calibredb': 1,      # the library has a single writer
+    'ebook-meta': 2,     # each copy starts a full Calibre
+    'pdflatex': 2,
+    'xelatex': 2,
+    'lualatex': 2,
+    'bibtex': 2,
+    'sips': 4,
+    'textutil': 4,
+    'ffprobe': 4,
+    'pdftotext': 4,
+    'pdfinfo': 4
+}
+
+
+def tool_name(cmd: List[str]) -> str:
+    """Name a command is counted and limited under: the executable's file name."""
+    return Path(str(cmd[0])).name
+
+
+class ToolRunner:
+    """Runs external tools under per-tool concurrency limits and keeps statistics."""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.default_limit = os.cpu_count() or 1
+        self.stats: Dict[str, Dict] = {}
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def configure(self, limits: Optional[Dict[str, int]]):
+        """Override concurrency limits, e.g. from the `tools.limits` config section."""
+        with self._lock:
+            for tool, limit in (limits or {}).items():
+                self.limits[tool] = max(1, int(limit))
+                self._semaphores.pop(tool, None)
+
+    def _semaphore(self, tool: str):
+        with self._lock:
+            if tool not in self._semaphores:
+                # A multiprocessing semaphore can be handed to worker processes,
+                # see shared_semaphores
+                self._semaphores[tool] = multiprocessing.BoundedSemaphore(
+                    self.limits.get(tool, self.default_limit))
+            return self._semaphores[tool]
+
+    def shared_semaphores(self) -> Dict:
+        """Semaphores for every configured tool, to pass to worker processes.
+
+        Workers that adopt them (see adopt_semaphores) share one limit per
+        tool with this process instead of each having their own.
+        """
+        return {tool: self._semaphore(tool) for tool in list(self.limits)}
+
+    def adopt_semaphores(self, semaphores: Dict):
+        """Use semaphores created by the parent process (see shared_semaphores)."""
+        with self._lock:
+            self._semaphores.update(semaphores)
+
+    def _record(self, tool: str, elapsed: float, waited: float, failed: bool, timed_out: bool):
+        with self._lock:
+            stats = self.stats.setdefault(tool, {'calls': 0, 'failures': 0, 'timeouts': 0,
+                                                 'total_time': 0.0, 'max_time': 0.0,
+                                                 'wait_time': 0.0})
+            stats['calls'] += 1
+            stats['failures'] += failed
+            stats['timeouts'] += timed_out
+            stats['total_time'] += elapsed
+            stats['max_time'] = max(stats['max_time'], elapsed)
+            stats['wait_time'] += waited
+
+    def run(self, cmd: List[str], timeout: Optional[float] = None, capture_output: bool = True,
+            text: bool = True, check: bool = False, cwd=None, input=None) -> subprocess.CompletedProcess:
+        """Run a tool like subprocess.run, waiting for a free slot first.
+
+        The tool runs in its own process group; on timeout the whole group is
+        killed and subprocess.TimeoutExpired is raised, as subprocess.run does.
+        A non-zero exit status counts as a failure.
+        """
+        cmd = [str(part) for part in cmd]
+        tool = tool_name(cmd)
+        semaphore = self._semaphore(tool)
+
+        queued = time.monotonic()
+        semaphore.acquire()
+        started = time.monotonic()
+        failed = timed_out = False
+        try:
+            pipe = subprocess.PIPE if capture_output else None
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE if input is not None else None,
+                                       stdout=pipe, stderr=pipe, cwd=cwd, text=text,
+                                       start_new_session=True)
+            try:
+                stdout, stderr = process.communicate(input, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                timed_out = failed = True
+                self._kill_group(process)
+                process.communicate()
+                logger.warning(f"{tool} timed out after {timeout}s and was killed")
+                raise
+            except BaseException:
+                failed = True
+                self._kill_group(process)
+                process.wait()
+                raise
+            failed = process.returncode != 0
+        except OSError:
+            failed = True
+            raise
+        finally:
+            semaphore.release()
+            self._record(tool, time.monotonic() - started, started - queued, failed, timed_out)
+
+        result = subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+        if check:
+            result.check_returncode()
+        return result
+
+    @staticmethod
+    def _kill_group(process: subprocess.Popen):
+        """Kill a tool and everything it started."""
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            process.kill()
+
+    def summary(self) -> List[str]:
+        """One line of statistics per tool used, busiest first."""
+        with self._lock:
+            items = sorted(self.stats.items(), key=lambda item: -item[1]['total_time'])
+            return [f"{tool}: {stats['calls']} calls, {stats['failures']} failed, "
+                    f"{stats['timeouts']} timed out, "
+                    f"avg {stats['total_time'] / stats['calls'] * 1000:.0f} ms, "
+                    f"max {stats['max_time'] * 1000:.0f} ms, "
+                    f"waited {stats['wait_time']:.1f} s"
+                    for tool, stats in items]
+
+    def log_summary(self):
+        """Log the per-tool statistics."""
+        for line in self.summary():
+            logger.info(f"External tool {line}")
+
+
+# Shared by everything in the process
+runner = ToolRunner()
+
+
+def run_tool(cmd: List[str], timeout: Optional[float] = None, **kwargs) -> subprocess.CompletedProcess:
+    """Run an external tool through the shared runner (see ToolRunner.run)."""
+    return runner.run(cmd, timeout=timeout, **kwargs)
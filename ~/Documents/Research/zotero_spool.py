@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""
+Zotero Upload Spool
+Queues Zotero uploads on disk so the research workflows never wait on the
+Zotero API. A background worker sends them, retrying with exponential backoff
+and honouring the Backoff and Retry-After headers. Queued uploads survive
+restarts and offline periods and are picked up by the next run.
+"""
+
+import os
+import json
+import hashlib
+import mimetypes
+import time
+import uuid
+import random
+import threading
+import requests
+from collections import deque
+from datetime import datetime
+from zotero_transport import get_transport
+
+DEFAULT_SPOOL_DIR = '~/Documents/Research/Zotero_Spool'
+
+# Retry delays in seconds
+BASE_RETRY_DELAY = 30
+MAX_RETRY_DELAY = 3600
+# Uploads the API rejects are given up on after this many attempts
+MAX_ATTEMPTS = 8
+# A claimed job untouched for this long belongs to a run that died
+STALE_CLAIM_AGE = 3600
+# How often the worker looks for retries that have become due
+POLL_INTERVAL = 5
+# Files are hashed and uploaded in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+_worker = None
+_worker_lock = threading.Lock()
+_stop_event = threading.Event()
+_wake_event = threading.Event()
+_active_jobs = 0
+# Set when the server asks us to slow down; no requests are sent before it
+_paused_until = 0.0
+# Seconds from queuing to finished upload, for recent uploads
+upload_latencies = deque(maxlen=10000)
+
+
+class UploadError(Exception):
+    """A failed Zotero request; rejected uploads count towards MAX_ATTEMPTS."""
+
+    def __init__(self, message, delay=None, rejected=False):
+        super().__init__(message)
+        self.delay = delay
+        self.rejected = rejected
+
+
+def get_spool_dir(config):
+    """Return the spool directory, creating it if needed."""
+    spool_dir = os.path.expanduser(config.get('zotero', {}).get('spool_dir', DEFAULT_SPOOL_DIR))
+    os.makedirs(spool_dir, exist_ok=True)
+    return spool_dir
+
+
+def enqueue_upload(config, file_path, item_data, collection_key=None):
+    """Queue a file for upload to Zotero and return the job id."""
+    job_id = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+    job = {
+        'id': job_id,
+        'file_path': os.path.abspath(file_path),
+        'item_data': item_data,
+        'collection_key': collection_key,
+        'item_key': None,
+        'attachment_key': None,
+        'file_uploaded': False,
+        'attempts': 0,
+        'next_attempt_at': time.time(),
+        'last_error': None,
+        'queued_at': datetime.now().isoformat()
+    }
+    write_job(os.path.join(get_spool_dir(config), f"{job_id}.json"), job)
+    start_worker(config)
+    _wake_event.set()
+    return job_id
+
+
+def write_job(job_path, job):
+    """Write a job file atomically."""
+    temp_path = f"{job_path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(job, f, indent=2)
+    os.replace(temp_path, job_path)
+
+
+def pending_jobs(config, due_only=False):
+    """Return the paths of queued jobs, oldest first."""
+    spool_dir = get_spool_dir(config)
+    now = time.time()
+    paths = []
+    for name in sorted(os.listdir(spool_dir)):
+        if not name.endswith('.json'):
+            continue
+        job_path = os.path.join(spool_dir, name)
+        if due_only:
+            try:
+                with open(job_path, 'r') as f:
+                    if json.load(f)['next_attempt_at'] > now:
+                        continue
+            except (OSError, ValueError, KeyError):
+                continue
+        paths.append(job_path)
+    return paths
+
+
+def next_attempt_time(config):
+    """Return when the next queued upload may be sent, or None if the spool is empty."""
+    times = []
+    for job_path in pending_jobs(config):
+        try:
+            with open(job_path, 'r') as f:
+                times.append(json.load(f)['next_attempt_at'])
+        except (OSError, ValueError, KeyError):
+            continue
+    if not times:
+        return None
+    return max(min(times), _paused_until)
+
+
+def recover_stale_claims(config):
+    """Return jobs claimed by runs that died mid-upload to the queue."""
+    spool_dir = get_spool_dir(config)
+    for name in os.listdir(spool_dir):
+        if not name.endswith('.inflight'):
+            continue
+        claim_path = os.path.join(spool_dir, name)
+        try:
+            if time.time() - os.path.getmtime(claim_path) > STALE_CLAIM_AGE:
+                os.rename(claim_path, claim_path[:-len('.inflight')])
+        except OSError:
+            pass
+
+
+def drain_spool(config):
+    """Send every due upload once; returns (sent, still queued)."""
+    global _active_jobs
+
+    recover_stale_claims(config)
+    sent = 0
+    for job_path in pending_jobs(config, due_only=True):
+        if _stop_event.is_set() or time.time() < _paused_until:
+            break
+
+        # Claim the job so another workflow run does not send it too
+        claim_path = f"{job_path}.inflight"
+        try:
+            os.rename(job_path, claim_path)
+        except OSError:
+            continue
+
+        with _worker_lock:
+            _active_jobs += 1
+        try:
+            if process_job(config, claim_path, job_path):
+                sent += 1
+        finally:
+            with _worker_lock:
+                _active_jobs -= 1
+
+    return sent, len(pending_jobs(config))
+
+
+def process_job(config, claim_path, job_path):
+    """Run the remaining steps of a claimed job; returns True once it is done."""
+    global _paused_until
+
+    try:
+        with open(claim_path, 'r') as f:
+            job = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Dropping unreadable Zotero upload job {claim_path}: {e}")
+        os.remove(claim_path)
+        return False
+
+    if not os.path.exists(job['file_path']):
+        print(f"⚠️ Dropping Zotero upload, file no longer exists: {job['file_path']}")
+        os.remove(claim_path)
+        return False
+
+    try:
+        # Progress is also written to the claim, so even a run that dies
+        # mid-job leaves the created keys for recover_stale_claims
+        send_job(config, job, save=lambda: write_job(claim_path, job))
+    except Exception as e:
+        # Keys created before the failure are saved with the job below, so a
+        # retry does not create the items again
+        job['attempts'] += 1
+        job['last_error'] = f"{type(e).__name__}: {e}"
+        # Connection problems are retried until they clear; anything else,
+        # such as an unexpected reply, counts towards MAX_ATTEMPTS
+        transient = isinstance(e, (requests.RequestException, OSError)) or \
+            (isinstance(e, UploadError) and not e.rejected)
+        if not transient and job['attempts'] >= MAX_ATTEMPTS:
+            print(f"❌ Giving up on Zotero upload of {job['file_path']}: {e}")
+            os.remove(claim_path)
+            return False
+
+        delay = getattr(e, 'delay', None)
+        if delay is not None:
+            _paused_until = max(_paused_until, time.time() + delay)
+        else:
+            delay = min(BASE_RETRY_DELAY * 2 ** (job['attempts'] - 1), MAX_RETRY_DELAY)
+            delay *= random.uniform(1, 1.25)
+        job['next_attempt_at'] = time.time() + delay
+        write_job(job_path, job)
+        os.remove(claim_path)
+        print(f"⏳ Zotero upload of {os.path.basename(job['file_path'])} will be retried "
+              f"in {delay:.0f}s: {e}")
+        return False
+
+    os.remove(claim_path)
+    upload_latencies.append(time.time() - datetime.fromisoformat(job['queued_at']).timestamp())
+    print(f"✅ Successfully uploaded to Zotero: {job['item_key']}")
+    return True
+
+
+def send_job(config, job, save=None):
+    """Create the item and its attachment, upload the file and file it in its collection.
+
+    Progress is recorded on the job so a retry resumes at the failed step;
+    save, if given, is called after each created item.
+    All requests share one pooled connection (see zotero_transport).
+    """
+    transport = get_transport(config)
+
+    if not job['item_key']:
+        # First, create the item
+        job['item_key'] = create_item(transport, parent_item_data(job['item_data']),
+                                      'create Zotero item')
+        if save:
+            save()
+
+    if not job.get('attachment_key'):
+        # Zotero only stores files on attachment items, so add one under the item
+        job['attachment_key'] = create_item(
+            transport, attachment_item_data(job), 'create Zotero attachment item'
+        )
+        if save:
+            save()
+
+    if not job['file_uploaded']:
+        # Then, upload the file to the attachment
+        upload_file(transport, job)
+        job['file_uploaded'] = True
+
+    # Add to specific collection if course was detected
+    if job['collection_key']:
+        collection_response = transport.post(
+            f"/collections/{job['collection_key']}/items",
+            json=[job['item_key']]
+        )
+        check_response(collection_response, 'add Zotero item to collection')
+        job['collection_key'] = None
+
+
+def create_item(transport, item_data, action):
+    """Create one item and return its key.
+
+    The API takes an array of items and answers with per-index
+    successful/success/unchanged/failed maps, not with the item itself.
+    """
+    response = transport.post('/items', json=[item_data])
+    check_response(response, action)
+    result = response.json()
+
+    failure = (result.get('failed') or {}).get('0')
+    if failure:
+        code = failure.get('code', 400)
+        raise UploadError(f"Failed to {action}: {code} {failure.get('message', '')}",
+                          rejected=code != 429 and code < 500)
+
+    item_key = (result.get('success') or {}).get('0')
+    if not item_key:
+        raise UploadError(f"Failed to {action}: no item key in response", rejected=True)
+    return item_key
+
+
+def parent_item_data(item_data):
+    """The Zotero item for the metadata a workflow script queued.
+
+    The scripts describe the file itself (itemType attachment, filename,
+    contentType) and use plain tag strings; the file details belong on the
+    child attachment, and the item gets the fields and tag objects the API
+    expects.
+    """
+    data = {key: value for key, value in item_data.items()
+            if key not in ('filename', 'contentType', 'creator', 'dateAdded')}
+    if data.get('itemType', 'attachment') == 'attachment':
+        data['itemType'] = 'document'
+    data['tags'] = [tag if isinstance(tag, dict) else {'tag': str(tag)}
+                    for tag in item_data.get('tags', [])]
+    if item_data.get('creator'):
+        data['creators'] = [{'creatorType': 'author', 'name': str(item_data['creator'])}]
+    if item_data.get('dateAdded'):
+        data['date'] = str(item_data['dateAdded'])
+    return data
+
+
+def attachment_item_data(job):
+    """Child attachment item that holds the uploaded file."""
+    filename = os.path.basename(job['file_path'])
+    content_type = (job['item_data'].get('contentType') or mimetypes.guess_type(filename)[0]
+                    or 'application/octet-stream')
+    return {
+        'itemType': 'attachment',
+        'parentItem': job['item_key'],
+        'linkMode': 'imported_file',
+        'title': filename,
+        'filename': filename,
+        'contentType': content_type,
+        'charset': '',
+        'tags': []
+    }
+
+
+def upload_file(transport, job):
+    """Upload the attachment using Zotero's authorize, upload and register steps.
+
+    The file is streamed from disk, so memory use does not depend on its size.
+    Its MD5 is computed once and kept on the job for retries.
+    """
+    file_path = job['file_path']
+    stat = os.stat(file_path)
+    if (not job.get('md5') or job.get('filesize') != stat.st_size
+            or job.get('mtime') != int(stat.st_mtime * 1000)):
+        job['md5'], job['filesize'], job['mtime'] = file_fingerprint(file_path)
+
+    # Step 1: ask for an upload authorization
+    item_path = f"/items/{job['attachment_key']}/file"
+    auth_response = transport.post(
+        item_path,
+        data={
+            'md5': job['md5'],
+            'filename': os.path.basename(file_path),
+            'filesize': job['filesize'],
+            'mtime': job['mtime']
+        },
+        headers={'If-None-Match': '*'}
+    )
+    check_response(auth_response, 'authorize Zotero file upload')
+    authorization = auth_response.json()
+    if authorization.get('exists'):
+        # Zotero already stores this exact file
+        return
+
+    # Step 2: stream the file to the storage URL
+    body = UploadBody(authorization['prefix'].encode(), file_path, job['filesize'],
+                      authorization['suffix'].encode())
+    upload_response = transport.upload(authorization['url'], body, authorization['contentType'])
+    check_response(upload_response, 'upload file to Zotero storage')
+    if body.md5 != job['md5']:
+        job['md5'] = None
+        raise UploadError(f"{os.path.basename(file_path)} changed during the upload")
+
+    # Step 3: register the upload with the attachment item
+    register_response = transport.post(
+        item_path,
+        data={'upload': authorization['uploadKey']},
+        headers={'If-None-Match': '*'}
+    )
+    check_response(register_response, 'register Zotero file upload')
+
+
+def file_fingerprint(file_path):
+    """Return the MD5, size and mtime (ms) Zotero needs to authorize an upload."""
+    digest = hashlib.md5()
+    size = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size, int(os.path.getmtime(file_path) * 1000)
+
+
+class UploadBody:
+    """Upload body of prefix + file + suffix, read from disk chunk by chunk.
+
+    The file's MD5 is computed while it is sent, which shows whether the
+    file changed since it was fingerprinted without reading it again.
+    """
+
+    def __init__(self, prefix, file_path, size, suffix):
+        self.prefix = prefix
+        self.file_path = file_path
+        self.size = size
+        self.suffix = suffix
+        self.md5 = None
+
+    def __len__(self):
+        # Lets requests send a Content-Length instead of a chunked body
+        return len(self.prefix) + self.size + len(self.suffix)
+
+    def __iter__(self):
+        yield self.prefix
+
+        digest = hashlib.md5()
+        remaining = self.size
+        with open(self.file_path, 'rb') as f:
+            while remaining > 0:
+                chunk = f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+                yield chunk
+        self.md5 = digest.hexdigest() if remaining == 0 else None
+
+        yield self.suffix
+
+
+def check_response(response, action):
+    """Raise an UploadError for a failed request, with any delay the server asked for."""
+    if 200 <= response.status_code < 300:
+        return
+
+    delay = None
+    for header in ('Retry-After', 'Backoff'):
+        try:
+            delay = float(response.headers[header])
+            break
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    # Rate limiting and server errors are temporary, anything else is a rejection
+    rejected = response.status_code != 429 and response.status_code < 500
+    raise UploadError(f"Failed to {action}: {response.status_code} {response.text}",
+                      delay=delay, rejected=rejected)
+
+
+def start_worker(config):
+    """Start the background upload worker for this run."""
+    global _worker
+
+    with _worker_lock:
+        if _worker is not None:
+            return
+        _stop_event.clear()
+        _worker = threading.Thread(target=_run_worker, args=(config,),
+                                   name='zotero-upload', daemon=True)
+        _worker.start()
+
+
+def _run_worker(config):
+    while not _stop_event.is_set():
+        try:
+            drain_spool(config)
+            next_attempt = next_attempt_time(config)
+        except Exception as e:
+            print(f"⚠️ Zotero upload worker error: {e}")
+            next_attempt = None
+
+        # Sleep until the next retry is due or a new upload is queued
+        timeout = POLL_INTERVAL
+        if next_attempt is not None:
+            timeout = min(POLL_INTERVAL, max(0, next_attempt - time.time()))
+        _wake_event.wait(timeout)
+        _wake_event.clear()
+
+
+def wait_for_uploads(config, timeout=None):
+    """Give queued uploads a bounded time to go out, then stop the worker."""
+    global _worker
+
+    if _worker is None:
+        return
+
+    if timeout is None:
+        timeout = config.get('zotero', {}).get('drain_timeout', 30)
+    # Keep waiting while some upload is being sent or will be retried in time
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        next_attempt = next_attempt_time(config)
+        if not _active_jobs and (next_attempt is None or
+                                 next_attempt - time.time() > deadline - time.monotonic()):
+            break
+        time.sleep(0.5)
+
+    _stop_event.set()
+    _wake_event.set()
+    _worker.join(timeout=max(0, deadline - time.monotonic()) + 5)
+    _worker = None
+
+    print(f"🌐 {get_transport(config).timing_summary()}")
+    remaining = len(pending_jobs(config))
+    if remaining:
+        print(f"📥 {remaining} Zotero uploads left in the spool for the next run")
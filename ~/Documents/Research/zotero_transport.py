@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Zotero Transport
+Shared HTTP session for all Zotero API calls. Connections are pooled and kept
+alive, so creating an item, uploading its file and adding it to a collection
+reuse one TCP+TLS connection instead of opening three.
+"""
+
+import time
+import threading
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_API_BASE = 'https://api.zotero.org'
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+class ZoteroTransport:
+    """Pooled keep-alive session bound to one Zotero library."""
+
+    def __init__(self, config):
+        zotero_config = config['zotero']
+        api_base = zotero_config.get('api_base', DEFAULT_API_BASE).rstrip('/')
+        self.base_url = f"{api_base}/{zotero_config['library_type']}s/{zotero_config['library_id']}"
+        self.timeout = zotero_config.get('timeout', 60)
+        self.log_timings = zotero_config.get('log_timings', False)
+
+        pool_size = zotero_config.get('pool_size', 4)
+        # One pool for the API and one for the file storage host
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Zotero-API-Key': zotero_config['api_key'],
+            'Connection': 'keep-alive'
+        })
+
+        # (method, path, status, seconds) of recent requests
+        self.timings = deque(maxlen=1000)
+
+    def request(self, method, path, **kwargs):
+        """Send a request to a path below the library URL."""
+        return self._send(method, f"{self.base_url}{path}", path, **kwargs)
+
+    def upload(self, url, body, content_type):
+        """Send a file body to a storage URL given by the API, without the API key."""
+        headers = {'Content-Type': content_type, 'Zotero-API-Key': None}
+        return self._send('POST', url, 'storage upload', data=body, headers=headers)
+
+    def _send(self, method, url, label, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        response = self.session.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - started
+
+        self.timings.append((method, label, response.status_code, elapsed))
+        if self.log_timings:
+            print(f"🌐 {method} {label}: {response.status_code} in {elapsed * 1000:.0f} ms")
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def timing_summary(self):
+        """Describe the recorded requests, e.g. for the end of a run."""
+        if not self.timings:
+            return "no Zotero requests"
+        durations = sorted(elapsed for _, _, _, elapsed in self.timings)
+        average = sum(durations) / len(durations)
+        return (f"{len(durations)} Zotero requests, avg {average * 1000:.0f} ms, "
+                f"max {durations[-1] * 1000:.0f} ms")
+
+    def close(self):
+        self.session.close()
+
+
+def get_transport(config):
+    """Return the shared transport for the configured library."""
+    zotero_config = config['zotero']
+    key = (zotero_config.get('api_base', DEFAULT_API_BASE), zotero_config['library_type'],
+           zotero_config['library_id'], zotero_config['api_key'])
+    with _transports_lock:
+        if key not in _transports:
+            _transports[key] = ZoteroTransport(config)
+        return _transports[key]